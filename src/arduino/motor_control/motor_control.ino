@@ -70,11 +70,11 @@ MotorController right_motor_controller(
 );
 
 // Locomotion
+const unsigned long TICKS_PER_METER = 6200;
 DifferentialDriveWithImu locomotion(
   &left_motor_controller,
   &right_motor_controller,
-  // Ticks per meter
-  6200,
+  TICKS_PER_METER,
   // Track width [m]
   0.22,
   &imu
@@ -87,6 +87,17 @@ const uint8_t read_buffer_len = serial_buffer_size - SerialPackets::kPacketHeade
 uint8_t read_buffer[read_buffer_len];
 SerialPackets serial_packets;
 
+// Telemetry, pushed to the host without a request once it sets a period
+const byte UNSOLICITED_ID = 0x00;
+const byte MESSAGE_TELEMETRY = 0x01;
+Async::FuncId telemetry_func_id;
+
+// Stop if nothing is heard from the host for this long; any packet, including
+// a heartbeat, counts
+const unsigned long HOST_TIMEOUT = 2000;
+unsigned long last_host_packet_time = 0;
+bool host_lost = false;
+
 
 void setup() {
   Serial.begin(115200);
@@ -96,6 +107,8 @@ void setup() {
   setup_battery_monitor();
   setup_imu();
   setup_motors();
+  setup_telemetry();
+  setup_host_watchdog();
 }
 
 
@@ -172,7 +185,7 @@ void print_locomotion() {
   Serial.println("lin_vel_target,lin_vel_actual,ang_vel_target,ang_vel_actual");
   Serial.print(locomotion.GetTargetLinearVelocity());
   Serial.print(',');
-  Serial.print((left_motor_controller.GetActualVelocity() + right_motor_controller.GetActualVelocity()) / 2.0 / 6200.);
+  Serial.print((left_motor_controller.GetActualVelocity() + right_motor_controller.GetActualVelocity()) / 2.0 / TICKS_PER_METER);
   Serial.print(',');
   Serial.print(locomotion.GetTargetAngularVelocity());
   Serial.print(',');
@@ -240,6 +253,85 @@ void setup_motors() {
 }
 
 
+void setup_host_watchdog() {
+  Async::FuncId id = async.RunForever(100, check_host_alive);
+  async.GetFunc(id)->name = "host";
+}
+
+
+void check_host_alive() {
+  if (!host_lost && millis() - last_host_packet_time > HOST_TIMEOUT) {
+    host_lost = true;
+    locomotion.Stop();
+  }
+}
+
+
+void setup_telemetry() {
+  // Disabled until the host asks for it
+  telemetry_func_id = async.RunForever(100, send_telemetry);
+  async.GetFunc(telemetry_func_id)->name = "telem";
+  async.GetFunc(telemetry_func_id)->SetEnabled(false);
+}
+
+
+void set_telemetry_period(unsigned short period_ms) {
+  Async::AsyncFunc *func = async.GetFunc(telemetry_func_id);
+  if (period_ms > 0) {
+    func->period = period_ms;
+  }
+  func->SetEnabled(period_ms > 0);
+}
+
+
+byte *pack_u32(byte *out, unsigned long value) {
+  out[0] = value >> 24;
+  out[1] = value >> 16;
+  out[2] = value >> 8;
+  out[3] = value;
+  return out + 4;
+}
+
+
+byte *pack_i16(byte *out, float value) {
+  short clamped = (short)constrain(value, -32768.f, 32767.f);
+  out[0] = (unsigned short)clamped >> 8;
+  out[1] = (unsigned short)clamped;
+  return out + 2;
+}
+
+
+/*
+ * Telemetry packet (big-endian):
+ *   [UNSOLICITED_ID, MESSAGE_TELEMETRY, millis (u32),
+ *    left motor velocity (ticks/s, i16), right motor velocity (ticks/s, i16),
+ *    body linear velocity (mm/s, i16), body angular velocity (mrad/s, i16),
+ *    roll, pitch, yaw (centirad, i16 each), battery level (percent, u8)]
+ */
+void send_telemetry() {
+  byte packet[22];
+  byte *out = packet;
+
+  *out++ = UNSOLICITED_ID;
+  *out++ = MESSAGE_TELEMETRY;
+  out = pack_u32(out, millis());
+
+  float left = left_motor_controller.GetActualVelocity();
+  float right = right_motor_controller.GetActualVelocity();
+  out = pack_i16(out, left);
+  out = pack_i16(out, right);
+  out = pack_i16(out, (left + right) / 2.0f / TICKS_PER_METER * 1000);
+  out = pack_i16(out, imu.sample.gyro.z.radps * 1000);
+
+  out = pack_i16(out, imu.sample.orient.roll * 100);
+  out = pack_i16(out, imu.sample.orient.pitch * 100);
+  out = pack_i16(out, imu.sample.orient.yaw * 100);
+  *out++ = battery_monitor.GetLevel();
+
+  serial_packets.Write(packet, out - packet);
+}
+
+
 void handle_left_motor_enc_a_change() { left_motor_encoder.HandleEncAChange(); }
 
 void handle_left_motor_enc_b_change() { left_motor_encoder.HandleEncBChange(); }
@@ -249,6 +341,10 @@ void handle_right_motor_enc_a_change() { right_motor_encoder.HandleEncAChange();
 void handle_right_motor_enc_b_change() { right_motor_encoder.HandleEncBChange(); }
 
 
+// Each request is [request ID, command, args...], and each response is
+// [request ID, ACK/NCK, data...]: the ID is echoed so the host can have several
+// requests in flight and match responses to them. ID 0 is reserved for packets
+// sent without a request.
 void handle_commands() {
   static const byte COMMAND_HEARTBEAT = 0x00;
   static const byte COMMAND_GET_STATUS = 0x01;
@@ -256,40 +352,58 @@ void handle_commands() {
   static const byte COMMAND_SET_ANGULAR_VELOCITY = 0x03;
   static const byte COMMAND_SET_TARGET_HEADING = 0x04;
   static const byte COMMAND_STOP = 0x05;
+  static const byte COMMAND_SET_BODY_VELOCITY = 0x06;
+  static const byte COMMAND_SET_TELEMETRY_PERIOD = 0x07;
   static const byte ACK = 0x00;
   static const byte NCK = 0x01;
 
   int packet_len = serial_packets.ReadNonblocking(read_buffer, read_buffer_len);
-  if (packet_len < 1) {
+  if (packet_len < 2) {
     return;
   }
 
-  byte response[2] = {ACK};
-  int response_len = 1;
+  last_host_packet_time = millis();
+  host_lost = false;
+
+  byte request_id = read_buffer[0];
+  byte command = read_buffer[1];
+  const uint8_t *args = read_buffer + 2;
+
+  byte response[3] = {request_id, ACK};
+  int response_len = 2;
 
-  byte command = read_buffer[0];
   if (command == COMMAND_HEARTBEAT) {
-    // TODO
+    // Only keeps the host watchdog from stopping the motors
   } else if (command == COMMAND_GET_STATUS) {
     // TODO
-    response[1] = battery_monitor.GetLevel();
-    response_len = 2;
+    response[2] = battery_monitor.GetLevel();
+    response_len = 3;
   } else if (command == COMMAND_SET_LINEAR_VELOCITY) {
-    short linear_cm = ((short)read_buffer[1] << 8) | (short)read_buffer[2];
+    short linear_cm = ((short)args[0] << 8) | (short)args[1];
     float linear = linear_cm / 100.f;
     locomotion.SetTargetLinearVelocity(linear);
   } else if (command == COMMAND_SET_ANGULAR_VELOCITY) {
-    short angular_centirad = ((short)read_buffer[1] << 8) | (short)read_buffer[2];
+    short angular_centirad = ((short)args[0] << 8) | (short)args[1];
     float angular = angular_centirad / 100.f;
     locomotion.SetTargetAngularVelocity(angular);
   } else if (command == COMMAND_SET_TARGET_HEADING) {
-    short heading_centirad = ((short)read_buffer[1] << 8) | (short)read_buffer[2];
+    short heading_centirad = ((short)args[0] << 8) | (short)args[1];
     float heading = heading_centirad / 100.f;
     locomotion.SetTargetHeading(heading);
+  } else if (command == COMMAND_SET_BODY_VELOCITY) {
+    // Both are set before the next locomotion update, so it never sees only one changed
+    short linear_cm = ((short)args[0] << 8) | (short)args[1];
+    short angular_centirad = ((short)args[2] << 8) | (short)args[3];
+    locomotion.SetTargetLinearVelocity(linear_cm / 100.f);
+    locomotion.SetTargetAngularVelocity(angular_centirad / 100.f);
+  } else if (command == COMMAND_SET_TELEMETRY_PERIOD) {
+    // 0 stops telemetry
+    unsigned short period_ms = ((unsigned short)args[0] << 8) | (unsigned short)args[1];
+    set_telemetry_period(period_ms);
   } else if (command == COMMAND_STOP) {
     locomotion.Stop();
   } else {
-    response[0] = NCK;
+    response[1] = NCK;
   }
 
   serial_packets.Write(response, response_len);
@@ -0,0 +1,187 @@
+"""
+Measures how long a drive event (new linear and angular velocity) takes to be
+acknowledged by the motor controller, sent as:
+
+- ``sequential``: set_linear_velocity, wait for its ACK, then set_angular_velocity
+- ``pipelined``: both commands sent without waiting in between
+- ``body``: one set_body_velocity command
+
+Also reports how long the firmware runs with the new linear velocity but the
+old angular velocity, and the throughput of pipelined set_body_velocity commands.
+
+``--link model`` runs against an in-process model of the serial link, which
+charges each packet its wire time at the given baud rate. ``--link pty`` runs
+the real client, from ``SerialPackets`` framing up, against
+``sentrybot.simulator`` over a pseudo-terminal.
+
+Usage: PYTHONPATH=.. python bench_drive.py [--link model|pty] [--baudrate 115200] [--loop-period 0.002]
+                                           [--jitter 0.] [--drop-rate 0.] [--events 200]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from queue import Empty, Queue
+from threading import Lock, Thread
+
+from sentrybot.motorcontrol import DriveMotorController, Request, Response
+from sentrybot.serialtransport import SerialTransport
+from sentrybot.simulator import MotorControllerSimulator
+
+
+class SimulatedLink:
+    """
+    A packet connection to a simulated firmware that ACKs every request,
+    echoing its request ID. Packets take ``(len + framing_bytes) * 10 / baudrate``
+    seconds on the wire in each direction.
+    """
+
+    def __init__(self, baudrate: int, loop_period: float, framing_bytes: int = 3):
+        self.baudrate = baudrate
+        self.loop_period = loop_period
+        self.framing_bytes = framing_bytes
+
+        self.linear_set_at = None
+        self.angular_set_at = None
+
+        self._to_firmware = Queue()
+        self._to_host = Queue()
+        self._tx_free_at = 0.
+        self._tx_lock = Lock()
+
+        Thread(target=self._firmware, daemon=True).start()
+
+    def _wire_time(self, data: bytes) -> float:
+        return (len(data) + self.framing_bytes) * 10 / self.baudrate
+
+    def write(self, data: bytes) -> None:
+        # Packets queue up behind each other on the wire
+        with self._tx_lock:
+            self._tx_free_at = max(self._tx_free_at, time.monotonic()) + self._wire_time(data)
+            self._to_firmware.put((self._tx_free_at, data))
+
+    def read(self) -> bytes:
+        try:
+            arrives_at, data = self._to_host.get(timeout=0.1)
+        except Empty:
+            return b''
+
+        _sleep_until(arrives_at)
+        return data
+
+    def _firmware(self) -> None:
+        rx_free_at = 0.
+        while True:
+            arrives_at, data = self._to_firmware.get()
+            _sleep_until(arrives_at)
+
+            # The packet is picked up on the next pass through the firmware's loop
+            time.sleep(self.loop_period)
+
+            request_id, command = data[0], data[1:2]
+            now = time.monotonic()
+            if command == b'\x02':
+                self.linear_set_at = now
+            elif command == b'\x03':
+                self.angular_set_at = now
+            elif command == b'\x06':
+                self.linear_set_at = self.angular_set_at = now
+
+            response = bytes((request_id,)) + Response.ACK
+            rx_free_at = max(rx_free_at, time.monotonic()) + self._wire_time(response)
+            self._to_host.put((rx_free_at, response))
+
+
+def _sleep_until(t: float) -> None:
+    delay = t - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def drive(motors: DriveMotorController, mode: str, linear: float, angular: float) -> None:
+    if mode == 'sequential':
+        motors.set_linear_velocity(linear).result()
+        motors.set_angular_velocity(rad=angular).result()
+    elif mode == 'pipelined':
+        requests = [motors.set_linear_velocity(linear), motors.set_angular_velocity(rad=angular)]
+        for request in requests:
+            request.result()
+    else:
+        motors.set_body_velocity(linear, rad=angular).result()
+
+
+def connect(args):
+    """Returns ``(motors, link, close)``; ``link`` records when the firmware applied each velocity."""
+
+    if args.link == 'model':
+        link = SimulatedLink(args.baudrate, args.loop_period)
+        motors = DriveMotorController(SerialTransport(link).start())
+        return motors, link, motors.transport.close
+
+    simulator = MotorControllerSimulator(args.baudrate, args.jitter, args.drop_rate, args.loop_period).start()
+    motors = DriveMotorController.connect(simulator.port)
+
+    def close():
+        motors.transport.close()
+        simulator.close()
+
+    return motors, None, close
+
+
+def throughput(motors: DriveMotorController, count: int) -> float:
+    """Commands acknowledged per second, with as many in flight as the transport allows."""
+
+    t0 = time.perf_counter()
+    requests = [motors.set_body_velocity(0.1, rad=0.) for _ in range(count)]
+    for request in requests:
+        request.result()
+
+    return count / (time.perf_counter() - t0)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--link', choices=('model', 'pty'), default='model')
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--loop-period', type=float, default=0.002, help='Seconds per firmware loop')
+    parser.add_argument('--jitter', type=float, default=0., help='Seconds; pty link only')
+    parser.add_argument('--drop-rate', type=float, default=0., help='Probability of losing each byte; pty link only')
+    parser.add_argument('--events', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f'link={args.link} baudrate={args.baudrate} loop_period={args.loop_period * 1e3:.1f}ms '
+          f'body_velocity_packet={len(Request.set_body_velocity(0, 0)) + 1}B')
+
+    for mode in ('sequential', 'pipelined', 'body'):
+        motors, link, close = connect(args)
+
+        latencies, split, failed = [], [], 0
+        for i in range(args.events):
+            t0 = time.perf_counter()
+            try:
+                drive(motors, mode, 0.01 * (i % 20), 0.1 * (i % 7))
+            except Exception:
+                failed += 1
+                continue
+
+            latencies.append(time.perf_counter() - t0)
+            if link is not None:
+                split.append(link.angular_set_at - link.linear_set_at)
+
+        latencies.sort()
+        split = f'{statistics.median(split) * 1e3:.2f}ms' if split else '-'
+        print(f'{mode:>10}: ack p50={statistics.median(latencies) * 1e3:.2f}ms '
+              f'p95={latencies[int(0.95 * len(latencies))] * 1e3:.2f}ms '
+              f'linear/angular split p50={split} failed={failed}')
+
+        if mode == 'body':
+            print(f'{"":>10}  pipelined throughput={throughput(motors, args.events):.0f} commands/s')
+
+        close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Measures the throughput of the scalar and batch geometry functions: wrapping
+angles, and dead reckoning a telemetry log (``--hours`` of records at
+``--rate``) one sample at a time with :class:`PoseIntegrator` and all at once
+with :func:`integrate_body_velocities`.
+
+Usage: PYTHONPATH=.. python bench_geometry.py [--hours 1] [--rate 50]
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from sentrybot.geometry import PoseIntegrator, integrate_body_velocities, trunc_angle, trunc_angles
+
+
+def rate(f, count: int) -> float:
+    """Items per second ``f()`` processes, given it processes ``count``; best of 3."""
+
+    best = float('inf')
+    for _ in range(3):
+        t0 = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t0)
+
+    return count / best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=float, default=1.)
+    parser.add_argument('--rate', type=float, default=50., help='Records per second')
+    args = parser.parse_args()
+
+    count = int(args.hours * 3600 * args.rate)
+    rng = np.random.default_rng(0)
+    t = np.arange(count) / args.rate
+    linear = rng.uniform(-0.5, 0.5, count)
+    angular = rng.uniform(-2, 2, count)
+    angles = rng.uniform(-100, 100, count)
+
+    print(f'{count} samples')
+    print(f'       trunc_angle: {rate(lambda: [trunc_angle(a) for a in angles.tolist()], count) / 1e6:8.2f}M/s')
+    print(f'      trunc_angles: {rate(lambda: trunc_angles(angles), count) / 1e6:8.2f}M/s')
+
+    def incremental():
+        integrator = PoseIntegrator()
+        for sample in zip(t.tolist(), linear.tolist(), angular.tolist()):
+            integrator.add_body_velocity(*sample)
+
+    incremental_rate = rate(incremental, count)
+    batch_rate = rate(lambda: integrate_body_velocities(t, linear, angular), count)
+    print(f'    PoseIntegrator: {incremental_rate / 1e6:8.2f}M/s ({count / incremental_rate:.2f}s for the log)')
+    print(f'             batch: {batch_rate / 1e6:8.2f}M/s ({count / batch_rate * 1e3:.1f}ms for the log)')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
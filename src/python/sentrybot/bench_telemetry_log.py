@@ -0,0 +1,102 @@
+"""
+Measures what recording telemetry costs: the time to append one record, and
+the drive command acknowledgement latency with and without a
+:class:`TelemetryRecorder` sampling the controller at ``--rate``.
+
+Commands go to the in-process model of the serial link from ``bench_drive``,
+with a fixed status standing in for pushed telemetry, so the recorder does all
+its usual work. Log files are written to a temporary directory.
+
+Usage: PYTHONPATH=.. python bench_telemetry_log.py [--rate 50] [--events 500] [--baudrate 115200]
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+
+from sentrybot.bench_drive import SimulatedLink
+from sentrybot.motorcontrol import BodyHeading, BodyStatus, BodyVelocity, DriveMotorController, \
+    DriveMotorControllerStatus, MotorStatus, MotorVelocity
+from sentrybot.serialtransport import SerialTransport
+from sentrybot.telemetrylog import RECORD, TelemetryLogWriter, TelemetryRecorder, load_logs
+
+
+def _status() -> DriveMotorControllerStatus:
+    return DriveMotorControllerStatus(
+        left_motor=MotorStatus(MotorVelocity(620, 0.1)),
+        right_motor=MotorStatus(MotorVelocity(682, 0.11)),
+        body=BodyStatus(BodyVelocity(0.105, 0.05), BodyHeading(0.01, -0.02, 1.57)),
+        battery_percent=87,
+        timestamp=time.monotonic(),
+    )
+
+
+def bench_append(directory: str, count: int) -> float:
+    """Seconds per append, including rotations."""
+
+    writer = TelemetryLogWriter(directory, max_file_bytes=1024 * 1024)
+    values = (0.1, 0.05, float('nan'), 0.1, 0.11, 0.105, 0.05, 0.01, -0.02, 1.57, 0.01, 0, 87)
+
+    t0 = time.perf_counter()
+    for _ in range(count):
+        writer.append(*values)
+    elapsed = time.perf_counter() - t0
+
+    writer.close()
+    return elapsed / count
+
+
+def bench_commands(args, directory: str = None) -> list:
+    """Acknowledgement latencies of ``set_body_velocity``, recording to ``directory`` if given."""
+
+    motors = DriveMotorController(SerialTransport(SimulatedLink(args.baudrate, args.loop_period)).start())
+    motors.status = _status()
+
+    recorder = None
+    if directory is not None:
+        recorder = TelemetryRecorder(motors, TelemetryLogWriter(directory), rate=args.rate, throttling_period=3600.)
+        recorder.start()
+
+    latencies = []
+    for i in range(args.events):
+        t0 = time.perf_counter()
+        motors.set_body_velocity(0.01 * (i % 20), rad=0.1 * (i % 7)).result()
+        latencies.append(time.perf_counter() - t0)
+
+    if recorder is not None:
+        recorder.stop()
+        records = load_logs(directory)
+        intervals = (records['time'][1:] - records['time'][:-1]) * 1e3
+        print(f'recorded {len(records)} records, interval p50={statistics.median(intervals):.2f}ms '
+              f'max={intervals.max():.2f}ms, late={recorder.late}')
+
+    motors.transport.close()
+    return sorted(latencies)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=float, default=50., help='Records per second')
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--loop-period', type=float, default=0.002, help='Seconds per firmware loop')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f'append: {bench_append(directory, 100000) * 1e6:.2f}us per {RECORD.size}B record')
+
+    for recording in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            latencies = bench_commands(args, directory if recording else None)
+
+        label = f'recording at {args.rate:.0f}Hz' if recording else 'not recording'
+        print(f'{label:>20}: ack p50={statistics.median(latencies) * 1e3:.2f}ms '
+              f'p95={latencies[int(0.95 * len(latencies))] * 1e3:.2f}ms max={latencies[-1] * 1e3:.2f}ms')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
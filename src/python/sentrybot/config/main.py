@@ -19,6 +19,29 @@ config = Config(
         serial=Config(
             path='/dev/ttyACM0',
         ),
+        # Status updates per second the controller pushes (motor and body velocities,
+        # orientation, battery); the website reads the latest without polling
+        telemetry_rate=5.,
+        # Drive commands from the website: only the newest is kept, and velocity
+        # setpoints are sent at most max_rate times per second (stops are not limited).
+        # The robot is stopped if it is moving and no drive command arrives for
+        # deadman_timeout seconds (the website repeats commands while driving), and
+        # a heartbeat is sent to the controller after heartbeat_interval seconds idle.
+        scheduler=Config(
+            max_rate=20.,
+            deadman_timeout=1.,
+            heartbeat_interval=0.5,
+        ),
+        # Binary log of commanded velocities, pushed status and throttling, rate times
+        # per second, for review after an incident (python -m sentrybot.telemetrylog <directory>).
+        # A new file is started every max_file_bytes; the oldest are deleted past max_total_bytes.
+        telemetry_log=Config(
+            enabled=True,
+            directory='~/sentry-telemetry',
+            rate=50.,
+            max_file_bytes=8 * 1024 * 1024,
+            max_total_bytes=256 * 1024 * 1024,
+        ),
     ),
     notifier=(IFTTTNotifier.build(secrets.ifttt.webhooks.key.value)
               if IS_SENTRY else ConsoleNotifier()),
@@ -29,20 +52,114 @@ config = Config(
     ),
     camera=Config(
         framerate=5,
-        print_fps=False,
+        # Stop capturing after this many seconds without viewers; None to always capture
+        idle_grace_period=10.,
         # resolution=(512, 384),
         resolution=(648, 486),
         # resolution=(800, 600),
         # resolution=(1024, 768),
+        # The camera used off the Pi: noise (0-1) sets JPEG size; distinct_frames are
+        # encoded per stream size on first capture, then played in a loop.
+        synthetic=Config(
+            entropy=0.2,
+            distinct_frames=10,
+        ),
         stream=Config(
             host='0.0.0.0',
             port=8081,
-        )
+            # 'flask': one thread per viewer; 'asyncio': one event loop for all viewers
+            backend='flask',
+        ),
+        # Streams captured at the same time from the camera, each on its own splitter
+        # port (0-3) and served at /stream/<name>. The default is also served at /.
+        default_stream='full',
+        streams=Config(
+            full=Config(splitter_port=0, resize=None, quality=None),
+            half=Config(splitter_port=1, resize=(320, 240), quality=None),
+            thumbnail=Config(splitter_port=2, resize=(160, 120), quality=None),
+        ),
+        # Latest frame of the default stream at /snapshot.jpg, and of each stream at
+        # /snapshot/<name>.jpg. Supports If-None-Match, and ?wait_newer_than=<X-Frame-Seq>
+        # long-polls for up to max_wait seconds.
+        snapshot=Config(
+            max_wait=10.,
+        ),
+        # Served at /stream/adaptive; each client is moved along the ladder (best first),
+        # and then has its frame rate lowered, to keep its latency within budget.
+        adaptive=Config(
+            ladder=('full', 'half', 'thumbnail'),
+            latency_budget=0.5,
+            min_framerate=1.,
+        ),
+        # H.264 from the hardware encoder, as fragmented MP4 over a WebSocket at the given
+        # path. Needs the 'asyncio' stream backend (so is off by default), and a splitter
+        # port not used above.
+        h264=Config(
+            enabled=False,
+            path='/h264',
+            splitter_port=3,
+            resize=None,
+            bitrate=1_000_000,
+            intra_period=10,
+        ),
+        # Notifies when motion is seen, by differencing raw frames captured at a low
+        # resolution on their own splitter port (free by default, as H.264 needs asyncio).
+        # Thresholds are per region of the grid: a fraction of pixels changed by more than
+        # pixel_threshold luma levels. Region thresholds may be a (rows, cols) nested tuple.
+        motion=Config(
+            enabled=False,
+            splitter_port=3,
+            resize=(128, 96),
+            grid=(3, 4),
+            pixel_threshold=25,
+            region_thresholds=0.02,
+            learning_rate=0.05,
+            # Seconds after a notification during which no more are sent
+            cooldown=60.,
+        ),
+        # Keeps the last seconds of a stream in memory, and writes them and the following
+        # seconds to a segment file when triggered: by motion, POST /record on the stream
+        # server, or a UDP datagram to trigger_address (sent by the website's Record button).
+        recorder=Config(
+            enabled=False,
+            stream='half',
+            directory='~/sentry-recordings',
+            pre_event_seconds=10.,
+            post_event_seconds=20.,
+            max_segment_seconds=120.,
+            # Oldest segments are deleted when the total is over this
+            max_total_bytes=2 * 1024 ** 3,
+            trigger_address=('127.0.0.1', 8082),
+        ),
+        # Publishes a stream's frames to shared memory, for other local processes to read
+        # with sentrybot.framebus.FrameBusReader. Frames larger than slot_size are dropped.
+        frame_bus=Config(
+            enabled=True,
+            name='sentry-frames',
+            stream='full',
+            num_slots=4,
+            slot_size=512 * 1024,
+        ),
     ),
     status_report=Config(
+        # Read from the kernel (see sentrybot.probes) and cached for ttl seconds;
+        # iwconfig and vcgencmd are only run if that fails
         wifi=Config(
-            interface='wlan0' if IS_SENTRY else 'wlp0s20f3'
-        )
+            interface='wlan0' if IS_SENTRY else 'wlp0s20f3',
+            ttl=5.,
+        ),
+        throttling=Config(
+            ttl=5.,
+        ),
+        # Seconds between samples of each metric, collected in the background; the status
+        # shows the latest, and /metrics/history serves the last minute, hour and day of them
+        metrics=Config(
+            cpu_period=1.,
+            memory_period=5.,
+            wifi_period=5.,
+            throttling_period=5.,
+            battery_period=30.,
+        ),
     )
 )
 
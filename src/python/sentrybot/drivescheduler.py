@@ -0,0 +1,251 @@
+"""
+Schedules drive commands from the website to the motor controller, so that a
+slow serial link never makes the robot carry out stale commands, and a lost
+website never leaves it driving.
+"""
+
+import time
+from collections import deque
+from threading import Condition, Thread
+from typing import Deque, Optional, Tuple
+
+from sentrybot.motorcontrol import DriveMotorController
+
+
+class DriveScheduler(Thread):
+    """
+    Sends drive commands to a :class:`DriveMotorController` one at a time, from
+    its own thread, at most ``max_rate`` times per second.
+
+    Only the newest velocity setpoint is kept: one that arrives while another
+    is still waiting to be sent replaces it (and is counted as coalesced).
+    A stop is sent before any setpoint, is not rate limited, and discards any
+    setpoint that arrived before it.
+
+    Deadman: if the robot was told to move and no drive command arrives for
+    ``deadman_timeout`` seconds, it is stopped; a client that keeps driving must
+    keep repeating its command. Heartbeat: if no command has been sent for
+    ``heartbeat_interval`` seconds, a heartbeat is sent, so the controller can
+    tell the link is alive; any command counts as one.
+
+    :meth:`drive` and :meth:`stop` never wait for the serial link, so they are
+    safe to call from Socket.IO handlers.
+    """
+
+    def __init__(
+            self,
+            motor_controller: DriveMotorController,
+            max_rate: float = 20.,
+            timeout: float = 1.,
+            deadman_timeout: Optional[float] = 1.,
+            heartbeat_interval: Optional[float] = 0.5,
+            history: int = 100,
+            name: str = 'DriveScheduler',
+            daemon: bool = True,
+            **kwargs
+    ):
+        """
+        :param max_rate: Velocity setpoints sent per second, at most.
+        :param timeout: Seconds to wait for the controller to acknowledge a command.
+        :param deadman_timeout: Seconds without a drive command before a moving robot
+            is stopped; ``None`` to never stop it.
+        :param heartbeat_interval: Seconds without any command before a heartbeat is
+            sent; ``None`` for no heartbeats.
+        :param history: Commands (and heartbeats) kept for the latency stats.
+        """
+
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.motor_controller = motor_controller
+        self.min_interval = 1. / max_rate
+        self.timeout = timeout
+        self.deadman_timeout = deadman_timeout
+        self.heartbeat_interval = heartbeat_interval
+
+        self.received = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.deadman_stops = 0
+        self.heartbeats_sent = 0
+        self.heartbeats_failed = 0
+        self.heartbeat_jitter = 0.
+        """Mean deviation between consecutive heartbeat round trip times, in seconds (as in RFC 3550)."""
+
+        self._condition = Condition()
+        self._pending_setpoint: Optional[Tuple[float, float, float]] = None
+        self._pending_stop: Optional[float] = None
+        self._last_setpoint_sent = 0.
+        self._last_sent = 0.
+        self._last_drive_received = 0.
+        self._moving = False
+
+        self._queue_ages: Deque[float] = deque(maxlen=history)
+        self._latencies: Deque[float] = deque(maxlen=history)
+        self._heartbeat_rtts: Deque[float] = deque(maxlen=history)
+
+    def drive(self, linear: float, angular: float) -> None:
+        """
+        :param linear: Linear velocity in meters per second.
+        :param angular: Angular velocity in radians per second.
+        """
+
+        with self._condition:
+            self.received += 1
+            if self._pending_setpoint is not None:
+                self.coalesced += 1
+
+            self._pending_setpoint = (linear, angular, time.monotonic())
+            self._last_drive_received = self._pending_setpoint[2]
+            self._condition.notify()
+
+    def stop(self) -> None:
+        with self._condition:
+            self.received += 1
+            if self._pending_setpoint is not None:
+                self.coalesced += 1
+                self._pending_setpoint = None
+
+            if self._pending_stop is None:
+                self._pending_stop = time.monotonic()
+            else:
+                self.coalesced += 1
+
+            self._condition.notify()
+
+    def run(self) -> None:
+        while True:
+            with self._condition:
+                command = self._next_command(time.monotonic())
+                while command is None:
+                    self._condition.wait(self._wait_time(time.monotonic()))
+                    command = self._next_command(time.monotonic())
+
+            if command[0] == 'heartbeat':
+                self._send_heartbeat()
+            else:
+                self._send(*command)
+
+    def _next_command(self, now: float) -> Optional[tuple]:
+        """Takes the next command that may be sent now; call with the condition held."""
+
+        if self._pending_stop is None and self._deadman_expired(now):
+            print(f'WARNING: No drive command for {now - self._last_drive_received:.1f}s; stopping')
+            self.deadman_stops += 1
+            self._pending_stop = now
+
+        if self._pending_stop is not None:
+            received_at, self._pending_stop = self._pending_stop, None
+            return 'stop', received_at, ()
+
+        if self._pending_setpoint is not None and self._setpoint_wait(now) <= 0:
+            linear, angular, received_at = self._pending_setpoint
+            self._pending_setpoint = None
+            return 'drive', received_at, (linear, angular)
+
+        if self._pending_setpoint is None and self._heartbeat_wait(now) <= 0:
+            return 'heartbeat', now, ()
+
+        return None
+
+    def _deadman_expired(self, now: float) -> bool:
+        return (
+                self._moving
+                and self.deadman_timeout is not None
+                and now - self._last_drive_received >= self.deadman_timeout
+        )
+
+    def _setpoint_wait(self, now: float) -> float:
+        return self._last_setpoint_sent + self.min_interval - now
+
+    def _heartbeat_wait(self, now: float) -> float:
+        if self.heartbeat_interval is None:
+            return float('inf')
+
+        return self._last_sent + self.heartbeat_interval - now
+
+    def _wait_time(self, now: float) -> Optional[float]:
+        """Seconds until something may need to be sent, ``None`` if only a new command can change that."""
+
+        waits = [self._heartbeat_wait(now)]
+        if self._pending_setpoint is not None:
+            waits.append(self._setpoint_wait(now))
+        if self._moving and self.deadman_timeout is not None:
+            waits.append(self._last_drive_received + self.deadman_timeout - now)
+
+        wait = min(waits)
+        return None if wait == float('inf') else max(wait, 0.)
+
+    def _send(self, command: str, received_at: float, args: tuple) -> None:
+        sent_at = time.monotonic()
+        self._queue_ages.append(sent_at - received_at)
+        self._last_sent = sent_at
+
+        if command == 'stop':
+            self._moving = False
+            request = self.motor_controller.stop()
+        else:
+            self._last_setpoint_sent = sent_at
+            linear, angular = args
+            self._moving = linear != 0 or angular != 0
+            request = self.motor_controller.set_body_velocity(linear, rad=angular)
+
+        self.sent += 1
+
+        # One command in flight at a time; anything newer waits here and may be coalesced
+        try:
+            request.result(timeout=self.timeout)
+            self._latencies.append(time.monotonic() - received_at)
+        except Exception:
+            # The controller logs failures
+            self.failed += 1
+
+    def _send_heartbeat(self) -> None:
+        sent_at = time.monotonic()
+        self._last_sent = sent_at
+        self.heartbeats_sent += 1
+
+        def on_response(request) -> None:
+            if request.exception() is not None:
+                self.heartbeats_failed += 1
+                return
+
+            rtt = time.monotonic() - sent_at
+            if self._heartbeat_rtts:
+                self.heartbeat_jitter += (abs(rtt - self._heartbeat_rtts[-1]) - self.heartbeat_jitter) / 16
+
+            self._heartbeat_rtts.append(rtt)
+
+        # Not waited on, so drive commands are never held up by a slow heartbeat
+        self.motor_controller.send_heartbeat().add_done_callback(on_response)
+
+    def stats(self) -> dict:
+        return dict(
+            received=self.received,
+            sent=self.sent,
+            coalesced=self.coalesced,
+            failed=self.failed,
+            queue_age=_summarize(self._queue_ages),
+            latency=_summarize(self._latencies),
+            deadman_stops=self.deadman_stops,
+            heartbeat=dict(
+                sent=self.heartbeats_sent,
+                failed=self.heartbeats_failed,
+                rtt=_summarize(self._heartbeat_rtts),
+                jitter=self.heartbeat_jitter,
+            ),
+        )
+
+
+def _summarize(values: Deque[float]) -> Optional[dict]:
+    """Seconds; ``None`` if there are no values."""
+
+    values = sorted(values)
+    if not values:
+        return None
+
+    return dict(
+        p50=values[len(values) // 2],
+        p95=values[min(len(values) - 1, int(0.95 * len(values)))],
+        max=values[-1],
+    )
@@ -0,0 +1,279 @@
+"""
+A ring of camera frames in shared memory, so any process on the robot can
+read the latest frame without a copy or a socket hop.
+
+The stream service owns the camera and publishes each frame with a
+:class:`FrameBusWriter`; other processes read with a :class:`FrameBusReader`.
+There are no locks: each slot has a sequence number that the writer clears
+before overwriting the slot and sets once it is complete, so readers can tell
+whether what they read is still intact.
+
+Layout (little-endian)::
+
+    header (64 B): magic, num_slots (u32), slot_size (u32), reserved (u32),
+                   latest_seq (u64), reader_heartbeat (f64), padding
+    slots:         seq (u64), length (u32), padding (4 B), timestamp (f64),
+                   padding to 32 B, data (slot_size B), padding to 64 B
+"""
+
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from struct import Struct
+from typing import Optional
+
+DEFAULT_NAME = 'sentry-frames'
+
+_MAGIC = b'SFB1'
+_HEADER = Struct('<4sIII')
+_U64 = Struct('<Q')
+_F64 = Struct('<d')
+_SLOT_META = Struct('<I4xd')
+
+_HEADER_SIZE = 64
+_LATEST_SEQ_OFFSET = 16
+_HEARTBEAT_OFFSET = 24
+_SLOT_HEADER_SIZE = 32
+
+
+def _slot_stride(slot_size: int) -> int:
+    return (_SLOT_HEADER_SIZE + slot_size + 63) // 64 * 64
+
+
+def _attach(name: str) -> SharedMemory:
+    """Attaches to existing shared memory without letting this process's resource tracker unlink it on exit."""
+
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13, attaching also registers the memory for cleanup
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class FrameBusWriter:
+    """Creates the frame bus and publishes frames to it. There must be only one writer per bus."""
+
+    def __init__(self, name: str = DEFAULT_NAME, num_slots: int = 4, slot_size: int = 512 * 1024):
+        """
+        :param num_slots: Frames kept; a reader has until ``num_slots - 1`` more
+            frames are published to finish with a frame.
+        :param slot_size: Largest frame that can be published, in bytes.
+        """
+
+        if num_slots < 2:
+            raise ValueError(f'num_slots must be at least 2; num_slots={num_slots}')
+
+        self.name = name
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self._stride = _slot_stride(slot_size)
+
+        size = _HEADER_SIZE + num_slots * self._stride
+        try:
+            self._shm = SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a writer that did not exit cleanly
+            stale = _attach(name)
+            stale.close()
+            stale.unlink()
+            self._shm = SharedMemory(name=name, create=True, size=size)
+
+        self._buf = self._shm.buf
+        self._buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+        _HEADER.pack_into(self._buf, 0, _MAGIC, num_slots, slot_size, 0)
+
+        self.latest_seq = 0
+        self.frames_too_large = 0
+
+    def publish(self, data, timestamp: float = None) -> int:
+        """
+        Copies ``data`` (any bytes-like object) into the next slot and makes it
+        the latest frame. Returns its sequence number, or 0 if it is larger
+        than ``slot_size`` and was dropped.
+        """
+
+        size = memoryview(data).nbytes
+        if size > self.slot_size:
+            self.frames_too_large += 1
+            return 0
+
+        buf = self._buf
+        seq = self.latest_seq + 1
+        offset = _HEADER_SIZE + (seq % self.num_slots) * self._stride
+        data_start = offset + _SLOT_HEADER_SIZE
+
+        # Readers must not trust the slot while it is being overwritten
+        _U64.pack_into(buf, offset, 0)
+
+        buf[data_start:data_start + size] = data
+        _SLOT_META.pack_into(buf, offset + 8, size, time.monotonic() if timestamp is None else timestamp)
+
+        _U64.pack_into(buf, offset, seq)
+        _U64.pack_into(buf, _LATEST_SEQ_OFFSET, seq)
+        self.latest_seq = seq
+
+        return seq
+
+    def retract(self, seq: int) -> None:
+        """
+        Invalidates a published frame, e.g. because its source was overwritten
+        while it was being copied; readers holding it see it as no longer valid.
+        """
+
+        buf = self._buf
+        offset = _HEADER_SIZE + (seq % self.num_slots) * self._stride
+        if _U64.unpack_from(buf, offset)[0] != seq:
+            return
+
+        _U64.pack_into(buf, offset, 0)
+        if _U64.unpack_from(buf, _LATEST_SEQ_OFFSET)[0] == seq:
+            _U64.pack_into(buf, _LATEST_SEQ_OFFSET, seq - 1)
+
+    def readers_active(self, within: float) -> bool:
+        """Returns ``True`` if any reader has read from the bus in the last ``within`` seconds."""
+
+        heartbeat, = _F64.unpack_from(self._buf, _HEARTBEAT_OFFSET)
+        return heartbeat > 0 and time.monotonic() - heartbeat < within
+
+    def close(self) -> None:
+        """Closes and removes the bus; readers keep their mapping but see no new frames."""
+
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SharedFrame:
+    """
+    A frame in the bus. ``data`` is a read-only view of the shared memory; the
+    slot is reused by the writer later, so check :meth:`is_valid` after using
+    the data, or use :meth:`to_bytes`.
+    """
+
+    __slots__ = ('seq', 'timestamp', 'data', '_reader', '_offset')
+
+    def __init__(self, seq: int, timestamp: float, data: memoryview, reader: 'FrameBusReader', offset: int):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.data = data
+        self._reader = reader
+        self._offset = offset
+
+    def __len__(self) -> int:
+        return self.data.nbytes
+
+    def __repr__(self) -> str:
+        return f'SharedFrame(seq={self.seq}, size={len(self)})'
+
+    def is_valid(self) -> bool:
+        """Returns ``False`` if the writer has started to overwrite this frame."""
+        return self._reader._slot_seq(self._offset) == self.seq
+
+    def to_bytes(self) -> Optional[bytes]:
+        """Returns a copy of the frame, or ``None`` if it was overwritten before or while copying."""
+
+        data = bytes(self.data)
+        return data if self.is_valid() else None
+
+
+class FrameBusReader:
+    """
+    Reads frames from a bus created by a :class:`FrameBusWriter` in another
+    process. Reading never blocks the writer, and never copies unless asked.
+
+    Frames are only published while some reader is reading, so a reader's first
+    frame may take a moment to arrive, and the latest frame may be stale if no
+    one has read for a while; compare its ``timestamp`` with ``time.monotonic()``.
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME):
+        """:raises FileNotFoundError: If the bus has not been created."""
+
+        self.name = name
+        self._shm = _attach(name)
+        self._buf = self._shm.buf
+        self._data = self._buf.toreadonly()
+
+        magic, self.num_slots, self.slot_size, _ = _HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f'Not a frame bus; name={name!r} magic={magic!r}')
+
+        self._stride = _slot_stride(self.slot_size)
+
+    def __enter__(self) -> 'FrameBusReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @property
+    def latest_seq(self) -> int:
+        return _U64.unpack_from(self._buf, _LATEST_SEQ_OFFSET)[0]
+
+    def latest(self) -> Optional[SharedFrame]:
+        """Returns the latest frame, or ``None`` if there is none yet."""
+
+        _F64.pack_into(self._buf, _HEARTBEAT_OFFSET, time.monotonic())
+
+        seq = self.latest_seq
+        return self.get(seq) if seq else None
+
+    def get(self, seq: int) -> Optional[SharedFrame]:
+        """Returns the frame with the given sequence number, or ``None`` if it is no longer in the bus."""
+
+        offset = _HEADER_SIZE + (seq % self.num_slots) * self._stride
+        if self._slot_seq(offset) != seq:
+            return None
+
+        length, timestamp = _SLOT_META.unpack_from(self._buf, offset + 8)
+        data_start = offset + _SLOT_HEADER_SIZE
+        frame = SharedFrame(seq, timestamp, self._data[data_start:data_start + length], self, offset)
+
+        # The slot may have been reused while its length and timestamp were read
+        return frame if frame.is_valid() else None
+
+    def wait_for_newer(self, seq: int, timeout: float = None, poll_interval: float = 0.005) -> Optional[SharedFrame]:
+        """
+        Returns the latest frame if it is newer than ``seq``; otherwise polls
+        for the next one. Returns ``None`` if ``timeout`` seconds pass first.
+        """
+
+        t_end = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            frame = self.latest()
+            if frame is not None and frame.seq > seq:
+                return frame
+
+            if t_end is not None and time.monotonic() >= t_end:
+                return None
+
+            time.sleep(poll_interval)
+
+    def _slot_seq(self, offset: int) -> int:
+        # Frames of a closed reader are never valid
+        return _U64.unpack_from(self._buf, offset)[0] if self._buf is not None else 0
+
+    def close(self) -> None:
+        """
+        Detaches from the bus. Frames read from it become invalid; if any are
+        still referenced, the memory stays mapped until they are garbage
+        collected.
+        """
+
+        if self._buf is None:
+            return
+
+        self._data.release()
+        self._buf = None
+
+        try:
+            self._shm.close()
+        except BufferError:
+            # Frame views still export the mapping. Leave it to be unmapped
+            # when the last of them is released, and close the rest now.
+            self._shm._mmap = None
+            self._shm.close()
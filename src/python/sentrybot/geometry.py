@@ -1,4 +1,18 @@
-from math import floor, pi
+"""
+Angles and dead reckoning for the robot's differential drive.
+
+Scalar functions use only ``math``; the batch functions take and return NumPy
+arrays, and import NumPy when called.
+
+Dead reckoning holds each velocity sample until the next one and integrates
+it exactly along the arc it describes, so :class:`PoseIntegrator` (one sample
+at a time) and :func:`integrate_body_velocities` (a whole log at once) give
+the same poses.
+"""
+
+from dataclasses import dataclass
+from math import cos, floor, isnan, pi, sin
+from typing import Optional
 
 
 def trunc_angle(angle: float) -> float:
@@ -11,3 +25,174 @@ def trunc_angle(angle: float) -> float:
     angle -= pi
 
     return angle
+
+
+def angle_difference(a: float, b: float) -> float:
+    """Returns the smallest rotation from ``b`` to ``a`` (in radians), in the range [-pi, pi)."""
+    return trunc_angle(a - b)
+
+
+def trunc_angles(angles):
+    """Truncates each angle (in radians) to the range [-pi, pi); the same as :func:`trunc_angle`, for arrays."""
+
+    import numpy as np
+
+    two_pi = 2 * pi
+
+    angles = np.add(angles, pi, dtype=float)
+    angles -= two_pi * np.floor_divide(angles, two_pi)
+    angles -= pi
+
+    return angles
+
+
+def angle_differences(a, b):
+    """Returns the smallest rotations from ``b`` to ``a`` (in radians), in the range [-pi, pi)."""
+
+    import numpy as np
+    return trunc_angles(np.subtract(a, b, dtype=float))
+
+
+def wheel_to_body_velocity(left, right, track_width: float):
+    """
+    Returns ``(linear, angular)`` velocity of the body, in m/s and rad/s, from
+    the velocities of the left and right wheels in m/s. Works on scalars and arrays.
+    """
+
+    return (left + right) / 2, (right - left) / track_width
+
+
+@dataclass
+class Pose:
+    x: float = 0.
+    """Meters."""
+    y: float = 0.
+    """Meters."""
+    yaw: float = 0.
+    """Radians, in the range [-pi, pi)."""
+
+
+class PoseIntegrator:
+    """
+    Dead reckons the robot's pose from a stream of velocity samples. Each
+    sample's velocity is taken to hold until the next sample's time; gaps of
+    more than ``max_dt`` seconds (e.g. telemetry stopped) are skipped, not
+    integrated. NaN velocities (unknown) are taken as zero.
+    """
+
+    def __init__(self, pose: Pose = None, track_width: float = None, max_dt: Optional[float] = 1.):
+        """
+        :param track_width: Distance between the wheels, in meters; needed for
+            :meth:`add_wheel_velocities`.
+        """
+
+        self.pose = pose or Pose()
+        self.track_width = track_width
+        self.max_dt = max_dt
+
+        self._last: Optional[tuple] = None
+
+    def add_body_velocity(self, t: float, linear: float, angular: float) -> Pose:
+        """
+        :param t: Time of the sample, in seconds.
+        :param linear: Linear velocity in meters per second.
+        :param angular: Angular velocity in radians per second.
+        :return: The pose at ``t``.
+        """
+
+        # Unknown velocities are taken as zero, as by integrate_body_velocities
+        linear = 0. if isnan(linear) else linear
+        angular = 0. if isnan(angular) else angular
+
+        if self._last is not None:
+            last_t, last_linear, last_angular = self._last
+            dt = t - last_t
+            if dt > 0 and (self.max_dt is None or dt <= self.max_dt):
+                self.pose = _advance(self.pose, last_linear * dt, last_angular * dt)
+
+        self._last = (t, linear, angular)
+        return self.pose
+
+    def add_wheel_velocities(self, t: float, left: float, right: float) -> Pose:
+        """
+        :param left: Velocity of the left wheel in meters per second.
+        :param right: Velocity of the right wheel in meters per second.
+        """
+
+        if self.track_width is None:
+            raise ValueError('Cannot integrate wheel velocities without a track width')
+
+        return self.add_body_velocity(t, *wheel_to_body_velocity(left, right, self.track_width))
+
+
+def _advance(pose: Pose, distance: float, rotation: float) -> Pose:
+    """Moves along the arc ``distance`` meters long that turns ``rotation`` radians."""
+
+    half = rotation / 2
+    # The chord of the arc, sin(half) / half -> 1 for a straight line
+    chord = distance * (sin(half) / half if abs(half) > 1e-9 else 1.)
+    heading = pose.yaw + half
+
+    return Pose(
+        x=pose.x + chord * cos(heading),
+        y=pose.y + chord * sin(heading),
+        yaw=trunc_angle(pose.yaw + rotation),
+    )
+
+
+def integrate_body_velocities(t, linear, angular, pose: Pose = None, max_dt: Optional[float] = 1.):
+    """
+    Returns arrays ``(x, y, yaw)`` of the pose at each sample time, the same as
+    feeding the samples one by one to a :class:`PoseIntegrator` starting at
+    ``pose``. NaN velocities (unknown) are taken as zero.
+
+    :param t: Sample times in seconds, in increasing order.
+    :param linear: Linear velocities in meters per second.
+    :param angular: Angular velocities in radians per second.
+    """
+
+    import numpy as np
+
+    pose = pose or Pose()
+    t = np.asarray(t, dtype=float)
+    linear = np.nan_to_num(np.asarray(linear, dtype=float))
+    angular = np.nan_to_num(np.asarray(angular, dtype=float))
+
+    dt = np.diff(t)
+    dt[dt <= 0] = 0.
+    if max_dt is not None:
+        dt[dt > max_dt] = 0.
+
+    distance = linear[:-1] * dt
+    rotation = angular[:-1] * dt
+
+    # Unwrapped yaw at each sample
+    yaw = np.empty_like(t)
+    yaw[:1] = pose.yaw
+    np.cumsum(rotation, out=yaw[1:])
+    yaw[1:] += pose.yaw
+
+    half = rotation / 2
+    chord = distance * np.sinc(half / pi)
+    heading = yaw[:-1] + half
+
+    x = np.empty_like(t)
+    x[:1] = pose.x
+    np.cumsum(chord * np.cos(heading), out=x[1:])
+    x[1:] += pose.x
+
+    y = np.empty_like(t)
+    y[:1] = pose.y
+    np.cumsum(chord * np.sin(heading), out=y[1:])
+    y[1:] += pose.y
+
+    return x, y, trunc_angles(yaw)
+
+
+def integrate_wheel_velocities(t, left, right, track_width: float, pose: Pose = None, max_dt: Optional[float] = 1.):
+    """:func:`integrate_body_velocities` from the velocities of the left and right wheels, in m/s."""
+
+    import numpy as np
+
+    linear, angular = wheel_to_body_velocity(np.asarray(left, dtype=float), np.asarray(right, dtype=float), track_width)
+    return integrate_body_velocities(t, linear, angular, pose=pose, max_dt=max_dt)
@@ -0,0 +1,248 @@
+"""
+Samples system metrics in the background, each on its own period, and keeps
+their recent history in memory for the website to draw trends from.
+
+Each series is kept at several resolutions (tiers): by default every second
+for the last minute, every 10 s for the last hour and every 5 min for the
+last day. A tier is a ring of fixed-size arrays (bucket time, mean, min, max)
+that samples are averaged into, so memory use is fixed when a series is
+created, whatever the sample rates: see :meth:`MetricsCollector.memory_bytes`.
+"""
+
+import heapq
+import time
+from array import array
+from dataclasses import dataclass
+from math import floor, inf, isnan, nan
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class Tier:
+    name: str
+    span: float
+    """Seconds of history kept."""
+    resolution: float
+    """Seconds per bucket."""
+
+    @property
+    def size(self) -> int:
+        return int(self.span // self.resolution)
+
+
+DEFAULT_TIERS = (
+    Tier('1m', span=60., resolution=1.),
+    Tier('1h', span=3600., resolution=10.),
+    Tier('24h', span=86400., resolution=300.),
+)
+
+
+@dataclass
+class Metric:
+    """Sampled every ``period`` seconds by calling ``read``, which returns one value (or ``None``, if unknown) per name."""
+
+    names: Sequence[str]
+    period: float
+    read: Callable[[], Sequence[Optional[float]]]
+
+
+class TierBuffer:
+    """One tier of one series: a ring with a bucket per ``tier.resolution`` seconds."""
+
+    def __init__(self, tier: Tier):
+        self.tier = tier
+
+        size = tier.size
+        self.times = array('d', [nan]) * size
+        self.means = array('d', [nan]) * size
+        self.mins = array('d', [nan]) * size
+        self.maxs = array('d', [nan]) * size
+
+        self._bucket: Optional[int] = None
+        self._sum = 0.
+        self._count = 0
+
+    def add(self, t: float, value: float) -> None:
+        bucket = floor(t / self.tier.resolution)
+        i = bucket % len(self.times)
+
+        if bucket != self._bucket:
+            # Overwrites whatever the slot held one span ago
+            self._bucket = bucket
+            self._sum = 0.
+            self._count = 0
+            self.times[i] = bucket * self.tier.resolution
+            self.mins[i] = inf
+            self.maxs[i] = -inf
+
+        self._sum += value
+        self._count += 1
+        self.means[i] = self._sum / self._count
+        self.mins[i] = min(self.mins[i], value)
+        self.maxs[i] = max(self.maxs[i], value)
+
+    def read(self, now: float) -> dict:
+        """Returns the buckets of the last ``tier.span`` seconds, oldest first; missing buckets are left out."""
+
+        start = now - self.tier.span
+        slots = sorted(
+            (i for i, t in enumerate(self.times) if not isnan(t) and t > start),
+            key=self.times.__getitem__,
+        )
+
+        return dict(
+            time=[self.times[i] for i in slots],
+            mean=[self.means[i] for i in slots],
+            min=[self.mins[i] for i in slots],
+            max=[self.maxs[i] for i in slots],
+        )
+
+    def memory_bytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.times, self.means, self.mins, self.maxs))
+
+
+class MetricsCollector(Thread):
+    """
+    Samples each metric every ``metric.period`` seconds, from one thread.
+    Periods are kept against a fixed start, so they do not drift; a metric that
+    is read late (e.g. because another was slow) is counted and sampled again a
+    full period later rather than several times in a row.
+    """
+
+    def __init__(
+            self,
+            metrics: Sequence[Metric],
+            tiers: Sequence[Tier] = DEFAULT_TIERS,
+            name: str = 'MetricsCollector',
+            daemon: bool = True,
+            **kwargs
+    ):
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.metrics = list(metrics)
+        self.tiers = list(tiers)
+
+        self.reads = [0] * len(self.metrics)
+        self.failures = [0] * len(self.metrics)
+        self.late = [0] * len(self.metrics)
+        self.max_read_time = [0.] * len(self.metrics)
+
+        self._series: Dict[str, List[TierBuffer]] = {
+            name: [TierBuffer(tier) for tier in self.tiers]
+            for metric in self.metrics
+            for name in metric.names
+        }
+        self._latest: Dict[str, Tuple[float, float]] = {}
+        self._lock = Lock()
+        self._stopping = Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self.join()
+
+    def run(self) -> None:
+        now = time.monotonic()
+        schedule = [(now, i) for i in range(len(self.metrics))]
+        heapq.heapify(schedule)
+
+        while True:
+            due, i = schedule[0]
+            if self._stopping.wait(max(0., due - time.monotonic())):
+                return
+
+            metric = self.metrics[i]
+            now = time.monotonic()
+            self.sample(i)
+
+            due += metric.period
+            if due < now:
+                self.late[i] += 1
+                due = now + metric.period
+
+            heapq.heapreplace(schedule, (due, i))
+
+    def sample(self, i: int) -> None:
+        metric = self.metrics[i]
+        self.reads[i] += 1
+
+        t0 = time.perf_counter()
+        try:
+            values = metric.read()
+        except Exception as e:
+            self.failures[i] += 1
+            print(f'ERROR: Failed to read metrics {", ".join(metric.names)}: {e}')
+            return
+        finally:
+            self.max_read_time[i] = max(self.max_read_time[i], time.perf_counter() - t0)
+
+        self.record(dict(zip(metric.names, values)), time.time())
+
+    def record(self, values: Dict[str, Optional[float]], t: float) -> None:
+        """Adds samples taken at Unix time ``t``; ``None`` and NaN values are unknown and skipped."""
+
+        with self._lock:
+            for name, value in values.items():
+                if value is None or isnan(value):
+                    continue
+
+                for buffer in self._series[name]:
+                    buffer.add(t, value)
+
+                self._latest[name] = (t, value)
+
+    def latest(self, name: str, max_age: float = None) -> Optional[float]:
+        """Returns the newest value of the series, or ``None`` if there is none (newer than ``max_age`` seconds)."""
+
+        with self._lock:
+            entry = self._latest.get(name)
+
+        if entry is None or (max_age is not None and time.time() - entry[0] > max_age):
+            return None
+
+        return entry[1]
+
+    def history(self, tier: str, names: Sequence[str] = None) -> dict:
+        """
+        Returns the history of each series (all of them if ``names`` is
+        ``None``) in the tier, as lists of bucket start times (Unix time) and
+        the mean, min and max of the samples in each bucket.
+        """
+
+        indexes = [i for i, t in enumerate(self.tiers) if t.name == tier]
+        if not indexes:
+            raise ValueError(f'Unknown tier; tier={tier!r}')
+
+        unknown = set(names or ()) - set(self._series)
+        if unknown:
+            raise ValueError(f'Unknown series; names={sorted(unknown)}')
+
+        index = indexes[0]
+        tier = self.tiers[index]
+        now = time.time()
+
+        with self._lock:
+            return dict(
+                tier=tier.name,
+                resolution=tier.resolution,
+                series={name: self._series[name][index].read(now) for name in (names or self._series)},
+            )
+
+    def memory_bytes(self) -> int:
+        """Bytes of history kept, in total; fixed once the collector is created."""
+        return sum(buffer.memory_bytes() for buffers in self._series.values() for buffer in buffers)
+
+    def stats(self) -> dict:
+        return dict(
+            memory_bytes=self.memory_bytes(),
+            metrics={
+                ','.join(metric.names): dict(
+                    period=metric.period,
+                    reads=self.reads[i],
+                    failures=self.failures[i],
+                    late=self.late[i],
+                    max_read_time=self.max_read_time[i],
+                )
+                for i, metric in enumerate(self.metrics)
+            },
+        )
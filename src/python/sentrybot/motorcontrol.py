@@ -2,60 +2,130 @@ import time
 from dataclasses import dataclass
 from math import radians
 from struct import Struct
-from typing import Optional
+from typing import Any, Callable, Optional
 
 from serial import Serial
 
 from sentrybot.geometry import trunc_angle
-from serialpackets import SerialPackets
+from sentrybot.serialtransport import PendingRequest, SerialTransport
+
+# Must match the firmware
+TICKS_PER_METER = 6200
+TRACK_WIDTH = 0.22  # Meters between the wheels
 
 
 class DriveMotorController:
-    def __init__(self, conn: SerialPackets):
-        self.conn = conn
+    """
+    Commands the drive motor controller over serial.
+
+    Every command returns a :class:`PendingRequest` without waiting for the
+    controller: call ``result()`` on it to wait from a thread, or ``await`` it
+    from a coroutine. It fails with :class:`MotorControlError` if the controller
+    does not acknowledge the command. Several commands may be in flight at once.
+
+    Once telemetry is enabled with :meth:`set_telemetry_rate`, the controller
+    pushes its status, and :attr:`status` is always the latest; reading it
+    never touches the serial port.
+    """
+
+    def __init__(self, transport: SerialTransport, ticks_per_meter: float = TICKS_PER_METER):
+        self.transport = transport
+        self.ticks_per_meter = ticks_per_meter
+
+        self.status: Optional[DriveMotorControllerStatus] = None
+        """Latest status pushed by the controller, or ``None`` if none has arrived. Replaced, never modified."""
+        self.telemetry_errors = 0
+
+        # Last commanded velocities; angular is None while a heading is targeted
+        self.commanded_linear = 0.
+        self.commanded_angular: Optional[float] = 0.
 
         self._last_target_heading = None
 
+        transport.on_unsolicited = self._on_unsolicited
+
     @staticmethod
-    def connect(port: str, baudrate: int = 115200, timeout: float = 1.) -> 'DriveMotorController':
+    def connect(
+            port: str,
+            baudrate: int = 115200,
+            timeout: float = 1.,
+            telemetry_rate: float = None,
+    ) -> 'DriveMotorController':
+        """
+        :param telemetry_rate: Status updates per second for the controller to push, if any.
+        """
+
+        from serialpackets import SerialPackets
+
         conn = Serial(port=port, baudrate=baudrate, timeout=timeout)
         conn = SerialPackets(conn)
-        return DriveMotorController(conn)
+        transport = SerialTransport(conn, timeout=timeout).start()
+        motor_controller = DriveMotorController(transport)
 
-    def stop(self):
-        self._write_then_read_ack(Request.stop())
+        if telemetry_rate:
+            motor_controller.set_telemetry_rate(telemetry_rate)
+
+        return motor_controller
+
+    @property
+    def target_heading(self) -> Optional[float]:
+        """The heading (yaw) last targeted, in radians, or ``None`` if not targeting one."""
+        return self._last_target_heading
+
+    def stop(self) -> PendingRequest:
+        self.commanded_linear = 0.
+        self.commanded_angular = 0.
+        return self._request(Request.stop())
 
     def set_motor_velocities(self, left, right):
         ...
 
-    def set_linear_velocity(self, v: float):
+    def set_linear_velocity(self, v: float) -> PendingRequest:
         """
         :param v: Linear velocity in meters per second.
         """
 
-        self._write_then_read_ack(Request.set_linear_velocity(v))
+        self.commanded_linear = v
+        return self._request(Request.set_linear_velocity(v))
+
+    def set_body_velocity(self, linear: float, rad: float = None, deg: float = None) -> PendingRequest:
+        """
+        Sets the linear and angular velocity together, in one command, so the
+        controller never drives with one updated and the other not.
+
+        :param linear: Linear velocity in meters per second.
+        :param rad: Angular velocity in radians per second.
+        :param deg: Angular velocity in degrees per second.
+        """
+
+        w = _as_rad(rad, deg)
+        self._last_target_heading = None
+        self.commanded_linear, self.commanded_angular = linear, w
+        return self._request(Request.set_body_velocity(linear, w))
 
-    def set_angular_velocity(self, rad: float = None, deg: float = None):
+    def set_angular_velocity(self, rad: float = None, deg: float = None) -> PendingRequest:
         """
         :param rad: Angular velocity in radians per second.
         :param deg: Angular velocity in degrees per second.
         """
 
         w = _as_rad(rad, deg)
-        self._write_then_read_ack(Request.set_angular_velocity(w))
         self._last_target_heading = None
+        self.commanded_angular = w
+        return self._request(Request.set_angular_velocity(w))
 
-    def set_target_heading(self, rad: float = None, deg: float = None):
+    def set_target_heading(self, rad: float = None, deg: float = None) -> PendingRequest:
         """
         :param rad: The heading (yaw) to maintain, in radians.
         :param deg: The heading (yaw) to maintain, in degrees.
         """
 
         heading = trunc_angle(_as_rad(rad, deg))
-        self._write_then_read_ack(Request.set_target_heading(heading))
         self._last_target_heading = heading
+        self.commanded_angular = None
+        return self._request(Request.set_target_heading(heading))
 
-    def change_target_heading(self, rad: float = None, deg: float = None):
+    def change_target_heading(self, rad: float = None, deg: float = None) -> PendingRequest:
         """
         :param rad: The change in heading (yaw) to maintain, in radians.
         :param deg: The change in heading (yaw) to maintain, in degrees.
@@ -66,38 +136,92 @@ class DriveMotorController:
 
         change = _as_rad(rad, deg)
         new_heading = trunc_angle(self._last_target_heading + change)
-        self.set_target_heading(rad=new_heading)
+        return self.set_target_heading(rad=new_heading)
 
-    def get_status(self) -> 'DriveMotorControllerStatus':
-        response = self._write_then_read_ack(Request.get_status())
+    def get_status(self) -> PendingRequest:
+        """The result is a :class:`DriveMotorControllerStatus`."""
 
-        battery_percent, = Response.GET_STATUS.unpack(response)
+        def parse(response: bytes) -> DriveMotorControllerStatus:
+            battery_percent, = Response.GET_STATUS.unpack(response)
 
-        return DriveMotorControllerStatus(
-            left_motor=...,
-            right_motor=...,
-            body=...,
-            battery_percent=battery_percent,
-        )
+            return DriveMotorControllerStatus(
+                left_motor=...,
+                right_motor=...,
+                body=...,
+                battery_percent=battery_percent,
+            )
+
+        return self._request(Request.get_status(), parse)
+
+    def set_telemetry_rate(self, rate: float) -> PendingRequest:
+        """
+        :param rate: Status updates per second for the controller to push; 0 to stop.
+        """
+
+        period_ms = round(1000 / rate) if rate > 0 else 0
+        return self._request(Request.set_telemetry_period(period_ms))
 
     def disable(self):
         ...
 
-    def send_heartbeat(self):
+    def send_heartbeat(self) -> PendingRequest:
         """
         Sends a heartbeat to the controller. If the controller does not receive a heartbeat after some time,
         it will stop the motors for safety.
         """
 
-        self._write_then_read_ack(Request.heartbeat())
+        return self._request(Request.heartbeat())
+
+    def _on_unsolicited(self, payload: bytes) -> None:
+        """Called from the transport's reader thread with each packet the controller pushes."""
+
+        if payload[0:1] != Response.TELEMETRY:
+            return
 
-    def _write_then_read_ack(self, data: bytes) -> bytes:
-        response = self.conn.write_then_read(data)
+        try:
+            self.status = self.decode_telemetry(payload[1:], time.monotonic())
+        except Exception as e:
+            self.telemetry_errors += 1
+            print(f'ERROR: Invalid telemetry; payload={payload}: {e}')
 
-        if response[0:1] != Response.ACK:
-            raise MotorControlError(f'Expected to receive ACK; response={response}')
+    def decode_telemetry(self, data: bytes, timestamp: float) -> 'DriveMotorControllerStatus':
+        (
+            _, left_ticks, right_ticks, linear_mm, angular_mrad, roll, pitch, yaw, battery_percent
+        ) = Response.TELEMETRY_STRUCT.unpack(data)
 
-        return response[1:]
+        return DriveMotorControllerStatus(
+            left_motor=MotorStatus(MotorVelocity(left_ticks, left_ticks / self.ticks_per_meter)),
+            right_motor=MotorStatus(MotorVelocity(right_ticks, right_ticks / self.ticks_per_meter)),
+            body=BodyStatus(
+                velocity=BodyVelocity(linear_mm / 1000, angular_mrad / 1000),
+                heading=BodyHeading(roll / 100, pitch / 100, yaw / 100),
+            ),
+            battery_percent=battery_percent,
+            timestamp=timestamp,
+        )
+
+    def _request(self, data: bytes, parse: Callable[[bytes], Any] = None) -> PendingRequest:
+        """Sends ``data``; the result is the response after the ACK, passed through ``parse`` if given."""
+
+        result = PendingRequest()
+
+        def on_response(response: PendingRequest) -> None:
+            try:
+                response = response.result()
+                if response[0:1] != Response.ACK:
+                    raise MotorControlError(f'Expected to receive ACK; response={response}')
+
+                result.set_result(parse(response[1:]) if parse else response[1:])
+            except Exception as e:
+                if not isinstance(e, MotorControlError):
+                    e = MotorControlError(f'Request failed; request={data}: {e}')
+
+                # Most commands are not waited on, so make sure failures are seen
+                print(f'ERROR: {e}')
+                result.set_exception(e)
+
+        self.transport.request(data).add_done_callback(on_response)
+        return result
 
 
 def _as_rad(rad: Optional[float], deg: Optional[float]) -> float:
@@ -113,36 +237,57 @@ def _as_rad(rad: Optional[float], deg: Optional[float]) -> float:
 
 
 class Request:
+    HEARTBEAT = b'\x00'
+    GET_STATUS = b'\x01'
+    SET_LINEAR_VELOCITY = b'\x02'
+    SET_ANGULAR_VELOCITY = b'\x03'
+    SET_TARGET_HEADING = b'\x04'
+    STOP = b'\x05'
+    SET_BODY_VELOCITY = b'\x06'
+    SET_TELEMETRY_PERIOD = b'\x07'
+
     SET_LINEAR_VELOCITY_STRUCT = Struct('>ch')
     SET_ANGULAR_VELOCITY_STRUCT = Struct('>ch')
     SET_TARGET_HEADING_STRUCT = Struct('>ch')
+    SET_BODY_VELOCITY_STRUCT = Struct('>chh')
+    SET_TELEMETRY_PERIOD_STRUCT = Struct('>cH')
 
     @staticmethod
     def heartbeat() -> bytes:
-        return b'\x00'
+        return Request.HEARTBEAT
 
     @staticmethod
     def get_status() -> bytes:
-        return b'\x01'
+        return Request.GET_STATUS
 
     @staticmethod
     def set_linear_velocity(v: float) -> bytes:
         v_cm = round(v * 100)
-        return Request.SET_LINEAR_VELOCITY_STRUCT.pack(b'\x02', v_cm)
+        return Request.SET_LINEAR_VELOCITY_STRUCT.pack(Request.SET_LINEAR_VELOCITY, v_cm)
 
     @staticmethod
     def set_angular_velocity(w: float) -> bytes:
         w_centirad = round(w * 100)
-        return Request.SET_ANGULAR_VELOCITY_STRUCT.pack(b'\x03', w_centirad)
+        return Request.SET_ANGULAR_VELOCITY_STRUCT.pack(Request.SET_ANGULAR_VELOCITY, w_centirad)
 
     @staticmethod
     def set_target_heading(heading: float) -> bytes:
         heading_centirad = round(heading * 100)
-        return Request.SET_TARGET_HEADING_STRUCT.pack(b'\x04', heading_centirad)
+        return Request.SET_TARGET_HEADING_STRUCT.pack(Request.SET_TARGET_HEADING, heading_centirad)
 
     @staticmethod
     def stop() -> bytes:
-        return b'\x05'
+        return Request.STOP
+
+    @staticmethod
+    def set_body_velocity(v: float, w: float) -> bytes:
+        v_cm = round(v * 100)
+        w_centirad = round(w * 100)
+        return Request.SET_BODY_VELOCITY_STRUCT.pack(Request.SET_BODY_VELOCITY, v_cm, w_centirad)
+
+    @staticmethod
+    def set_telemetry_period(period_ms: int) -> bytes:
+        return Request.SET_TELEMETRY_PERIOD_STRUCT.pack(Request.SET_TELEMETRY_PERIOD, period_ms)
 
 
 class Response:
@@ -150,6 +295,12 @@ class Response:
     NCK = b'\x01'
     GET_STATUS = Struct('>B')
 
+    # Pushed by the controller: controller time (ms), left and right motor
+    # velocities (ticks/s), body linear (mm/s) and angular (mrad/s) velocity,
+    # roll, pitch and yaw (centirad), battery (percent)
+    TELEMETRY = b'\x01'
+    TELEMETRY_STRUCT = Struct('>IhhhhhhhB')
+
 
 @dataclass
 class DriveMotorControllerStatus:
@@ -157,6 +308,8 @@ class DriveMotorControllerStatus:
     right_motor: 'MotorStatus'
     body: 'BodyStatus'
     battery_percent: int
+    timestamp: Optional[float] = None
+    """``time.monotonic()`` when the status was received."""
 
 
 @dataclass
@@ -193,113 +346,9 @@ class MotorControlError(Exception):
     pass
 
 
-def test0(motors: DriveMotorController):
-    speed = 0.2
-    motors.set_target_heading(deg=0)
-
-    while True:
-        motors.set_linear_velocity(speed)
-        time.sleep(12)
-
-        motors.set_linear_velocity(0.)
-        motors.change_target_heading(deg=-45)
-        time.sleep(2)
-
-        motors.set_linear_velocity(speed)
-        time.sleep(5.5)
-
-        motors.set_linear_velocity(0.)
-        motors.change_target_heading(deg=-45)
-        time.sleep(2)
-
-        motors.set_linear_velocity(speed)
-        time.sleep(8)
-
-        motors.set_linear_velocity(0.)
-        motors.change_target_heading(deg=-90)
-        time.sleep(3)
-
-
-def test1(motors: DriveMotorController):
-    speed = 0.2
-    motors.set_target_heading(deg=0)
-    motors.set_linear_velocity(speed)
-
-    while True:
-        time.sleep(12.5)
-        motors.change_target_heading(deg=-45)
-        time.sleep(5.5)
-        motors.change_target_heading(deg=-45)
-        time.sleep(8.5)
-        motors.change_target_heading(deg=-90)
-
-
-def test2(motors: DriveMotorController):
-    motors.set_target_heading(deg=0)
-
-    while True:
-        motors.change_target_heading(deg=180)
-        time.sleep(5)
-
-        motors.change_target_heading(deg=-180)
-        time.sleep(5)
-
-
-def test3(motors: DriveMotorController):
-    speed = 0.3
-    motors.set_target_heading(deg=0)
-    motors.set_linear_velocity(speed)
-
-    direction = 1
-    parts = 32
-    while True:
-        for _ in range(parts):
-            motors.change_target_heading(deg=direction * 360 / parts)
-            time.sleep(15 / parts)
-
-        direction *= -1
-
-
-def test4(motors: DriveMotorController):
-    speed = 0.2
-    motors.set_linear_velocity(speed)
-
-    direction = 1
-    t = 15
-    while True:
-        motors.set_angular_velocity(deg=direction * 360 / t)
-        time.sleep(t)
-
-        direction *= -1
-
-
-def test5(motors: DriveMotorController):
-    while True:
-        print('forward')
-        motors.set_linear_velocity(0.1)
-        time.sleep(3)
-
-        print('backward')
-        motors.set_linear_velocity(-0.1)
-        time.sleep(3)
-
-
-def test6(motors: DriveMotorController):
-    motors.set_linear_velocity(0)
-
-    while True:
-        print('target')
-        motors.set_target_heading(0)
-        time.sleep(2)
-
-        print('stop')
-        motors.stop()
-        time.sleep(10)
-
-
 def test_get_status(motors: DriveMotorController):
     while True:
-        print(motors.get_status())
+        print(motors.get_status().result())
         time.sleep(1)
 
 
@@ -310,7 +359,7 @@ def main():
         test_get_status(motors)
     finally:
         print('stop')
-        motors.stop()
+        motors.stop().result()
 
 
 if __name__ == '__main__':
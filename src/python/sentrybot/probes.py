@@ -0,0 +1,265 @@
+"""
+Reads Wi-Fi and throttling state for the status report without starting a
+process: the bit rate with the same wireless-extensions ioctl ``iwconfig``
+uses, the signal from ``/proc/net/wireless``, and the throttling flags from the
+Raspberry Pi firmware driver in sysfs. Files and sockets are opened once and
+re-read.
+
+Each probe caches its result for ``ttl`` seconds. If the kernel interface is
+missing or fails, a probe falls back to running the command line tool
+(``iwconfig``, ``vcgencmd``) for that read; ``subprocess_calls`` counts how
+often.
+"""
+
+import argparse
+import fcntl
+import re
+import socket
+import struct
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from threading import Lock
+from typing import Generic, Optional, Sequence, TypeVar
+
+from sentrybot.vcgencmd import GET_THROTTLED
+
+T = TypeVar('T')
+
+# Hex flags, as from vcgencmd get_throttled; Raspberry Pi OS kernels since 4.19
+THROTTLED_PATH = '/sys/devices/platform/soc/soc:firmware/get_throttled'
+
+PROC_NET_WIRELESS_PATH = '/proc/net/wireless'
+IWCONFIG = 'iwconfig'
+
+# From linux/wireless.h: struct iwreq is the interface name (16 B) then a 16 B union,
+# which holds a struct iw_param (value s32, fixed u8, disabled u8, flags u16) for the rate
+_SIOCGIWRATE = 0x8B21
+_IWREQ = struct.Struct('16s16x')
+_IW_PARAM_VALUE = struct.Struct('i')
+_IW_PARAM_OFFSET = 16
+
+
+class Probe(Generic[T]):
+    """
+    Caches what :meth:`read_native` (or, if that fails, :meth:`read_fallback`)
+    returns for ``ttl`` seconds. Safe to share between threads.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+        self.reads = 0
+        self.subprocess_calls = 0
+
+        self._value: Optional[T] = None
+        self._expires_at = float('-inf')
+        self._native_failed = False
+        self._fallback_missing = False
+        self._lock = Lock()
+
+    def get(self) -> Optional[T]:
+        """Returns the cached value, reading a new one first if it is older than the TTL; ``None`` if unknown."""
+
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expires_at:
+                self._value = self._read()
+                self._expires_at = now + self.ttl
+
+            return self._value
+
+    def _read(self) -> Optional[T]:
+        self.reads += 1
+
+        try:
+            return self.read_native()
+        except OSError as e:
+            if not self._native_failed:
+                print(f'WARNING: {type(self).__name__}: Falling back to a subprocess: {e}')
+                self._native_failed = True
+
+        if self._fallback_missing:
+            return None
+
+        self.subprocess_calls += 1
+        try:
+            return self.read_fallback()
+        except FileNotFoundError:
+            # The tool is not installed (not on a Pi); it will not appear later
+            self._fallback_missing = True
+        except Exception as e:
+            print(f'ERROR: {type(self).__name__}: Failed to read: {e}')
+
+        return None
+
+    def read_native(self) -> Optional[T]:
+        raise NotImplementedError
+
+    def read_fallback(self) -> Optional[T]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class KernelFile:
+    """A file in procfs or sysfs, kept open and read from the start each time, which makes the kernel regenerate it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def read(self) -> str:
+        if self._file is None:
+            self._file = open(self.path, 'rb', buffering=0)
+
+        try:
+            self._file.seek(0)
+            return self._file.read().decode()
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ThrottlingProbe(Probe[int]):
+    """The raw throttling flags; see the masks in :mod:`sentrybot.vcgencmd`."""
+
+    def __init__(self, ttl: float = 5., path: str = THROTTLED_PATH, command: Sequence[str] = GET_THROTTLED):
+        super().__init__(ttl)
+
+        self.command = command
+        self._file = KernelFile(path)
+
+    def read_native(self) -> int:
+        try:
+            return int(self._file.read().strip(), 16)
+        except ValueError as e:
+            raise OSError(f'Unexpected contents of {self._file.path}: {e}')
+
+    def read_fallback(self) -> int:
+        throttling = subprocess.check_output(self.command, text=True)
+        return int(throttling.partition('=')[2].strip(), 0)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+@dataclass
+class WifiStatus:
+    bit_rate_Mbps: Optional[float]
+    signal_dBm: Optional[float]
+    """``None`` if the driver does not report it."""
+
+
+class WifiProbe(Probe[WifiStatus]):
+    BIT_RATE_PATTERN = re.compile(r'Bit Rate[=:]([\d.]+)')
+    SIGNAL_PATTERN = re.compile(r'Signal level[=:](-?\d+) dBm')
+
+    def __init__(
+            self,
+            interface: str,
+            ttl: float = 5.,
+            proc_path: str = PROC_NET_WIRELESS_PATH,
+            command: Sequence[str] = None,
+    ):
+        super().__init__(ttl)
+
+        self.interface = interface
+        self.command = command or (IWCONFIG, interface)
+        self._proc_file = KernelFile(proc_path)
+        self._socket: Optional[socket.socket] = None
+
+    def read_native(self) -> WifiStatus:
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        request = bytearray(_IWREQ.pack(self.interface.encode()))
+        fcntl.ioctl(self._socket, _SIOCGIWRATE, request)
+        bit_rate, = _IW_PARAM_VALUE.unpack_from(request, _IW_PARAM_OFFSET)
+
+        try:
+            signal = parse_proc_net_wireless(self._proc_file.read(), self.interface)
+        except OSError:
+            signal = None
+
+        return WifiStatus(bit_rate_Mbps=bit_rate / 1e6, signal_dBm=signal)
+
+    def read_fallback(self) -> Optional[WifiStatus]:
+        result = subprocess.run(self.command, capture_output=True, text=True)
+
+        if result.returncode != 0:
+            print(f'ERROR: Failed to get WiFi bit rate: returncode={result.returncode}')
+            print('--- stderr ---')
+            print(result.stderr)
+            print('------')
+            return None
+
+        bit_rate = self.BIT_RATE_PATTERN.search(result.stdout)
+        if not bit_rate:
+            print('ERROR: Failed to find bit rate in output:')
+            print('--- stdout ---')
+            print(result.stdout)
+            print('------')
+            return None
+
+        signal = self.SIGNAL_PATTERN.search(result.stdout)
+        return WifiStatus(
+            bit_rate_Mbps=float(bit_rate.group(1)),
+            signal_dBm=float(signal.group(1)) if signal else None,
+        )
+
+    def close(self) -> None:
+        self._proc_file.close()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+def parse_proc_net_wireless(text: str, interface: str) -> Optional[float]:
+    """
+    Returns the signal level of ``interface``, in dBm, from the contents of
+    ``/proc/net/wireless``; ``None`` if it is not listed (not associated)::
+
+        Inter-| sta-|   Quality        |   Discarded packets               | Missed | WE
+         face | tus | link level noise |  nwid  crypt   frag  retry   misc | beacon | 22
+         wlan0: 0000   70.  -40.  -256        0      0      0      0      0        0
+    """
+
+    for line in text.splitlines()[2:]:
+        name, _, fields = line.partition(':')
+        if name.strip() == interface:
+            return float(fields.split()[2].rstrip('.'))
+
+    return None
+
+
+def main() -> int:
+    """Reads each probe repeatedly (no caching) and prints the result, time per read and subprocess calls."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interface', default='wlan0')
+    parser.add_argument('--reads', type=int, default=100)
+    args = parser.parse_args()
+
+    for probe in (ThrottlingProbe(ttl=0.), WifiProbe(args.interface, ttl=0.)):
+        t0 = time.perf_counter()
+        for _ in range(args.reads):
+            value = probe.get()
+        elapsed = time.perf_counter() - t0
+
+        print(f'{type(probe).__name__}: {value} {elapsed / args.reads * 1e6:.0f}us per read, '
+              f'subprocess_calls={probe.subprocess_calls}/{probe.reads}')
+        probe.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
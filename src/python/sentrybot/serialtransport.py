@@ -0,0 +1,210 @@
+"""
+Pipelined request/response transport over a packet connection to the motor
+controller.
+
+Each request packet starts with a one-byte request ID, which the firmware
+echoes at the start of its response, so several requests can be in flight at
+once and responses are matched to requests by ID rather than by order. ID 0 is
+never used for requests; it is reserved for packets the firmware sends on its
+own.
+
+Callers get a :class:`PendingRequest` back immediately: a future that can be
+waited on from a thread with ``result()``, or awaited from a coroutine. All
+serial I/O is done by the transport's own reader and writer threads.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Future
+from queue import Queue
+from threading import Lock, Semaphore, Thread
+from typing import Callable, Dict, Optional, Tuple
+
+UNSOLICITED_ID = 0
+
+_MAX_ID = 255
+
+
+class SerialTransportError(Exception):
+    pass
+
+
+class PendingRequest(Future):
+    """A ``concurrent.futures.Future`` that can also be awaited from any event loop."""
+
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
+
+
+def completed(result=None) -> PendingRequest:
+    """Returns a request that has already completed with ``result``."""
+
+    request = PendingRequest()
+    request.set_result(result)
+    return request
+
+
+class SerialTransport:
+    """
+    Sends requests over ``conn`` and matches responses to them by request ID.
+
+    ``conn`` must have ``write(data: bytes)``, and ``read() -> bytes``, which
+    returns one packet, or nothing if none arrived before the port's timeout.
+    Only the transport's threads may use it once the transport has started.
+    """
+
+    def __init__(
+            self,
+            conn,
+            max_in_flight: int = 4,
+            timeout: float = 1.,
+            on_unsolicited: Callable[[bytes], None] = None,
+    ):
+        """
+        :param max_in_flight: Requests sent but not yet answered, at most. Keep
+            their total size within the firmware's serial receive buffer.
+        :param timeout: Seconds to wait for a response before failing a request.
+        :param on_unsolicited: Called from the reader thread with the payload of
+            each packet the firmware sends on its own (with ID 0).
+        """
+
+        if not 1 <= max_in_flight < _MAX_ID:
+            raise ValueError(f'max_in_flight must be in [1, {_MAX_ID}); max_in_flight={max_in_flight}')
+
+        self.conn = conn
+        self.timeout = timeout
+        self.on_unsolicited = on_unsolicited
+
+        self.requests_sent = 0
+        self.requests_timed_out = 0
+        self.stray_responses = 0
+
+        self._queue: 'Queue[Optional[Tuple[bytes, PendingRequest]]]' = Queue()
+        self._in_flight = Semaphore(max_in_flight)
+        self._pending: Dict[int, Tuple[float, PendingRequest]] = {}
+        self._pending_lock = Lock()
+        self._last_id = UNSOLICITED_ID
+        self._closed = False
+
+        self._writer = Thread(target=self._write_loop, name='SerialTransportWriter', daemon=True)
+        self._reader = Thread(target=self._read_loop, name='SerialTransportReader', daemon=True)
+
+    def start(self) -> 'SerialTransport':
+        self._writer.start()
+        self._reader.start()
+        return self
+
+    def request(self, data: bytes) -> PendingRequest:
+        """
+        Queues ``data`` to be sent and returns without waiting. The result is the
+        response packet without its request ID.
+        """
+
+        request = PendingRequest()
+        if self._closed:
+            request.set_exception(SerialTransportError('Transport is closed'))
+        else:
+            self._queue.put((data, request))
+
+        return request
+
+    def close(self) -> None:
+        """Stops the transport; requests not yet answered fail."""
+
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        self._fail_pending(SerialTransportError('Transport is closed'))
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            data, request = item
+            if not request.set_running_or_notify_cancel():
+                continue
+
+            # Wait for room in the firmware's receive buffer; expired requests make room too
+            while not self._in_flight.acquire(timeout=self.timeout):
+                self._expire_pending()
+
+            with self._pending_lock:
+                request_id = self._next_id()
+                self._pending[request_id] = (time.monotonic() + self.timeout, request)
+
+            try:
+                self.conn.write(bytes((request_id,)) + data)
+                self.requests_sent += 1
+            except Exception as e:
+                self._complete(request_id, exception=SerialTransportError(f'Failed to send request: {e}'))
+
+    def _next_id(self) -> int:
+        request_id = self._last_id
+        while True:
+            request_id = request_id % _MAX_ID + 1
+            if request_id not in self._pending:
+                self._last_id = request_id
+                return request_id
+
+    def _read_loop(self) -> None:
+        while not self._closed:
+            try:
+                packet = self.conn.read()
+            except Exception as e:
+                if self._closed:
+                    return
+
+                print(f'ERROR: Failed to read from motor controller: {e}')
+                self._expire_pending()
+                time.sleep(self.timeout)
+                continue
+
+            if packet:
+                self._on_packet(packet)
+
+            self._expire_pending()
+
+    def _on_packet(self, packet: bytes) -> None:
+        request_id, payload = packet[0], packet[1:]
+
+        if request_id == UNSOLICITED_ID:
+            if self.on_unsolicited is not None:
+                self.on_unsolicited(payload)
+        elif not self._complete(request_id, result=payload):
+            # The request timed out before the response arrived
+            self.stray_responses += 1
+
+    def _complete(self, request_id: int, result: bytes = None, exception: Exception = None) -> bool:
+        with self._pending_lock:
+            entry = self._pending.pop(request_id, None)
+
+        if entry is None:
+            return False
+
+        self._in_flight.release()
+
+        _, request = entry
+        if exception is not None:
+            request.set_exception(exception)
+        else:
+            request.set_result(result)
+
+        return True
+
+    def _expire_pending(self) -> None:
+        now = time.monotonic()
+        with self._pending_lock:
+            expired = [request_id for request_id, (deadline, _) in self._pending.items() if deadline <= now]
+
+        for request_id in expired:
+            if self._complete(request_id, exception=SerialTransportError('Timed out waiting for response')):
+                self.requests_timed_out += 1
+
+    def _fail_pending(self, exception: Exception) -> None:
+        with self._pending_lock:
+            request_ids = list(self._pending)
+
+        for request_id in request_ids:
+            self._complete(request_id, exception=exception)
@@ -0,0 +1,434 @@
+"""
+Simulates the drive motor controller (``src/arduino/motor_control``) behind a
+pseudo-terminal, so the real client code, from ``SerialPackets`` framing up,
+can be run and measured off the robot.
+
+The client opens :attr:`MotorControllerSimulator.port` like the Arduino's
+serial port. Bytes between it and the simulated firmware pass through a
+:class:`SerialLink` in each direction, which delays them as a serial line at
+the given baud rate would, with optional jitter and dropped bytes. The
+firmware speaks the same opcodes and responses as ``motor_control.ino``, and
+drives a simple differential-drive model.
+
+Usage: python -m sentrybot.simulator [--baudrate 115200] [--jitter 0.001] [--drop-rate 0.0001]
+"""
+
+import argparse
+import os
+import random
+import select
+import sys
+import time
+import tty
+from collections import deque
+from math import cos, exp, sin
+from threading import Thread
+from typing import Deque, Optional, Tuple
+
+from sentrybot.geometry import trunc_angle
+from sentrybot.motorcontrol import Request, Response, TICKS_PER_METER, TRACK_WIDTH
+from sentrybot.serialtransport import UNSOLICITED_ID
+
+_ACK = Response.ACK[0]
+_NCK = Response.NCK[0]
+
+
+class SerialLink(Thread):
+    """
+    Copies bytes from file descriptor ``src`` to ``dst`` as a serial line would
+    deliver them: one byte every ``10 / baudrate`` seconds (8N1), each chunk
+    read from ``src`` held back by up to ``jitter`` more seconds, and each
+    byte lost with probability ``drop_rate``. Byte order is kept.
+    """
+
+    def __init__(
+            self,
+            src: int,
+            dst: int,
+            baudrate: int = 115200,
+            jitter: float = 0.,
+            drop_rate: float = 0.,
+            rng: random.Random = None,
+            name: str = 'SerialLink',
+            daemon: bool = True,
+            **kwargs
+    ):
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.src = src
+        self.dst = dst
+        self.byte_time = 10 / baudrate
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.rng = rng or random.Random()
+
+        self.bytes_delivered = 0
+        self.bytes_dropped = 0
+
+        self._in_flight: Deque[Tuple[float, int]] = deque()
+        self._line_free_at = 0.
+        self._closed = False
+
+    def close(self) -> None:
+        self._closed = True
+
+    def run(self) -> None:
+        while not self._closed:
+            timeout = 0.1
+            if self._in_flight:
+                timeout = max(0., self._in_flight[0][0] - time.monotonic())
+
+            readable, _, _ = select.select([self.src], [], [], timeout)
+            if readable:
+                try:
+                    data = os.read(self.src, 4096)
+                except OSError:
+                    # The other end was closed
+                    return
+
+                self._schedule(data)
+
+            self._deliver_due()
+
+    def _schedule(self, data: bytes) -> None:
+        now = time.monotonic()
+        start = max(self._line_free_at, now + self.rng.uniform(0, self.jitter))
+
+        for i, byte in enumerate(data):
+            if self.drop_rate and self.rng.random() < self.drop_rate:
+                self.bytes_dropped += 1
+                continue
+
+            self._in_flight.append((start + (i + 1) * self.byte_time, byte))
+
+        self._line_free_at = start + len(data) * self.byte_time
+
+    def _deliver_due(self) -> None:
+        now = time.monotonic()
+        due = bytearray()
+        while self._in_flight and self._in_flight[0][0] <= now:
+            due.append(self._in_flight.popleft()[1])
+
+        if due:
+            os.write(self.dst, due)
+            self.bytes_delivered += len(due)
+
+
+class DifferentialDriveModel:
+    """
+    Kinematics of the robot's differential drive: the body's velocities follow
+    their targets with a first-order lag, and the pose is integrated from them.
+    In heading mode, a proportional controller sets the angular velocity.
+    """
+
+    def __init__(
+            self,
+            track_width: float = TRACK_WIDTH,
+            ticks_per_meter: float = TICKS_PER_METER,
+            time_constant: float = 0.2,
+            heading_gain: float = 2.,
+            max_angular_velocity: float = 3.,
+    ):
+        """
+        :param track_width: Distance between the wheels, in meters.
+        :param time_constant: Seconds for the velocities to get ~63% of the way to their targets.
+        :param heading_gain: Angular velocity (rad/s) per radian of heading error.
+        """
+
+        self.track_width = track_width
+        self.ticks_per_meter = ticks_per_meter
+        self.time_constant = time_constant
+        self.heading_gain = heading_gain
+        self.max_angular_velocity = max_angular_velocity
+
+        self.x = 0.
+        self.y = 0.
+        self.yaw = 0.
+        self.linear = 0.
+        self.angular = 0.
+
+        self.target_linear = 0.
+        self.target_angular = 0.
+        self.target_heading: Optional[float] = None
+
+    def set_target_linear_velocity(self, linear: float) -> None:
+        self.target_linear = linear
+
+    def set_target_angular_velocity(self, angular: float) -> None:
+        self.target_heading = None
+        self.target_angular = angular
+
+    def set_target_heading(self, heading: float) -> None:
+        self.target_heading = heading
+
+    def stop(self) -> None:
+        self.target_linear = 0.
+        self.target_angular = 0.
+        self.target_heading = None
+
+    def update(self, dt: float) -> None:
+        if dt <= 0:
+            return
+
+        target_angular = self.target_angular
+        if self.target_heading is not None:
+            error = trunc_angle(self.target_heading - self.yaw)
+            target_angular = max(-self.max_angular_velocity, min(self.max_angular_velocity, self.heading_gain * error))
+
+        alpha = 1 - exp(-dt / self.time_constant)
+        self.linear += alpha * (self.target_linear - self.linear)
+        self.angular += alpha * (target_angular - self.angular)
+
+        self.yaw = trunc_angle(self.yaw + self.angular * dt)
+        self.x += self.linear * cos(self.yaw) * dt
+        self.y += self.linear * sin(self.yaw) * dt
+
+    def wheel_velocities(self) -> Tuple[float, float]:
+        """``(left, right)`` in ticks per second."""
+
+        angular = self.angular * self.track_width / 2
+        return (
+            (self.linear - angular) * self.ticks_per_meter,
+            (self.linear + angular) * self.ticks_per_meter,
+        )
+
+
+class SimulatedFirmware(Thread):
+    """
+    Handles packets like ``motor_control.ino``: each request is ``[request ID,
+    command, args...]`` and is answered with ``[request ID, ACK/NCK, data...]``;
+    telemetry, once enabled, is pushed with ID 0.
+    """
+
+    def __init__(
+            self,
+            port: str = None,
+            model: DifferentialDriveModel = None,
+            loop_period: float = 0.002,
+            battery_drain_per_s: float = 0.01,
+            host_timeout: float = 2.,
+            name: str = 'SimulatedFirmware',
+            daemon: bool = True,
+            **kwargs
+    ):
+        """
+        :param port: Serial port to serve on; the firmware is only driven through
+            :meth:`handle_packet` and :meth:`update` if ``None``.
+        :param loop_period: Seconds per pass through the firmware's loop, at most.
+        :param host_timeout: Seconds without any packet from the host before the motors are stopped.
+        """
+
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.port = port
+        self.model = model or DifferentialDriveModel()
+        self.loop_period = loop_period
+        self.battery_drain_per_s = battery_drain_per_s
+        self.host_timeout = host_timeout
+
+        self.battery_percent = 100.
+        self.telemetry_period: Optional[float] = None
+        self.packets_handled = 0
+        self.bad_packets = 0
+
+        self._start_time = time.monotonic()
+        self._last_update = self._start_time
+        self._next_telemetry = 0.
+        self._last_host_packet = self._start_time
+        self._host_lost = False
+        self._closed = False
+
+    def close(self) -> None:
+        self._closed = True
+
+    def run(self) -> None:
+        from serial import Serial
+        from serialpackets import SerialPackets
+
+        serial = Serial(port=self.port, timeout=self.loop_period)
+        conn = SerialPackets(serial)
+
+        while not self._closed:
+            try:
+                packet = conn.read()
+            except Exception:
+                # Framing broken by a dropped byte; the firmware would discard it too
+                self.bad_packets += 1
+                continue
+
+            if packet:
+                response = self.handle_packet(packet)
+                if response is not None:
+                    conn.write(response)
+
+            telemetry = self.update(time.monotonic())
+            if telemetry is not None:
+                conn.write(telemetry)
+
+        serial.close()
+
+    def handle_packet(self, packet: bytes) -> Optional[bytes]:
+        """Returns the response to a request packet, or ``None`` if it is too short to answer."""
+
+        if len(packet) < 2:
+            self.bad_packets += 1
+            return None
+
+        self.packets_handled += 1
+        self._last_host_packet = time.monotonic()
+        self._host_lost = False
+
+        request_id, command, args = packet[0], packet[1:2], packet[1:]
+        model = self.model
+
+        try:
+            if command == Request.HEARTBEAT:
+                pass
+            elif command == Request.GET_STATUS:
+                return bytes((request_id, _ACK, round(self.battery_percent)))
+            elif command == Request.SET_LINEAR_VELOCITY:
+                _, v_cm = Request.SET_LINEAR_VELOCITY_STRUCT.unpack(args)
+                model.set_target_linear_velocity(v_cm / 100)
+            elif command == Request.SET_ANGULAR_VELOCITY:
+                _, w_centirad = Request.SET_ANGULAR_VELOCITY_STRUCT.unpack(args)
+                model.set_target_angular_velocity(w_centirad / 100)
+            elif command == Request.SET_TARGET_HEADING:
+                _, heading_centirad = Request.SET_TARGET_HEADING_STRUCT.unpack(args)
+                model.set_target_heading(heading_centirad / 100)
+            elif command == Request.STOP:
+                model.stop()
+            elif command == Request.SET_BODY_VELOCITY:
+                _, v_cm, w_centirad = Request.SET_BODY_VELOCITY_STRUCT.unpack(args)
+                model.set_target_linear_velocity(v_cm / 100)
+                model.set_target_angular_velocity(w_centirad / 100)
+            elif command == Request.SET_TELEMETRY_PERIOD:
+                _, period_ms = Request.SET_TELEMETRY_PERIOD_STRUCT.unpack(args)
+                self.telemetry_period = period_ms / 1000 if period_ms else None
+            else:
+                return bytes((request_id, _NCK))
+        except Exception:
+            # Arguments of the wrong length
+            return bytes((request_id, _NCK))
+
+        return bytes((request_id, _ACK))
+
+    def update(self, now: float) -> Optional[bytes]:
+        """Advances the model to ``now``; returns a telemetry packet if one is due."""
+
+        dt = now - self._last_update
+        self._last_update = now
+        self.model.update(dt)
+        self.battery_percent = max(0., self.battery_percent - self.battery_drain_per_s * dt)
+
+        if not self._host_lost and now - self._last_host_packet > self.host_timeout:
+            self._host_lost = True
+            self.model.stop()
+
+        if self.telemetry_period is None or now < self._next_telemetry:
+            return None
+
+        self._next_telemetry = max(self._next_telemetry + self.telemetry_period, now)
+        return self.telemetry_packet(now)
+
+    def telemetry_packet(self, now: float) -> bytes:
+        model = self.model
+        left, right = model.wheel_velocities()
+
+        return bytes((UNSOLICITED_ID,)) + Response.TELEMETRY + Response.TELEMETRY_STRUCT.pack(
+            round((now - self._start_time) * 1000) & 0xffffffff,
+            _i16(left),
+            _i16(right),
+            _i16(model.linear * 1000),
+            _i16(model.angular * 1000),
+            0,
+            0,
+            _i16(model.yaw * 100),
+            round(self.battery_percent),
+        )
+
+
+def _i16(value: float) -> int:
+    return max(-32768, min(32767, round(value)))
+
+
+class MotorControllerSimulator:
+    """
+    Runs a :class:`SimulatedFirmware` behind a pseudo-terminal at :attr:`port`,
+    e.g. for ``DriveMotorController.connect(simulator.port)``.
+    """
+
+    def __init__(
+            self,
+            baudrate: int = 115200,
+            jitter: float = 0.,
+            drop_rate: float = 0.,
+            loop_period: float = 0.002,
+            seed: int = None,
+    ):
+        """
+        :param jitter: Extra delay of up to this many seconds for each chunk of bytes, in each direction.
+        :param drop_rate: Probability of each byte being lost, in each direction.
+        """
+
+        rng = random.Random(seed)
+
+        # Host <-> link <-> firmware, each side on its own pseudo-terminal
+        self._host_master, self._host_slave = _raw_pty()
+        self._firmware_master, self._firmware_slave = _raw_pty()
+        self.port = os.ttyname(self._host_slave)
+
+        self.to_firmware = SerialLink(
+            self._host_master, self._firmware_master, baudrate, jitter, drop_rate, rng, name='SerialLinkToFirmware')
+        self.to_host = SerialLink(
+            self._firmware_master, self._host_master, baudrate, jitter, drop_rate, rng, name='SerialLinkToHost')
+        self.firmware = SimulatedFirmware(os.ttyname(self._firmware_slave), loop_period=loop_period)
+
+    def start(self) -> 'MotorControllerSimulator':
+        self.to_firmware.start()
+        self.to_host.start()
+        self.firmware.start()
+        return self
+
+    def close(self) -> None:
+        self.firmware.close()
+        self.to_firmware.close()
+        self.to_host.close()
+
+        for thread in (self.firmware, self.to_firmware, self.to_host):
+            thread.join()
+
+        for fd in (self._host_master, self._host_slave, self._firmware_master, self._firmware_slave):
+            os.close(fd)
+
+
+def _raw_pty() -> Tuple[int, int]:
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    return master, slave
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--jitter', type=float, default=0., help='Seconds')
+    parser.add_argument('--drop-rate', type=float, default=0., help='Probability of losing each byte')
+    args = parser.parse_args()
+
+    simulator = MotorControllerSimulator(args.baudrate, args.jitter, args.drop_rate).start()
+    print(f'Simulated motor controller on {simulator.port}')
+
+    try:
+        while True:
+            time.sleep(5)
+            model = simulator.firmware.model
+            print(f'x={model.x:.2f} y={model.y:.2f} yaw={model.yaw:.2f} '
+                  f'linear={model.linear:.2f} angular={model.angular:.2f} '
+                  f'packets={simulator.firmware.packets_handled} bad={simulator.firmware.bad_packets}')
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        simulator.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
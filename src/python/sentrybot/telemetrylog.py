@@ -0,0 +1,311 @@
+"""
+Records what the drive system was told and did, for review after an incident:
+fixed-size binary records appended to memory-mapped log files, which
+:func:`load_log` reads back into NumPy arrays.
+
+Each file is a 32 B header followed by records (little-endian)::
+
+    header: magic (4 B), version (u16), record size (u16), record count (u64),
+            created (f64, Unix time), reserved (8 B)
+    record: see RECORD and RECORD_FIELDS
+
+Files are preallocated and mapped, so appending a record is a ``pack_into``
+into memory and an update of the header's count; the kernel writes the pages
+out in the background. After a crash, the count says how many records are
+complete.
+"""
+
+import mmap
+import os
+import sys
+import time
+from struct import Struct
+from threading import Event, Thread
+from typing import List, Optional
+
+from sentrybot.motorcontrol import DriveMotorController, DriveMotorControllerStatus
+from sentrybot.probes import ThrottlingProbe
+
+MAGIC = b'STL1'
+VERSION = 1
+HEADER = Struct('<4sHHQd8x')
+_COUNT = Struct('<Q')
+_COUNT_OFFSET = 8
+
+# Unknown values are NaN (floats), 255 (battery) or 0xffffffff (throttled)
+RECORD_FIELDS = [
+    ('time', '<f8', 'd'),                 # Unix time
+    ('seq', '<u4', 'I'),
+    ('commanded_linear', '<f4', 'f'),     # m/s
+    ('commanded_angular', '<f4', 'f'),    # rad/s; NaN while targeting a heading
+    ('target_heading', '<f4', 'f'),       # rad
+    ('left_velocity', '<f4', 'f'),        # m/s, from the controller's latest status
+    ('right_velocity', '<f4', 'f'),
+    ('linear_velocity', '<f4', 'f'),      # m/s
+    ('angular_velocity', '<f4', 'f'),     # rad/s
+    ('roll', '<f4', 'f'),                 # rad
+    ('pitch', '<f4', 'f'),
+    ('yaw', '<f4', 'f'),
+    ('status_age', '<f4', 'f'),           # s since the status was received
+    ('throttled', '<u4', 'I'),            # vcgencmd get_throttled bits
+    ('battery_percent', 'u1', 'B'),
+    ('_padding', 'V3', '3x'),
+]
+RECORD = Struct('<' + ''.join(code for _, _, code in RECORD_FIELDS))
+
+UNKNOWN_BATTERY = 255
+UNKNOWN_THROTTLED = 0xffffffff
+
+_NAN = float('nan')
+
+
+class TelemetryLogWriter:
+    """
+    Appends records to log files in ``directory``. A file is closed and a new
+    one started once ``max_file_bytes`` are used; the oldest files are then
+    deleted until at most ``max_total_bytes`` remain. Not thread-safe; use
+    from one thread.
+    """
+
+    def __init__(self, directory: str, max_file_bytes: int = 8 * 1024 * 1024, max_total_bytes: int = 256 * 1024 * 1024):
+        self.directory = os.path.expanduser(directory)
+        self.max_records = (max_file_bytes - HEADER.size) // RECORD.size
+        self.max_total_bytes = max_total_bytes
+
+        if self.max_records < 1:
+            raise ValueError(f'max_file_bytes is too small for a record; max_file_bytes={max_file_bytes}')
+
+        self.path: Optional[str] = None
+        self.count = 0
+        self.seq = 0
+
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def append(self, *values) -> None:
+        """Appends a record of ``values`` in ``RECORD_FIELDS`` order, from ``commanded_linear`` on."""
+
+        if self._map is None or self.count == self.max_records:
+            self._rotate()
+
+        RECORD.pack_into(self._map, HEADER.size + self.count * RECORD.size, time.time(), self.seq, *values)
+        self.count += 1
+        self.seq = (self.seq + 1) & 0xffffffff
+        _COUNT.pack_into(self._map, _COUNT_OFFSET, self.count)
+
+    def close(self) -> None:
+        if self._map is None:
+            return
+
+        size = HEADER.size + self.count * RECORD.size
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(size)
+        self._file.close()
+        self._map = self._file = None
+
+    def _rotate(self) -> None:
+        self.close()
+        self.apply_retention()
+
+        name = time.strftime('telemetry-%Y%m%d-%H%M%S')
+        path = os.path.join(self.directory, f'{name}.stl')
+        for i in range(1, 100):
+            if not os.path.exists(path):
+                break
+            path = os.path.join(self.directory, f'{name}-{i}.stl')
+
+        self.path = path
+        self.count = 0
+        self._file = open(path, 'w+b')
+        self._file.truncate(HEADER.size + self.max_records * RECORD.size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD.size, 0, time.time())
+
+    def apply_retention(self) -> None:
+        """Deletes the oldest log files until the rest fit in ``max_total_bytes``, counting a new file at its full size."""
+
+        logs = list_logs(self.directory)
+        total = sum(os.path.getsize(path) for path in logs) + HEADER.size + self.max_records * RECORD.size
+
+        for path in logs:
+            if total <= self.max_total_bytes:
+                break
+
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+
+class TelemetryRecorder(Thread):
+    """
+    Samples the drive system ``rate`` times per second and appends a record to
+    the log. It only reads attributes the controller already keeps up to date
+    (its last commands and the status it pushes), so it never touches the
+    serial port or holds up commands.
+    """
+
+    def __init__(
+            self,
+            motor_controller: DriveMotorController,
+            writer: TelemetryLogWriter,
+            rate: float = 50.,
+            throttling_period: float = 5.,
+            name: str = 'TelemetryRecorder',
+            daemon: bool = True,
+            **kwargs
+    ):
+        """
+        :param throttling_period: Seconds between reads of the throttling flags.
+        """
+
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.motor_controller = motor_controller
+        self.writer = writer
+        self.period = 1. / rate
+        self.throttling_probe = ThrottlingProbe(ttl=throttling_period)
+
+        self.records = 0
+        self.late = 0
+
+        self._stopping = Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self.join()
+
+    def run(self) -> None:
+        next_time = time.monotonic()
+
+        try:
+            while not self._stopping.wait(max(0., next_time - time.monotonic())):
+                now = time.monotonic()
+                self.record(now)
+
+                next_time += self.period
+                if next_time < now:
+                    # Fell behind; skip the missed samples rather than bursting
+                    self.late += 1
+                    next_time = now + self.period
+        finally:
+            self.writer.close()
+            self.throttling_probe.close()
+
+    def record(self, now: float) -> None:
+        throttled = self.throttling_probe.get()
+
+        motors = self.motor_controller
+        commanded_angular = motors.commanded_angular
+        target_heading = motors.target_heading
+        status: Optional[DriveMotorControllerStatus] = motors.status
+
+        if status is not None:
+            body = status.body
+            status_values = (
+                status.left_motor.velocity.meters_per_s,
+                status.right_motor.velocity.meters_per_s,
+                body.velocity.linear_meters_per_s,
+                body.velocity.angular_rad_per_s,
+                body.heading.roll,
+                body.heading.pitch,
+                body.heading.yaw,
+                now - status.timestamp,
+            )
+            battery_percent = status.battery_percent
+        else:
+            status_values = (_NAN,) * 8
+            battery_percent = UNKNOWN_BATTERY
+
+        self.writer.append(
+            motors.commanded_linear,
+            _NAN if commanded_angular is None else commanded_angular,
+            _NAN if target_heading is None else target_heading,
+            *status_values,
+            UNKNOWN_THROTTLED if throttled is None else throttled,
+            battery_percent,
+        )
+        self.records += 1
+
+
+def list_logs(directory: str) -> List[str]:
+    """Returns the paths of the log files in ``directory``, oldest first."""
+
+    directory = os.path.expanduser(directory)
+    paths = [
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith('telemetry-') and name.endswith('.stl')
+    ]
+
+    return sorted(paths, key=os.path.getmtime)
+
+
+def record_dtype():
+    import numpy as np
+    return np.dtype([(name, dtype) for name, dtype, _ in RECORD_FIELDS])
+
+
+def load_log(path: str):
+    """Returns the records in a log file as a NumPy structured array (see ``RECORD_FIELDS``)."""
+
+    import numpy as np
+
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    magic, version, record_size, count, _ = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f'Not a telemetry log this version can read; path={path!r} magic={magic!r} version={version}')
+
+    count = min(count, (len(data) - HEADER.size) // RECORD.size)
+    return np.frombuffer(data, dtype=record_dtype(), count=count, offset=HEADER.size)
+
+
+def load_logs(directory: str):
+    """Returns the records of every log file in ``directory``, oldest first, in one array."""
+
+    import numpy as np
+
+    logs = [load_log(path) for path in list_logs(directory)]
+    return np.concatenate(logs) if logs else np.empty(0, dtype=record_dtype())
+
+
+def dead_reckon(records, max_dt: float = 1.):
+    """
+    Returns arrays ``(x, y, yaw)`` of the pose at each record, dead reckoned
+    from the body velocities the controller reported, starting at the origin.
+    Gaps of more than ``max_dt`` seconds (e.g. between runs) are skipped.
+    """
+
+    from sentrybot.geometry import integrate_body_velocities
+
+    return integrate_body_velocities(
+        records['time'], records['linear_velocity'], records['angular_velocity'], max_dt=max_dt)
+
+
+def main() -> int:
+    """Prints a summary of the log files in a directory."""
+
+    import numpy as np
+
+    records = load_logs(sys.argv[1] if len(sys.argv) > 1 else '~/sentry-telemetry')
+    if not len(records):
+        print('No records')
+        return 0
+
+    duration = records['time'][-1] - records['time'][0]
+    print(f'{len(records)} records over {duration:.0f}s, from {time.ctime(records["time"][0])}')
+    print(f'max |commanded linear|: {np.nanmax(np.abs(records["commanded_linear"])):.2f} m/s')
+    print(f'max |linear velocity|: {np.nanmax(np.abs(records["linear_velocity"])):.2f} m/s')
+    x, y, _ = dead_reckon(records)
+    print(f'dead reckoned: {np.hypot(np.diff(x), np.diff(y)).sum():.1f} m travelled, '
+          f'ended {np.hypot(x[-1], y[-1]):.1f} m from the start')
+    print(f'min battery: {records["battery_percent"][records["battery_percent"] != UNKNOWN_BATTERY].min(initial=100)}%')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import time
+import unittest
+from threading import Event
+from unittest import TestCase
+
+from sentrybot.drivescheduler import DriveScheduler
+from sentrybot.serialtransport import PendingRequest, completed
+
+
+class BlockingMotorController:
+    """Records commands; the first one is not acknowledged until the test releases it."""
+
+    def __init__(self):
+        self.commands = []
+        self.sent = Event()
+        self.release = Event()
+
+    def _command(self, *command) -> PendingRequest:
+        self.commands.append(command)
+        self.sent.set()
+
+        self.release.wait(timeout=1)
+        return completed()
+
+    def stop(self) -> PendingRequest:
+        return self._command('stop')
+
+    def set_body_velocity(self, linear: float, rad: float = None) -> PendingRequest:
+        return self._command('drive', linear, rad)
+
+    def send_heartbeat(self) -> PendingRequest:
+        self.commands.append(('heartbeat',))
+        return completed()
+
+
+class DriveSchedulerTest(TestCase):
+    def setUp(self):
+        self.controller = BlockingMotorController()
+        self.scheduler = DriveScheduler(self.controller, max_rate=1000., heartbeat_interval=None)
+        self.scheduler.start()
+
+    def send_first(self):
+        self.scheduler.drive(0.1, 0.)
+        self.assertTrue(self.controller.sent.wait(timeout=1))
+
+    def release_and_wait_for(self, count: int):
+        self.controller.release.set()
+        for _ in range(100):
+            if self.scheduler.sent + self.scheduler.failed >= count:
+                break
+            time.sleep(0.01)
+
+    def test_only_newest_setpoint_is_sent(self):
+        self.send_first()
+
+        for i in range(5):
+            self.scheduler.drive(0.2, float(i))
+
+        self.release_and_wait_for(2)
+        self.assertEqual([('drive', 0.1, 0.), ('drive', 0.2, 4.)], self.controller.commands)
+        self.assertEqual(4, self.scheduler.coalesced)
+
+    def test_stop_discards_earlier_setpoint(self):
+        self.send_first()
+
+        self.scheduler.drive(0.2, 1.)
+        self.scheduler.stop()
+        self.scheduler.drive(0.3, 0.)
+
+        self.release_and_wait_for(3)
+        self.assertEqual([('drive', 0.1, 0.), ('stop',), ('drive', 0.3, 0.)], self.controller.commands)
+        self.assertEqual(3, self.scheduler.stats()['sent'])
+
+
+class DeadmanAndHeartbeatTest(TestCase):
+    def setUp(self):
+        self.controller = BlockingMotorController()
+        self.controller.release.set()
+
+    def test_stops_when_drive_commands_stop_arriving(self):
+        scheduler = DriveScheduler(self.controller, deadman_timeout=0.05, heartbeat_interval=None)
+        scheduler.start()
+
+        scheduler.drive(0.1, 0.)
+        time.sleep(0.2)
+
+        self.assertEqual([('drive', 0.1, 0.), ('stop',)], self.controller.commands)
+        self.assertEqual(1, scheduler.deadman_stops)
+
+    def test_heartbeats_only_when_idle(self):
+        scheduler = DriveScheduler(self.controller, deadman_timeout=None, heartbeat_interval=0.05)
+        scheduler.start()
+
+        for _ in range(10):
+            scheduler.drive(0.1, 0.)
+            time.sleep(0.01)
+
+        self.assertNotIn(('heartbeat',), self.controller.commands[1:])
+
+        time.sleep(0.2)
+        stats = scheduler.stats()['heartbeat']
+        self.assertGreaterEqual(stats['sent'], 3)
+        self.assertIsNotNone(stats['rtt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
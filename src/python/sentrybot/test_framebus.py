@@ -0,0 +1,83 @@
+import os
+import unittest
+from unittest import TestCase
+
+from sentrybot.framebus import FrameBusReader, FrameBusWriter
+
+
+class FrameBusTest(TestCase):
+    def setUp(self):
+        self.name = f'sentry-frames-test-{os.getpid()}'
+        self.writer = FrameBusWriter(self.name, num_slots=3, slot_size=16)
+        self.reader = FrameBusReader(self.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+
+    def test_reader_sees_latest_frame(self):
+        self.assertIsNone(self.reader.latest())
+
+        self.writer.publish(b'one', timestamp=1.)
+        self.writer.publish(b'two', timestamp=2.)
+        frame = self.reader.latest()
+
+        self.assertEqual(2, frame.seq)
+        self.assertEqual(2., frame.timestamp)
+        self.assertEqual(b'two', bytes(frame.data))
+
+    def test_frame_is_invalid_once_slot_is_reused(self):
+        self.writer.publish(b'one')
+        frame = self.reader.latest()
+
+        self.writer.publish(b'two')
+        self.writer.publish(b'three')
+        self.assertTrue(frame.is_valid())
+
+        self.writer.publish(b'four')
+        self.assertFalse(frame.is_valid())
+        self.assertIsNone(frame.to_bytes())
+        self.assertIsNone(self.reader.get(1))
+
+    def test_close_with_frames_alive(self):
+        self.writer.publish(b'one')
+        frame = self.reader.latest()
+        data = frame.data[1:]
+
+        self.reader.close()
+
+        self.assertFalse(frame.is_valid())
+        self.assertIsNone(frame.to_bytes())
+        self.assertEqual(b'ne', bytes(data))
+
+    def test_retracted_frame_is_invalid(self):
+        self.writer.publish(b'one')
+        seq = self.writer.publish(b'two')
+        frame = self.reader.latest()
+
+        self.writer.retract(seq)
+
+        self.assertFalse(frame.is_valid())
+        self.assertIsNone(self.reader.get(seq))
+        self.assertEqual(b'one', self.reader.latest().to_bytes())
+
+    def test_too_large_frame_is_dropped(self):
+        self.assertEqual(0, self.writer.publish(bytes(17)))
+        self.assertEqual(1, self.writer.frames_too_large)
+        self.assertEqual(0, self.reader.latest_seq)
+
+    def test_reading_marks_readers_active(self):
+        self.assertFalse(self.writer.readers_active(within=10.))
+
+        self.reader.latest()
+
+        self.assertTrue(self.writer.readers_active(within=10.))
+
+    def test_wait_for_newer_times_out(self):
+        self.writer.publish(b'one')
+        self.assertIsNone(self.reader.wait_for_newer(1, timeout=0.01))
+        self.assertEqual(1, self.reader.wait_for_newer(0, timeout=0.01).seq)
+
+
+if __name__ == '__main__':
+    unittest.main()
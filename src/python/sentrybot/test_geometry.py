@@ -2,9 +2,14 @@ import unittest
 from math import pi
 from unittest import TestCase
 
+import numpy as np
 from parameterized import parameterized
 
-from sentrybot.geometry import trunc_angle
+from sentrybot.geometry import Pose, PoseIntegrator, angle_difference, angle_differences, integrate_body_velocities, \
+    integrate_wheel_velocities, trunc_angle, trunc_angles
+
+# Seeds for the property tests; each draws its own random inputs
+SEEDS = [(seed,) for seed in range(5)]
 
 
 class GeometryTest(TestCase):
@@ -21,6 +26,66 @@ class GeometryTest(TestCase):
         result = trunc_angle(angle)
         self.assertAlmostEqual(expected, result)
 
+    @parameterized.expand(SEEDS)
+    def test_trunc_angles_matches_trunc_angle(self, seed: int):
+        angles = np.random.default_rng(seed).uniform(-100, 100, 1000)
+        angles[:4] = (pi, -pi, 0., 2 * pi)
+
+        result = trunc_angles(angles)
+
+        self.assertEqual([trunc_angle(angle) for angle in angles], result.tolist())
+
+    @parameterized.expand(SEEDS)
+    def test_angle_differences(self, seed: int):
+        rng = np.random.default_rng(seed)
+        a = rng.uniform(-10, 10, 1000)
+        b = rng.uniform(-10, 10, 1000)
+
+        result = angle_differences(a, b)
+
+        # In range, the same rotation as a - b, and the same as the scalar version
+        self.assertTrue(((-pi <= result) & (result < pi)).all())
+        np.testing.assert_allclose(0., np.sin((a - b - result) / 2), atol=1e-9)
+        self.assertEqual([angle_difference(x, y) for x, y in zip(a, b)], result.tolist())
+
+    def test_integrates_circle(self):
+        # Once around a circle of radius 1 m, at 1 rad/s
+        t = np.linspace(0, 2 * pi, 101)
+        x, y, yaw = integrate_body_velocities(t, np.ones_like(t), np.ones_like(t))
+
+        np.testing.assert_allclose(np.sin(t), x, atol=1e-9)
+        np.testing.assert_allclose(1 - np.cos(t), y, atol=1e-9)
+        np.testing.assert_allclose(0., np.sin((yaw - t) / 2), atol=1e-9)
+
+    @parameterized.expand(SEEDS)
+    def test_batch_matches_incremental(self, seed: int):
+        rng = np.random.default_rng(seed)
+        t = np.cumsum(rng.exponential(0.02, 500))
+        t[100] += 5.  # A gap, which is skipped
+        left = rng.uniform(-0.5, 0.5, 500)
+        right = rng.uniform(-0.5, 0.5, 500)
+        left[200:210] = np.nan
+        start = Pose(1., -2., 3.)
+
+        x, y, yaw = integrate_wheel_velocities(t, left, right, 0.22, pose=start)
+
+        integrator = PoseIntegrator(pose=start, track_width=0.22)
+        poses = [integrator.add_wheel_velocities(*sample) for sample in zip(t, left, right)]
+        np.testing.assert_allclose([pose.x for pose in poses], x, atol=1e-9)
+        np.testing.assert_allclose([pose.y for pose in poses], y, atol=1e-9)
+        np.testing.assert_allclose(0., np.sin(([pose.yaw for pose in poses] - yaw) / 2), atol=1e-9)
+
+    @parameterized.expand(SEEDS)
+    def test_spinning_in_place_does_not_move(self, seed: int):
+        rng = np.random.default_rng(seed)
+        t = np.cumsum(rng.uniform(0.001, 0.1, 200))
+        speed = rng.uniform(-1, 1, 200)
+
+        x, y, _ = integrate_wheel_velocities(t, -speed, speed, 0.22)
+
+        np.testing.assert_allclose(0., x, atol=1e-12)
+        np.testing.assert_allclose(0., y, atol=1e-12)
+
 
 if __name__ == '__main__':
     unittest.main()
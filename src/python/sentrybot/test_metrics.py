@@ -0,0 +1,55 @@
+import time
+import unittest
+from unittest import TestCase
+
+from sentrybot.metrics import Metric, MetricsCollector, Tier, TierBuffer
+
+
+class TierBufferTest(TestCase):
+    def test_downsamples_into_buckets(self):
+        buffer = TierBuffer(Tier('1m', span=60., resolution=10.))
+        for t, value in ((1000., 1.), (1005., 3.), (1012., 5.)):
+            buffer.add(t, value)
+
+        history = buffer.read(now=1015.)
+
+        self.assertEqual([1000., 1010.], history['time'])
+        self.assertEqual([2., 5.], history['mean'])
+        self.assertEqual([1., 5.], history['min'])
+        self.assertEqual([3., 5.], history['max'])
+
+    def test_keeps_only_span(self):
+        buffer = TierBuffer(Tier('1m', span=60., resolution=10.))
+        for t in range(1000, 1200, 10):
+            buffer.add(float(t), float(t))
+
+        history = buffer.read(now=1195.)
+
+        self.assertEqual([1140., 1150., 1160., 1170., 1180., 1190.], history['time'])
+        self.assertEqual(history['time'], history['mean'])
+        self.assertEqual(4 * 6 * 8, buffer.memory_bytes())
+
+
+class MetricsCollectorTest(TestCase):
+    def test_samples_each_metric_on_its_period(self):
+        fast = Metric(['fast'], 0.01, lambda: [1.])
+        slow = Metric(['slow_a', 'slow_b'], 0.1, lambda: [2., None])
+        collector = MetricsCollector([fast, slow], tiers=[Tier('1m', 60., 1.)])
+
+        memory_bytes = collector.memory_bytes()
+        collector.start()
+        time.sleep(0.25)
+        collector.stop()
+
+        self.assertGreater(collector.reads[0], 5 * collector.reads[1])
+        self.assertEqual(2., collector.latest('slow_a'))
+        self.assertIsNone(collector.latest('slow_b'))
+        self.assertEqual(memory_bytes, collector.memory_bytes())
+
+        history = collector.history('1m', ['fast', 'slow_b'])
+        self.assertEqual([1.] * len(history['series']['fast']['mean']), history['series']['fast']['mean'])
+        self.assertEqual([], history['series']['slow_b']['time'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import time
+import unittest
+from struct import pack
+from unittest import TestCase
+
+from sentrybot.motorcontrol import DriveMotorController, Request
+from sentrybot.serialtransport import SerialTransport, UNSOLICITED_ID
+from sentrybot.test_serialtransport import FakeConn
+
+
+class DriveMotorControllerTest(TestCase):
+    def setUp(self):
+        self.conn = FakeConn()
+        self.transport = SerialTransport(self.conn, timeout=0.5).start()
+        self.motor_controller = DriveMotorController(self.transport, ticks_per_meter=1000)
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_status_from_pushed_telemetry(self):
+        self.assertIsNone(self.motor_controller.status)
+
+        self.conn.responses.put(
+            bytes((UNSOLICITED_ID,)) + b'\x01'
+            + pack('>IhhhhhhhB', 1234, 500, -500, 0, -1500, 5, -10, 314, 87)
+        )
+
+        for _ in range(100):
+            if self.motor_controller.status is not None:
+                break
+            time.sleep(0.01)
+
+        status = self.motor_controller.status
+        self.assertEqual(87, status.battery_percent)
+        self.assertEqual((500, 0.5), (status.left_motor.velocity.ticks_per_s, status.left_motor.velocity.meters_per_s))
+        self.assertEqual(-0.5, status.right_motor.velocity.meters_per_s)
+        self.assertEqual(-1.5, status.body.velocity.angular_rad_per_s)
+        self.assertEqual((0.05, -0.1, 3.14), (status.body.heading.roll, status.body.heading.pitch, status.body.heading.yaw))
+        self.assertLessEqual(status.timestamp, time.monotonic())
+
+    def test_set_telemetry_rate(self):
+        self.motor_controller.set_telemetry_rate(20)
+
+        packet = self.conn.written.get(timeout=1)
+        self.assertEqual(Request.set_telemetry_period(50), packet[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
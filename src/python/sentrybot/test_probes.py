@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from sentrybot.probes import ThrottlingProbe, WifiProbe, parse_proc_net_wireless
+
+PROC_NET_WIRELESS = '''\
+Inter-| sta-|   Quality        |   Discarded packets               | Missed | WE
+ face | tus | link level noise |  nwid  crypt   frag  retry   misc | beacon | 22
+ wlan0: 0000   70.  -40.  -256        0      0      0      0      0        0
+'''
+
+
+class ProbesTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'get_throttled')
+
+    def test_reads_sysfs_without_subprocess(self):
+        with open(self.path, 'w') as file:
+            file.write('50005\n')
+
+        probe = ThrottlingProbe(ttl=0., path=self.path, command=('false',))
+        self.assertEqual(0x50005, probe.get())
+
+        # The same open file is re-read
+        with open(self.path, 'w') as file:
+            file.write('0\n')
+        self.assertEqual(0, probe.get())
+        self.assertEqual(0, probe.subprocess_calls)
+        probe.close()
+
+    def test_caches_for_ttl(self):
+        with open(self.path, 'w') as file:
+            file.write('1\n')
+
+        probe = ThrottlingProbe(ttl=60., path=self.path)
+        for _ in range(10):
+            self.assertEqual(1, probe.get())
+
+        self.assertEqual(1, probe.reads)
+        probe.close()
+
+    def test_falls_back_to_subprocess(self):
+        probe = ThrottlingProbe(ttl=0., path=self.path, command=('echo', 'throttled=0x50000'))
+        self.assertEqual(0x50000, probe.get())
+        self.assertEqual(1, probe.subprocess_calls)
+
+        wifi_probe = WifiProbe(
+            'sentrytest0',
+            ttl=0.,
+            command=('echo', 'sentrytest0  Bit Rate=72.2 Mb/s   Tx-Power=31 dBm\nLink Quality=70/70  Signal level=-40 dBm'),
+        )
+        wifi = wifi_probe.get()
+        self.assertEqual(72.2, wifi.bit_rate_Mbps)
+        self.assertEqual(-40., wifi.signal_dBm)
+        self.assertEqual(1, wifi_probe.subprocess_calls)
+        wifi_probe.close()
+
+    def test_missing_fallback_is_not_retried(self):
+        probe = ThrottlingProbe(ttl=0., path=self.path, command=('sentry-no-such-command',))
+        self.assertIsNone(probe.get())
+        self.assertIsNone(probe.get())
+        self.assertEqual(1, probe.subprocess_calls)
+
+    def test_parse_proc_net_wireless(self):
+        self.assertEqual(-40., parse_proc_net_wireless(PROC_NET_WIRELESS, 'wlan0'))
+        self.assertIsNone(parse_proc_net_wireless(PROC_NET_WIRELESS, 'wlan1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+from queue import Empty, Queue
+from unittest import TestCase
+
+from sentrybot.serialtransport import SerialTransport, SerialTransportError
+
+
+class FakeConn:
+    """Records written packets; responses are queued by the test to be read."""
+
+    def __init__(self):
+        self.written = Queue()
+        self.responses = Queue()
+
+    def write(self, data: bytes) -> None:
+        self.written.put(data)
+
+    def read(self) -> bytes:
+        try:
+            return self.responses.get(timeout=0.01)
+        except Empty:
+            return b''
+
+
+class SerialTransportTest(TestCase):
+    def setUp(self):
+        self.conn = FakeConn()
+        self.unsolicited = []
+        self.transport = SerialTransport(
+            self.conn,
+            max_in_flight=2,
+            timeout=0.2,
+            on_unsolicited=self.unsolicited.append,
+        ).start()
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_responses_matched_by_id_out_of_order(self):
+        first = self.transport.request(b'\x01')
+        second = self.transport.request(b'\x02')
+
+        first_id, second_id = self.conn.written.get(timeout=1)[0], self.conn.written.get(timeout=1)[0]
+        self.assertNotEqual(first_id, second_id)
+
+        self.conn.responses.put(bytes((second_id,)) + b'\x00two')
+        self.conn.responses.put(bytes((0,)) + b'event')
+        self.conn.responses.put(bytes((first_id,)) + b'\x00one')
+
+        self.assertEqual(b'\x00one', first.result(timeout=1))
+        self.assertEqual(b'\x00two', second.result(timeout=1))
+        self.assertEqual([b'event'], self.unsolicited)
+
+    def test_in_flight_limit_and_timeout(self):
+        requests = [self.transport.request(bytes((i,))) for i in range(3)]
+
+        # The third request waits for room until the first two time out
+        self.conn.written.get(timeout=1)
+        self.conn.written.get(timeout=1)
+        self.assertTrue(self.conn.written.empty())
+
+        for request in requests[:2]:
+            self.assertRaises(SerialTransportError, request.result, timeout=1)
+
+        third_id = self.conn.written.get(timeout=1)[0]
+        self.conn.responses.put(bytes((third_id,)) + b'\x00')
+        self.assertEqual(b'\x00', requests[2].result(timeout=1))
+        self.assertEqual(2, self.transport.requests_timed_out)
+
+    def test_await(self):
+        async def request():
+            pending = self.transport.request(b'\x01')
+            request_id = await asyncio.get_running_loop().run_in_executor(None, self.conn.written.get)
+            self.conn.responses.put(request_id[:1] + b'\x00')
+            return await pending
+
+        self.assertEqual(b'\x00', asyncio.run(request()))
+
+
+if __name__ == '__main__':
+    unittest.main()
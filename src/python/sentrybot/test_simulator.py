@@ -0,0 +1,76 @@
+import os
+import time
+import unittest
+from math import pi
+from types import SimpleNamespace
+from unittest import TestCase
+
+from sentrybot.motorcontrol import DriveMotorController, Request, Response
+from sentrybot.simulator import DifferentialDriveModel, SerialLink, SimulatedFirmware
+
+
+class SerialLinkTest(TestCase):
+    def test_delivers_bytes_at_baud_rate(self):
+        src_read, src_write = os.pipe()
+        dst_read, dst_write = os.pipe()
+        link = SerialLink(src_read, dst_write, baudrate=10000)
+        link.start()
+
+        t0 = time.monotonic()
+        os.write(src_write, bytes(range(50)))
+
+        received = b''
+        while len(received) < 50:
+            received += os.read(dst_read, 50)
+
+        # 10 bits per byte at 10 kbaud is 1 ms per byte
+        self.assertEqual(bytes(range(50)), received)
+        self.assertGreaterEqual(time.monotonic() - t0, 0.045)
+
+        link.close()
+        link.join()
+        for fd in (src_read, src_write, dst_read, dst_write):
+            os.close(fd)
+
+
+class SimulatedFirmwareTest(TestCase):
+    def setUp(self):
+        self.firmware = SimulatedFirmware(host_timeout=10.)
+
+    def test_echoes_request_id(self):
+        self.assertEqual(bytes((7,)) + Response.ACK, self.firmware.handle_packet(b'\x07' + Request.stop()))
+        self.assertEqual(bytes((8,)) + Response.NCK, self.firmware.handle_packet(b'\x08\x7f'))
+        self.assertEqual(bytes((9,)) + Response.ACK + b'\x64', self.firmware.handle_packet(b'\x09' + Request.get_status()))
+
+    def test_drives_and_reports_telemetry(self):
+        self.firmware.handle_packet(b'\x01' + Request.set_body_velocity(0.5, 1.))
+        self.firmware.handle_packet(b'\x02' + Request.set_telemetry_period(100))
+
+        now = time.monotonic()
+        telemetry = [self.firmware.update(now + i * 0.01) for i in range(1, 201)]
+        telemetry = [packet for packet in telemetry if packet is not None]
+        self.assertAlmostEqual(20, len(telemetry), delta=1)
+
+        model = self.firmware.model
+        self.assertAlmostEqual(0.5, model.linear, places=3)
+        self.assertAlmostEqual(1., model.angular, places=3)
+
+        status = DriveMotorController(SimpleNamespace()).decode_telemetry(telemetry[-1][2:], now)
+        self.assertAlmostEqual(0.5, status.body.velocity.linear_meters_per_s, places=2)
+        self.assertGreater(status.right_motor.velocity.ticks_per_s, status.left_motor.velocity.ticks_per_s)
+
+
+class DifferentialDriveModelTest(TestCase):
+    def test_turns_to_target_heading(self):
+        model = DifferentialDriveModel()
+        model.set_target_heading(pi / 2)
+
+        for _ in range(1000):
+            model.update(0.01)
+
+        self.assertAlmostEqual(pi / 2, model.yaw, places=2)
+        self.assertAlmostEqual(0., model.x)
+
+
+if __name__ == '__main__':
+    unittest.main()
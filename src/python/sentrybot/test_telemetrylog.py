@@ -0,0 +1,74 @@
+import math
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import TestCase
+
+from sentrybot.motorcontrol import BodyHeading, BodyStatus, BodyVelocity, DriveMotorControllerStatus, MotorStatus, \
+    MotorVelocity
+from sentrybot.telemetrylog import HEADER, RECORD, UNKNOWN_BATTERY, TelemetryLogWriter, TelemetryRecorder, \
+    list_logs, load_log, load_logs
+
+
+class TelemetryLogTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_rotates_and_loads(self):
+        writer = TelemetryLogWriter(self.directory.name, max_file_bytes=HEADER.size + 10 * RECORD.size)
+        values = [0.] * 11 + [0, 50]
+        for i in range(25):
+            values[0] = i / 10
+            writer.append(*values)
+        writer.close()
+
+        logs = list_logs(self.directory.name)
+        self.assertEqual(3, len(logs))
+        self.assertEqual(HEADER.size + 5 * RECORD.size, os.path.getsize(logs[-1]))
+        self.assertEqual(10, len(load_log(logs[0])))
+
+        records = load_logs(self.directory.name)
+        self.assertEqual(list(range(25)), records['seq'].tolist())
+        self.assertAlmostEqual(2.4, records['commanded_linear'][-1], places=5)
+        self.assertTrue((records['battery_percent'] == 50).all())
+
+    def test_retention_deletes_oldest(self):
+        file_bytes = HEADER.size + 10 * RECORD.size
+        writer = TelemetryLogWriter(self.directory.name, max_file_bytes=file_bytes, max_total_bytes=3 * file_bytes)
+        for i in range(100):
+            writer.append(*[0.] * 11, 0, 0)
+        writer.close()
+
+        records = load_logs(self.directory.name)
+        self.assertEqual(list(range(70, 100)), records['seq'].tolist())
+
+    def test_records_unknowns(self):
+        status = DriveMotorControllerStatus(
+            left_motor=MotorStatus(MotorVelocity(620, 0.1)),
+            right_motor=MotorStatus(MotorVelocity(620, 0.1)),
+            body=BodyStatus(BodyVelocity(0.1, 0.), BodyHeading(0., 0., 1.5)),
+            battery_percent=80,
+            timestamp=0.,
+        )
+        motors = SimpleNamespace(commanded_linear=0.1, commanded_angular=None, target_heading=1.5, status=None)
+        writer = TelemetryLogWriter(self.directory.name)
+        recorder = TelemetryRecorder(motors, writer)
+
+        recorder.record(1.)
+        motors.status = status
+        recorder.record(1.25)
+        writer.close()
+
+        first, second = load_logs(self.directory.name)
+        self.assertTrue(math.isnan(first['commanded_angular']))
+        self.assertTrue(math.isnan(first['yaw']))
+        self.assertEqual(UNKNOWN_BATTERY, first['battery_percent'])
+        self.assertAlmostEqual(1.5, second['target_heading'], places=5)
+        self.assertAlmostEqual(1.25, second['status_age'], places=5)
+        self.assertEqual(80, second['battery_percent'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import time
+import unittest
+from math import radians
+from unittest import TestCase
+
+from sentrybot.motorcontrol import DriveMotorController
+from sentrybot.serialtransport import SerialTransport
+from sentrybot.simulator import SimulatedFirmware
+from sentrybot.trajectory import ROUTINES, Step, Trajectory, TrajectoryExecutor
+
+
+class FirmwareConn:
+    """Answers packets with a simulated firmware, after ``delay`` seconds."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.firmware = SimulatedFirmware()
+        self.responses = []
+
+    def write(self, data: bytes) -> None:
+        time.sleep(self.delay)
+        self.responses.append(self.firmware.handle_packet(data))
+
+    def read(self) -> bytes:
+        # The firmware's loop, which also stops the motors if the host goes quiet
+        self.firmware.update(time.monotonic())
+
+        if self.responses:
+            return self.responses.pop(0)
+
+        time.sleep(0.001)
+        return b''
+
+
+class TrajectoryExecutorTest(TestCase):
+    def setUp(self):
+        self.conn = FirmwareConn(delay=0.005)
+        self.transport = SerialTransport(self.conn).start()
+        self.motors = DriveMotorController(self.transport)
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_steps_do_not_drift(self):
+        trajectory = Trajectory(
+            setup=[Step(0, heading=0)],
+            steps=[Step(0.02, linear=0.1, heading_change=radians(10))],
+            repeat=10,
+        )
+
+        t0 = time.monotonic()
+        timings = TrajectoryExecutor(self.motors).run(trajectory)
+
+        # The commands' round trips do not push back later steps
+        self.assertAlmostEqual(0.2, time.monotonic() - t0, delta=0.03)
+        self.assertEqual(11, len(timings))
+        self.assertAlmostEqual(0.18, timings[-1].scheduled)
+        self.assertLess(max(timing.issue_error for timing in timings), 0.02)
+
+        time.sleep(0.05)
+        self.assertTrue(all(timing.ack_error is not None for timing in timings))
+        self.assertAlmostEqual(radians(100), self.conn.firmware.model.target_heading, places=1)
+
+    def test_long_step_keeps_driving(self):
+        trajectory = Trajectory(steps=[Step(2.5, linear=0.2)])
+
+        executor = TrajectoryExecutor(self.motors)
+        executor.run(trajectory)
+
+        # Longer than the firmware's host timeout
+        self.assertGreater(2.5, self.conn.firmware.host_timeout)
+        self.assertEqual(2, executor.heartbeats_sent)
+        self.assertAlmostEqual(0.2, self.conn.firmware.model.linear, places=2)
+
+    def test_routines(self):
+        self.assertEqual(64, len(ROUTINES['test3'].steps))
+        self.assertEqual(30, sum(step.duration for step in ROUTINES['test3'].steps))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,299 @@
+"""
+Runs timed sequences of drive setpoints (trajectories) on the motor controller.
+
+Every step is scheduled against the time the trajectory started, on the
+monotonic clock, rather than after the previous step's command returns, so
+serial round trips and late wake-ups never accumulate: a late step delays only
+itself. The timing error of each step is recorded.
+
+The firmware stops the motors if it hears nothing from the host for 2 s, so
+heartbeats are sent during steps longer than that.
+
+Usage: python -m sentrybot.trajectory <routine> [--port /dev/ttyACM0]
+"""
+
+import argparse
+import sys
+import time
+from dataclasses import dataclass, field
+from math import radians
+from threading import Event
+from typing import Dict, List, Optional
+
+from sentrybot.motorcontrol import DriveMotorController
+from sentrybot.serialtransport import PendingRequest
+
+
+@dataclass
+class Step:
+    """
+    Setpoints to send at the start of the step, which lasts ``duration``
+    seconds. A step with no setpoints just waits.
+    """
+
+    duration: float
+    linear: Optional[float] = None
+    """Linear velocity in meters per second."""
+    angular: Optional[float] = None
+    """Angular velocity in radians per second."""
+    heading: Optional[float] = None
+    """Heading (yaw) to maintain, in radians."""
+    heading_change: Optional[float] = None
+    """Change to the heading being maintained, in radians."""
+    stop: bool = False
+    label: str = ''
+
+    def send(self, motors: DriveMotorController) -> List[PendingRequest]:
+        requests = []
+
+        if self.stop:
+            requests.append(motors.stop())
+
+        if self.linear is not None and self.angular is not None:
+            requests.append(motors.set_body_velocity(self.linear, rad=self.angular))
+        elif self.linear is not None:
+            requests.append(motors.set_linear_velocity(self.linear))
+        elif self.angular is not None:
+            requests.append(motors.set_angular_velocity(rad=self.angular))
+
+        if self.heading is not None:
+            requests.append(motors.set_target_heading(rad=self.heading))
+
+        if self.heading_change is not None:
+            requests.append(motors.change_target_heading(rad=self.heading_change))
+
+        return requests
+
+
+@dataclass
+class Trajectory:
+    """``setup`` steps run once, then ``steps`` run ``repeat`` times (forever if ``None``)."""
+
+    steps: List[Step]
+    repeat: Optional[int] = 1
+    setup: List[Step] = field(default_factory=list)
+
+
+@dataclass
+class StepTiming:
+    index: int
+    label: str
+    scheduled: float
+    """Seconds after the trajectory started that the step was due."""
+    issue_error: float
+    """Seconds late the step's commands were sent."""
+    ack_error: Optional[float] = None
+    """Seconds late the controller had acknowledged them all; ``None`` until then, or if any failed."""
+
+
+class TrajectoryExecutor:
+    def __init__(self, motors: DriveMotorController, heartbeat_interval: Optional[float] = 1., verbose: bool = False):
+        """
+        :param heartbeat_interval: Seconds without any command before a heartbeat
+            is sent; well within the firmware's host timeout. ``None`` for no
+            heartbeats.
+        """
+
+        self.motors = motors
+        self.heartbeat_interval = heartbeat_interval
+        self.verbose = verbose
+
+        self.timings: List[StepTiming] = []
+        self.heartbeats_sent = 0
+
+        self._stop = Event()
+        self._last_sent = 0.
+
+    def stop(self) -> None:
+        """Stops the running trajectory at its next step. Safe to call from any thread."""
+        self._stop.set()
+
+    def run(self, trajectory: Trajectory) -> List[StepTiming]:
+        """Runs the trajectory until it ends or :meth:`stop` is called; returns the timing of each step."""
+
+        self._stop.clear()
+        self.timings = []
+        self.heartbeats_sent = 0
+
+        start = time.monotonic()
+        offset = 0.
+        self._last_sent = start
+
+        for step in self._steps(trajectory):
+            if self._wait_until(start + offset):
+                break
+
+            self._run_step(step, start, offset)
+            offset += step.duration
+
+        # Let the last step run its course
+        self._wait_until(start + offset)
+
+        return self.timings
+
+    def _wait_until(self, deadline: float) -> bool:
+        """Waits until ``deadline``, sending heartbeats meanwhile; returns ``True`` if stopped first."""
+
+        while True:
+            now = time.monotonic()
+            wait = deadline - now
+            if self.heartbeat_interval is not None:
+                heartbeat_wait = self._last_sent + self.heartbeat_interval - now
+                if heartbeat_wait <= 0:
+                    # Not waited on, so a slow heartbeat never delays a step
+                    self.motors.send_heartbeat()
+                    self._last_sent = now
+                    self.heartbeats_sent += 1
+                    continue
+
+                if heartbeat_wait < wait:
+                    if self._stop.wait(heartbeat_wait):
+                        return True
+                    continue
+
+            return self._stop.wait(max(0., wait))
+
+    @staticmethod
+    def _steps(trajectory: Trajectory):
+        yield from trajectory.setup
+
+        repetition = 0
+        while trajectory.repeat is None or repetition < trajectory.repeat:
+            yield from trajectory.steps
+            repetition += 1
+
+    def _run_step(self, step: Step, start: float, offset: float) -> None:
+        deadline = start + offset
+        requests = step.send(self.motors)
+        if requests:
+            self._last_sent = time.monotonic()
+
+        timing = StepTiming(
+            index=len(self.timings),
+            label=step.label,
+            scheduled=offset,
+            issue_error=time.monotonic() - deadline,
+        )
+        self.timings.append(timing)
+
+        remaining = [len(requests)]
+
+        def on_done(request: PendingRequest) -> None:
+            if request.exception() is not None:
+                remaining[0] = -1
+                return
+
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                timing.ack_error = time.monotonic() - deadline
+                if self.verbose:
+                    self._print(timing)
+
+        if not requests:
+            timing.ack_error = timing.issue_error
+            if self.verbose:
+                self._print(timing)
+
+        for request in requests:
+            request.add_done_callback(on_done)
+
+    @staticmethod
+    def _print(timing: StepTiming) -> None:
+        print(f'step {timing.index} {timing.label!r} at {timing.scheduled:.2f}s: '
+              f'sent {timing.issue_error * 1e3:+.1f}ms, acked {timing.ack_error * 1e3:+.1f}ms')
+
+
+def _turns(parts: int, direction: int) -> List[Step]:
+    return [Step(15 / parts, heading_change=direction * radians(360 / parts)) for _ in range(parts)]
+
+
+# Test routines for driving on the floor
+ROUTINES: Dict[str, Trajectory] = dict(
+    # Drive around a room, turning at the corners
+    test0=Trajectory(
+        setup=[Step(0, heading=0)],
+        steps=[
+            Step(12, linear=0.2),
+            Step(2, linear=0., heading_change=radians(-45)),
+            Step(5.5, linear=0.2),
+            Step(2, linear=0., heading_change=radians(-45)),
+            Step(8, linear=0.2),
+            Step(3, linear=0., heading_change=radians(-90)),
+        ],
+        repeat=None,
+    ),
+    # The same, turning without stopping
+    test1=Trajectory(
+        setup=[Step(0, heading=0, linear=0.2)],
+        steps=[
+            Step(12.5),
+            Step(5.5, heading_change=radians(-45)),
+            Step(8.5, heading_change=radians(-45)),
+            Step(0, heading_change=radians(-90)),
+        ],
+        repeat=None,
+    ),
+    # Turn around in place, back and forth
+    test2=Trajectory(
+        setup=[Step(0, heading=0)],
+        steps=[
+            Step(5, heading_change=radians(180)),
+            Step(5, heading_change=radians(-180)),
+        ],
+        repeat=None,
+    ),
+    # Drive in circles by changing heading in small increments, alternating direction
+    test3=Trajectory(
+        setup=[Step(0, heading=0, linear=0.3)],
+        steps=_turns(32, 1) + _turns(32, -1),
+        repeat=None,
+    ),
+    # Drive in circles by angular velocity, alternating direction
+    test4=Trajectory(
+        setup=[Step(0, linear=0.2)],
+        steps=[
+            Step(15, angular=radians(360 / 15)),
+            Step(15, angular=radians(-360 / 15)),
+        ],
+        repeat=None,
+    ),
+    test5=Trajectory(
+        steps=[
+            Step(3, linear=0.1, label='forward'),
+            Step(3, linear=-0.1, label='backward'),
+        ],
+        repeat=None,
+    ),
+    test6=Trajectory(
+        setup=[Step(0, linear=0.)],
+        steps=[
+            Step(2, heading=0, label='target'),
+            Step(10, stop=True, label='stop'),
+        ],
+        repeat=None,
+    ),
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('routine', choices=sorted(ROUTINES))
+    parser.add_argument('--port', default='/dev/ttyACM0')
+    args = parser.parse_args()
+
+    motors = DriveMotorController.connect(args.port)
+    executor = TrajectoryExecutor(motors, verbose=True)
+
+    try:
+        executor.run(ROUTINES[args.routine])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print('stop')
+        motors.stop().result()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
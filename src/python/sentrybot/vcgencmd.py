@@ -13,22 +13,17 @@ THROTTLING_OCCURRED = 1 << 18
 TEMP_LIMIT_OCCURRED = 1 << 19
 
 
-def get_throttled() -> 'ThrottlingResult':
+def get_throttled_flags() -> int:
+    """Returns the raw bits of ``vcgencmd get_throttled``; see the ``IS_*`` and ``*_OCCURRED`` masks."""
+
     throttling = subprocess.check_output(GET_THROTTLED, text=True)
     throttling = throttling.partition('=')[2]
     throttling = throttling.strip()
-    throttling = int(throttling, 0)
+    return int(throttling, 0)
 
-    return ThrottlingResult(
-        is_under_voltage=bool(throttling & IS_UNDER_VOLTAGE),
-        is_freq_capped=bool(throttling & IS_FREQ_CAPPED),
-        is_throttled=bool(throttling & IS_THROTTLED),
-        is_temp_limit=bool(throttling & IS_TEMP_LIMIT),
-        under_voltage_occurred=bool(throttling & UNDER_VOLTAGE_OCCURRED),
-        freq_cap_occurred=bool(throttling & FREQ_CAP_OCCURRED),
-        throttling_occurred=bool(throttling & THROTTLING_OCCURRED),
-        temp_limit_occurred=bool(throttling & TEMP_LIMIT_OCCURRED),
-    )
+
+def get_throttled() -> 'ThrottlingResult':
+    return ThrottlingResult.from_flags(get_throttled_flags())
 
 
 @dataclass
@@ -41,3 +36,16 @@ class ThrottlingResult:
     freq_cap_occurred: bool
     throttling_occurred: bool
     temp_limit_occurred: bool
+
+    @staticmethod
+    def from_flags(throttling: int) -> 'ThrottlingResult':
+        return ThrottlingResult(
+            is_under_voltage=bool(throttling & IS_UNDER_VOLTAGE),
+            is_freq_capped=bool(throttling & IS_FREQ_CAPPED),
+            is_throttled=bool(throttling & IS_THROTTLED),
+            is_temp_limit=bool(throttling & IS_TEMP_LIMIT),
+            under_voltage_occurred=bool(throttling & UNDER_VOLTAGE_OCCURRED),
+            freq_cap_occurred=bool(throttling & FREQ_CAP_OCCURRED),
+            throttling_occurred=bool(throttling & THROTTLING_OCCURRED),
+            temp_limit_occurred=bool(throttling & TEMP_LIMIT_OCCURRED),
+        )
@@ -0,0 +1,266 @@
+import itertools
+import time
+from collections import deque
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from camera import CameraCapturer, Subscription
+from frames import Frame
+
+
+class AdaptiveStreams:
+    """
+    A ladder of streams, best first, that clients are moved along to keep
+    each client's latency within ``latency_budget``.
+
+    Tracks the active :class:`AdaptiveClient` objects so their stats can be
+    reported.
+    """
+
+    def __init__(
+            self,
+            ladder: Sequence[Tuple[str, CameraCapturer]],
+            latency_budget: float = 0.5,
+            min_framerate: float = 1.,
+    ):
+        """
+        :param ladder: ``(name, capturer)`` pairs, from best to lowest quality.
+        :param latency_budget: Target capture-to-sent latency in seconds.
+        :param min_framerate: The lowest frame rate a client is throttled to on the last rung.
+        """
+
+        if not ladder:
+            raise ValueError('ladder must not be empty')
+
+        self.ladder = list(ladder)
+        self.latency_budget = latency_budget
+        self.min_framerate = min_framerate
+
+        self._clients: Set['AdaptiveClient'] = set()
+        self._clients_lock = Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def capturers(self) -> List[CameraCapturer]:
+        return [capturer for _, capturer in self.ladder]
+
+    def client(self, address: str = None) -> 'AdaptiveClient':
+        return AdaptiveClient(self, next(self._ids), address)
+
+    def stats(self) -> List[Dict]:
+        with self._clients_lock:
+            clients = list(self._clients)
+
+        return [client.stats() for client in sorted(clients, key=lambda c: c.id)]
+
+    def _add(self, client: 'AdaptiveClient') -> None:
+        with self._clients_lock:
+            self._clients.add(client)
+
+    def _remove(self, client: 'AdaptiveClient') -> None:
+        with self._clients_lock:
+            self._clients.discard(client)
+
+
+class AdaptiveClient:
+    """
+    Closed-loop quality and frame rate control for one client.
+
+    After each frame is sent, :meth:`on_sent` measures the capture-to-sent
+    latency (which includes any send backlog) and the drain rate. If the
+    smoothed latency is over budget, the client steps down the ladder, and
+    once on the last rung, halves its frame rate. When latency has stayed well
+    under budget for a while, it steps back up, but only to a rung whose
+    bitrate the measured drain rate can carry.
+    """
+
+    SMOOTHING = 0.3
+    """Weight of the newest sample in the latency and drain rate moving averages."""
+
+    RECOVER_FRACTION = 0.5
+    """Latency must stay below this fraction of the budget before stepping up."""
+
+    RECOVER_FRAMES = 10
+    HOLD_FRAMES = 3
+    """Frames to wait after a change before judging its effect."""
+
+    BITRATE_WINDOW = 2.
+
+    def __init__(self, streams: AdaptiveStreams, id: int, address: Optional[str]):
+        self.streams = streams
+        self.id = id
+        self.address = address
+
+        self.rung = 0
+        self.frame_interval = 0.
+        self.latency: Optional[float] = None
+        self.drain_rate: Optional[float] = None
+        self.backlog = 0
+
+        self._subscription: Optional[Subscription] = None
+        self._next_frame_time = 0.
+        self._good_frames = 0
+        self._hold_frames = 0
+        self._sent = deque()
+        self._sent_bytes = 0
+
+    def __enter__(self) -> 'AdaptiveClient':
+        self._subscribe()
+        self.streams._add(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @property
+    def stream_name(self) -> str:
+        return self.streams.ladder[self.rung][0]
+
+    @property
+    def capturer(self) -> CameraCapturer:
+        return self.streams.ladder[self.rung][1]
+
+    @property
+    def subscription(self) -> Subscription:
+        return self._subscription
+
+    @property
+    def max_frame_interval(self) -> float:
+        return 1. / self.streams.min_framerate
+
+    def close(self) -> None:
+        self.streams._remove(self)
+
+        if self._subscription is not None:
+            self._subscription.close()
+            self._subscription = None
+
+    def frame_delay(self) -> float:
+        """Returns the seconds until this client's frame rate allows another frame."""
+        return max(0., self._next_frame_time - time.monotonic())
+
+    def next_frame(self) -> Frame:
+        """Blocks until the next frame is due and available, then returns it."""
+
+        time.sleep(self.frame_delay())
+
+        frame = None
+        while frame is None:
+            frame = self._subscription.next(timeout=1.)
+
+        return frame
+
+    def on_sent(self, frame: Frame, send_time: float, backlog: int = 0) -> None:
+        """
+        :param frame: The frame that was just sent.
+        :param send_time: Seconds spent writing/draining the frame.
+        :param backlog: Bytes that were still queued for the client before draining.
+        """
+
+        self._subscription.mark_sent()
+
+        now = time.monotonic()
+        size = len(frame.part)
+
+        self._next_frame_time = now + self.frame_interval
+        self.backlog = backlog
+
+        self.latency = self._smooth(self.latency, now - frame.timestamp)
+        if send_time > 0:
+            self.drain_rate = self._smooth(self.drain_rate, size / send_time)
+
+        self._sent.append((now, size))
+        self._sent_bytes += size
+        while self._sent[0][0] < now - self.BITRATE_WINDOW:
+            self._sent_bytes -= self._sent.popleft()[1]
+
+        self._adapt()
+
+    def bitrate(self) -> float:
+        """Bits per second sent to the client recently."""
+
+        if len(self._sent) < 2:
+            return 0.
+
+        span = max(self._sent[-1][0] - self._sent[0][0], 1e-3)
+        return 8 * (self._sent_bytes - self._sent[0][1]) / span
+
+    def stats(self) -> Dict:
+        return dict(
+            id=self.id,
+            address=self.address,
+            stream=self.stream_name,
+            quality=self.capturer.quality,
+            resize=self.capturer.resize,
+            framerate_limit=1. / self.frame_interval if self.frame_interval else None,
+            bitrate_bps=round(self.bitrate()),
+            drain_rate_Bps=round(self.drain_rate) if self.drain_rate is not None else None,
+            latency_s=round(self.latency, 4) if self.latency is not None else None,
+            backlog_bytes=self.backlog,
+            frames_skipped=self._subscription.skipped if self._subscription else 0,
+        )
+
+    def _adapt(self) -> None:
+        if self._hold_frames > 0:
+            self._hold_frames -= 1
+            return
+
+        budget = self.streams.latency_budget
+
+        if self.latency > budget:
+            self._good_frames = 0
+            self._step_down()
+        elif self.latency < budget * self.RECOVER_FRACTION:
+            self._good_frames += 1
+            if self._good_frames >= self.RECOVER_FRAMES:
+                self._good_frames = 0
+                self._step_up()
+        else:
+            self._good_frames = 0
+
+    def _step_down(self) -> None:
+        if self.rung < len(self.streams.ladder) - 1:
+            self._set_rung(self.rung + 1)
+        elif self.frame_interval < self.max_frame_interval:
+            self.frame_interval = min(max(2 * self.frame_interval, 0.1), self.max_frame_interval)
+            self._changed()
+
+    def _step_up(self) -> None:
+        if self.frame_interval > 0:
+            self.frame_interval = self.frame_interval / 2 if self.frame_interval > 0.1 else 0.
+            self._changed()
+        elif self.rung > 0 and self._can_carry(self.rung - 1):
+            self._set_rung(self.rung - 1)
+
+    def _can_carry(self, rung: int) -> bool:
+        """Returns True if the measured drain rate can carry the given rung at its frame rate."""
+
+        if self.drain_rate is None:
+            return True
+
+        capturer = self.streams.ladder[rung][1]
+        frame = capturer.frames.latest()
+        framerate = getattr(capturer.camera, 'framerate', None)
+        if frame is None or not framerate:
+            return True
+
+        return len(frame.part) * float(framerate) < self.drain_rate * self.RECOVER_FRACTION
+
+    def _set_rung(self, rung: int) -> None:
+        self.rung = rung
+        self._subscription.close()
+        self._subscribe()
+        self._changed()
+
+    def _subscribe(self) -> None:
+        self._subscription = self.capturer.subscribe(client=self.address)
+
+    def _changed(self) -> None:
+        self.latency = None
+        self._hold_frames = self.HOLD_FRAMES
+
+    def _smooth(self, average: Optional[float], sample: float) -> float:
+        if average is None:
+            return sample
+
+        return average + self.SMOOTHING * (sample - average)
@@ -0,0 +1,496 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import sys
+import time
+from asyncio import StreamReader, StreamWriter
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, unquote
+
+from flask import Flask
+from flask_simplelogin import is_logged_in
+
+import snapshot
+from adaptive import AdaptiveClient, AdaptiveStreams
+from camera import CameraCapturer
+from frames import Frame
+from h264 import H264Capturer
+
+MAX_REQUEST_HEAD_LEN = 16 * 1024
+# Requests with bodies are only ever small form posts (e.g. logging in); bodies are
+# read before the login check, so this bounds what an anonymous client can make us buffer
+MAX_REQUEST_BODY_LEN = 64 * 1024
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WEBSOCKET_TEXT = 0x1
+WEBSOCKET_BINARY = 0x2
+WEBSOCKET_CLOSE = 0x8
+WEBSOCKET_PING = 0x9
+WEBSOCKET_PONG = 0xA
+WEBSOCKET_MESSAGE_TOO_BIG = 1009
+MAX_WEBSOCKET_CONTROL_LEN = 125
+
+
+class _RequestError(Exception):
+    """A request that is answered with ``status`` and not handled further."""
+
+    def __init__(self, status: str):
+        super().__init__(status)
+        self.status = status
+
+
+class AsyncStreamServer:
+    """
+    Serves the MJPEG streams of one or more :class:`CameraCapturer` objects to
+    every viewer from a single asyncio event loop, instead of one OS thread
+    per viewer.
+
+    Stream routes are served by the event loop once the viewer passes the same
+    ``SimpleLogin`` session check as the Flask app. Everything else (including
+    the login page, and stream requests that fail the check) is handed to the
+    Flask app, which runs in the loop's default executor.
+
+    :class:`H264Capturer` streams are served as fragmented MP4 over a WebSocket.
+
+    Snapshot routes are also served by the event loop, so a long-polling client
+    waiting for the next frame costs no thread.
+    """
+
+    def __init__(
+            self,
+            app: Flask,
+            streams: Dict[str, Union[CameraCapturer, AdaptiveStreams, H264Capturer]],
+            snapshots: Dict[str, CameraCapturer] = None,
+            snapshot_max_wait: float = 10.,
+    ):
+        """
+        :param app: The Flask app; used for session checks and all non-stream routes.
+        :param streams: Maps each stream's URL path to the capturer that feeds it, or to
+            the adaptive ladder each of its clients is fed from.
+        :param snapshots: Maps each snapshot's URL path to the capturer it is taken from.
+        :param snapshot_max_wait: Longest a ``?wait_newer_than=`` request waits for a new frame, in seconds.
+        """
+
+        self.app = app
+        self.streams = streams
+        self.snapshots = snapshots or {}
+        self.snapshot_max_wait = snapshot_max_wait
+
+        self.clients = 0
+
+        # Per capturer, so only the viewers of the capturer that published wake up
+        self._new_frame: Dict[Union[CameraCapturer, H264Capturer], asyncio.Condition] = {}
+
+    def run(self, host: str, port: int) -> None:
+        asyncio.run(self.serve_forever(host, port))
+
+    async def serve_forever(self, host: str, port: int) -> None:
+        loop = asyncio.get_running_loop()
+
+        capturers = set(self.snapshots.values())
+        for source in self.streams.values():
+            capturers.update(source.capturers if isinstance(source, AdaptiveStreams) else [source])
+
+        for capturer in capturers:
+            self._new_frame[capturer] = asyncio.Condition()
+
+            def on_frame(_frame: Frame = None, capturer=capturer) -> None:
+                loop.call_soon_threadsafe(self._notify_new_frame, capturer)
+
+            capturer.add_listener(on_frame)
+
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f'Async stream server listening on {host}:{port}')
+
+        async with server:
+            await server.serve_forever()
+
+    def _notify_new_frame(self, capturer: Union[CameraCapturer, H264Capturer]) -> None:
+        new_frame = self._new_frame[capturer]
+
+        async def notify():
+            async with new_frame:
+                new_frame.notify_all()
+
+        asyncio.ensure_future(notify())
+
+    async def _handle_connection(self, reader: StreamReader, writer: StreamWriter) -> None:
+        try:
+            try:
+                request = await _read_request(reader)
+            except _RequestError as e:
+                writer.write(f'HTTP/1.1 {e.status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'.encode())
+                await writer.drain()
+                return
+
+            if request is None:
+                return
+
+            method, path, query, headers, body = request
+            source = self.streams.get(path)
+            snapshot_source = self.snapshots.get(path)
+
+            peername = writer.get_extra_info('peername') or ('',)
+            client = str(peername[0])
+
+            if method == 'GET' and snapshot_source is not None and self._is_logged_in(path, headers):
+                await self._snapshot(snapshot_source, writer, query, headers, client)
+            elif method == 'GET' and source is not None and self._is_logged_in(path, headers):
+                if isinstance(source, H264Capturer):
+                    await self._stream_h264_websocket(source, reader, writer, headers)
+                elif isinstance(source, AdaptiveStreams):
+                    await self._stream_adaptive(source.client(client), writer)
+                else:
+                    await self._stream(source, writer, client)
+            elif isinstance(source, H264Capturer):
+                writer.write(b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                await writer.drain()
+            else:
+                await self._call_app(writer, method, path, query, headers, body)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    def _is_logged_in(self, path: str, headers: List[Tuple[str, str]]) -> bool:
+        with self.app.test_request_context(path, headers=headers):
+            return is_logged_in()
+
+    def _start_stream(self, capturer: CameraCapturer, writer: StreamWriter) -> None:
+        writer.write(
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: ' + capturer.frames.framing.mimetype.encode() + b'\r\n'
+            b'Cache-Control: no-cache, private\r\n'
+            b'Connection: close\r\n'
+            b'\r\n'
+        )
+
+        # Only move on to the next frame once the previous one is fully sent, so
+        # the transport never holds on to a ring slot's memory for long.
+        writer.transport.set_write_buffer_limits(high=0)
+
+    async def _wait_for_newer(self, capturer: CameraCapturer, seq: int) -> None:
+        new_frame = self._new_frame[capturer]
+        async with new_frame:
+            await new_frame.wait_for(lambda: capturer.frames.latest_seq > seq)
+
+    async def _stream(self, capturer: CameraCapturer, writer: StreamWriter, client: str = None) -> None:
+        self._start_stream(capturer, writer)
+
+        self.clients += 1
+        try:
+            with capturer.subscribe(client) as subscription:
+                while True:
+                    await self._wait_for_newer(capturer, subscription.seq)
+
+                    frame = subscription.next(timeout=0)
+                    if frame is None:
+                        continue
+
+                    writer.write(frame.part)
+                    await writer.drain()
+                    subscription.mark_sent()
+
+                    # The slot was reused while this (very slow) viewer was still
+                    # reading it, so what it received may be corrupt.
+                    if not frame.is_valid():
+                        return
+        finally:
+            self.clients -= 1
+
+    async def _snapshot(
+            self,
+            capturer: CameraCapturer,
+            writer: StreamWriter,
+            query: str,
+            headers: List[Tuple[str, str]],
+            client: str = None,
+    ) -> None:
+        try:
+            wait_newer_than = snapshot.parse_wait_newer_than(parse_qs(query).get('wait_newer_than', [None])[0])
+        except ValueError:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+            return
+
+        # Subscribing wakes the camera if it is paused, and then waits for a fresh frame
+        with capturer.subscribe(client) as subscription:
+            subscription.seq = snapshot.start_seq(subscription.seq, wait_newer_than, capturer.frames.latest_seq)
+
+            try:
+                await asyncio.wait_for(self._wait_for_newer(capturer, subscription.seq), self.snapshot_max_wait)
+            except asyncio.TimeoutError:
+                pass
+
+            frame = subscription.next(timeout=0) or capturer.frames.latest()
+
+        if frame is None:
+            writer.write(b'HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\n'
+                         b'Connection: close\r\n\r\n')
+            await writer.drain()
+            return
+
+        not_modified = snapshot.is_not_modified(_get_header(headers, 'If-None-Match'), frame)
+
+        head = ['HTTP/1.1 304 Not Modified' if not_modified else 'HTTP/1.1 200 OK']
+        head.extend(f'{name}: {value}' for name, value in snapshot.headers(frame))
+        if not not_modified:
+            head.append('Content-Type: image/jpeg')
+            head.append(f'Content-Length: {len(frame)}')
+        head.append('Connection: close')
+
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        if not not_modified:
+            # As for streams, wait until the image is fully sent
+            writer.transport.set_write_buffer_limits(high=0)
+            writer.write(frame.data)
+
+        await writer.drain()
+
+        # The slot was reused while the image was still being sent, so what the
+        # client received may be corrupt; cut it off short of Content-Length.
+        if not not_modified and not frame.is_valid():
+            writer.transport.abort()
+
+    async def _stream_adaptive(self, client: AdaptiveClient, writer: StreamWriter) -> None:
+        self._start_stream(client.capturer, writer)
+
+        self.clients += 1
+        try:
+            with client:
+                while True:
+                    await asyncio.sleep(client.frame_delay())
+
+                    # The client may change rung (and so subscription) after any frame
+                    subscription = client.subscription
+                    await self._wait_for_newer(client.capturer, subscription.seq)
+
+                    frame = subscription.next(timeout=0)
+                    if frame is None:
+                        continue
+
+                    t0 = time.monotonic()
+                    writer.write(frame.part)
+                    backlog = writer.transport.get_write_buffer_size()
+                    await writer.drain()
+                    client.on_sent(frame, time.monotonic() - t0, backlog)
+
+                    if not frame.is_valid():
+                        return
+        finally:
+            self.clients -= 1
+
+    async def _stream_h264_websocket(
+            self,
+            capturer: H264Capturer,
+            reader: StreamReader,
+            writer: StreamWriter,
+            headers: List[Tuple[str, str]],
+    ) -> None:
+        key = _get_header(headers, 'Sec-WebSocket-Key')
+        if key is None or (_get_header(headers, 'Upgrade') or '').lower() != 'websocket':
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+            return
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n'
+            '\r\n'
+        ).encode())
+
+        # The client only ever sends control frames; stop streaming when it closes
+        closed = asyncio.ensure_future(_read_websocket_until_close(reader, writer))
+
+        self.clients += 1
+        capturer.subscribe()
+        try:
+            while capturer.init_segment is None and not closed.done():
+                await self._wait_for_h264(capturer, capturer.latest_seq, closed)
+
+            # Closed before the first key frame
+            if closed.done():
+                return
+
+            # Start with the cached GOP so playback begins at the latest key frame
+            codec, init_segment, fragments = capturer.start_fragments()
+            _write_websocket(writer, WEBSOCKET_TEXT, json.dumps(dict(codec=codec)).encode())
+            _write_websocket(writer, WEBSOCKET_BINARY, init_segment)
+
+            seq = 0
+            while not closed.done():
+                if not fragments:
+                    await self._wait_for_h264(capturer, capturer.latest_seq, closed)
+                    fragments = capturer.fragments_after(seq) if seq else capturer.start_fragments()[2]
+                    continue
+
+                for seq, _, data in fragments:
+                    _write_websocket(writer, WEBSOCKET_BINARY, data)
+
+                await writer.drain()
+                fragments = capturer.fragments_after(seq)
+        finally:
+            capturer.unsubscribe()
+            self.clients -= 1
+            closed.cancel()
+
+    async def _wait_for_h264(self, capturer: H264Capturer, seq: int, closed: asyncio.Future) -> None:
+        new_frame = asyncio.ensure_future(self._wait_for_h264_fragment(capturer, seq))
+        await asyncio.wait((new_frame, closed), return_when=asyncio.FIRST_COMPLETED)
+        new_frame.cancel()
+
+    async def _wait_for_h264_fragment(self, capturer: H264Capturer, seq: int) -> None:
+        new_frame = self._new_frame[capturer]
+        async with new_frame:
+            await new_frame.wait_for(lambda: capturer.latest_seq > seq)
+
+    async def _call_app(
+            self,
+            writer: StreamWriter,
+            method: str,
+            path: str,
+            query: str,
+            headers: List[Tuple[str, str]],
+            body: bytes,
+    ) -> None:
+        sockname = writer.get_extra_info('sockname') or ('', 0)
+        peername = writer.get_extra_info('peername') or ('', 0)
+
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': str(sockname[0]),
+            'SERVER_PORT': str(sockname[1]),
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': str(peername[0]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = value
+
+        loop = asyncio.get_running_loop()
+        status, response_headers, response_body = await loop.run_in_executor(None, self._call_wsgi, environ)
+
+        head = [f'HTTP/1.1 {status}']
+        head.extend(f'{name}: {value}' for name, value in response_headers if name.lower() != 'connection')
+        if not any(name.lower() == 'content-length' for name, _ in response_headers):
+            head.append(f'Content-Length: {len(response_body)}')
+        head.append('Connection: close')
+
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        writer.write(response_body)
+        await writer.drain()
+
+    def _call_wsgi(self, environ: dict) -> Tuple[str, List[Tuple[str, str]], bytes]:
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+
+        result = self.app(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+        return response['status'], response['headers'], body
+
+
+def _get_header(headers: List[Tuple[str, str]], name: str) -> Optional[str]:
+    name = name.lower()
+    return next((value for key, value in headers if key.lower() == name), None)
+
+
+def _write_websocket(writer: StreamWriter, opcode: int, payload: bytes) -> None:
+    length = len(payload)
+
+    if length < 126:
+        header = bytes((0x80 | opcode, length))
+    elif length < 1 << 16:
+        header = bytes((0x80 | opcode, 126)) + length.to_bytes(2, 'big')
+    else:
+        header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, 'big')
+
+    writer.write(header)
+    writer.write(payload)
+
+
+def _unmask(payload: bytes, mask: bytes) -> bytes:
+    length = len(payload)
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+
+async def _read_websocket_until_close(reader: StreamReader, writer: StreamWriter) -> None:
+    try:
+        while True:
+            head = await reader.readexactly(2)
+            opcode = head[0] & 0x0F
+            length = head[1] & 0x7F
+
+            # Clients only send control frames, which are at most 125 bytes long (RFC 6455 5.5)
+            if length > MAX_WEBSOCKET_CONTROL_LEN:
+                _write_websocket(writer, WEBSOCKET_CLOSE, WEBSOCKET_MESSAGE_TOO_BIG.to_bytes(2, 'big'))
+                return
+
+            mask = await reader.readexactly(4) if head[1] & 0x80 else bytes(4)
+            payload = _unmask(await reader.readexactly(length), mask)
+
+            if opcode == WEBSOCKET_CLOSE:
+                _write_websocket(writer, WEBSOCKET_CLOSE, payload[:2])
+                return
+            elif opcode == WEBSOCKET_PING:
+                _write_websocket(writer, WEBSOCKET_PONG, payload)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        return
+
+
+async def _read_request(reader: StreamReader) -> Optional[Tuple[str, str, str, List[Tuple[str, str]], bytes]]:
+    head = await reader.readuntil(b'\r\n\r\n')
+    if len(head) > MAX_REQUEST_HEAD_LEN:
+        return None
+
+    request_line, *header_lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = request_line.split(' ', 2)
+    except ValueError:
+        return None
+
+    path, _, query = target.partition('?')
+
+    headers = []
+    for line in header_lines:
+        if line:
+            name, _, value = line.partition(':')
+            headers.append((name.strip(), value.strip()))
+
+    content_length = _get_header(headers, 'Content-Length') or '0'
+    if not content_length.isdigit():
+        raise _RequestError('400 Bad Request')
+
+    content_length = int(content_length)
+    if content_length > MAX_REQUEST_BODY_LEN:
+        raise _RequestError('413 Payload Too Large')
+
+    body = await reader.readexactly(content_length) if content_length else b''
+
+    return method, unquote(path), query, headers, body
@@ -0,0 +1,122 @@
+"""
+Benchmarks getting the latest frame from another process, through the shared
+memory frame bus (with and without a copy) and by pulling it over HTTP on
+localhost with a keep-alive connection.
+
+A child process stands in for the stream service: it publishes frames to
+the bus at the camera's rate, and serves the latest one over HTTP.
+
+Usage: python bench_frame_bus.py [frame_size] [num_reads]
+"""
+
+import os
+import sys
+import time
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Event, Process
+from threading import Thread
+
+import numpy as np
+
+from sentrybot.framebus import FrameBusReader, FrameBusWriter
+
+BUS_NAME = f'sentry-frames-bench-{os.getpid()}'
+HTTP_PORT = 18090
+FRAMERATE = 30
+
+
+def serve(frame_size: int, ready: Event, stop: Event) -> None:
+    writer = FrameBusWriter(BUS_NAME, slot_size=frame_size)
+    latest = [b'']
+
+    def publish():
+        frames = [os.urandom(frame_size) for _ in range(4)]
+        i = 0
+        while not stop.is_set():
+            writer.publish(frames[i % len(frames)])
+            latest[0] = frames[i % len(frames)]
+            i += 1
+            time.sleep(1 / FRAMERATE)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            data = latest[0]
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', HTTP_PORT), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    Thread(target=publish, daemon=True).start()
+
+    ready.set()
+    stop.wait()
+
+    server.shutdown()
+    writer.close()
+
+
+def bench(read, num_reads: int):
+    latencies = np.empty(num_reads)
+
+    for i in range(num_reads):
+        t0 = time.perf_counter()
+        read()
+        latencies[i] = time.perf_counter() - t0
+
+    return latencies
+
+
+def main() -> int:
+    frame_size = int(sys.argv[1]) if len(sys.argv) > 1 else 60_000
+    num_reads = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    ready, stop = Event(), Event()
+    server = Process(target=serve, args=(frame_size, ready, stop))
+    server.start()
+    ready.wait()
+
+    reader = FrameBusReader(BUS_NAME)
+    reader.wait_for_newer(0)
+    connection = HTTPConnection('127.0.0.1', HTTP_PORT)
+
+    def read_view():
+        frame = reader.latest()
+        assert len(frame) == frame_size and frame.is_valid()
+
+    def read_copy():
+        assert len(reader.latest().to_bytes()) == frame_size
+
+    def read_http():
+        connection.request('GET', '/snapshot.jpg')
+        assert len(connection.getresponse().read()) == frame_size
+
+    try:
+        print(f'frame_size={frame_size} num_reads={num_reads}')
+        print(f'{"method":>10} | {"reads/s":>9} | {"p50 us":>8} {"p99 us":>8} {"max us":>8}')
+
+        for name, read in (('bus view', read_view), ('bus copy', read_copy), ('http', read_http)):
+            latencies = bench(read, num_reads)
+            p50, p99 = np.percentile(latencies, (50, 99)) * 1e6
+            print(f'{name:>10} | {num_reads / latencies.sum():>9.0f} | '
+                  f'{p50:>8.1f} {p99:>8.1f} {latencies.max() * 1e6:>8.1f}')
+    finally:
+        connection.close()
+        reader.close()
+        stop.set()
+        server.join()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Benchmarks the bytes copied per frame when fanning frames out to viewers,
+comparing the old ``BytesIO`` + ``bytes(...)`` path with :class:`FrameRing`.
+
+Usage: python bench_frames.py [frame_size] [num_frames]
+"""
+
+import io
+import os
+import sys
+import time
+
+from frames import FrameRing
+
+VIEWER_COUNTS = (1, 2, 4, 8, 16)
+MESSAGE_PREFIX = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+MESSAGE_SUFFIX = b'\r\n'
+
+
+def bench_legacy(jpeg: bytes, viewers: int, num_frames: int):
+    """The pre-ring path: read out of the buffer, then copy and concat per viewer."""
+
+    copied = 0
+    t0 = time.perf_counter()
+
+    with io.BytesIO() as buffer:
+        for _ in range(num_frames):
+            buffer.write(jpeg)
+            buffer.seek(0)
+            latest = buffer.read()
+            copied += len(latest)
+            buffer.seek(0)
+            buffer.truncate()
+
+            for _ in range(viewers):
+                frame = bytes(latest)
+                message = MESSAGE_PREFIX + frame + MESSAGE_SUFFIX
+                copied += len(frame) + len(message)
+
+    return copied / num_frames, (time.perf_counter() - t0) / num_frames
+
+
+def bench_ring(jpeg: bytes, viewers: int, num_frames: int, as_bytes: bool):
+    ring = FrameRing()
+    t0 = time.perf_counter()
+
+    for _ in range(num_frames):
+        ring.write(jpeg)
+        ring.publish()
+
+        for _ in range(viewers):
+            frame = ring.latest()
+            part = frame.part_to_bytes() if as_bytes else frame.part
+            assert len(part) > len(jpeg)
+
+    return ring.bytes_copied / num_frames, (time.perf_counter() - t0) / num_frames
+
+
+def main() -> int:
+    frame_size = int(sys.argv[1]) if len(sys.argv) > 1 else 60_000
+    num_frames = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    jpeg = os.urandom(frame_size)
+
+    print(f'frame_size={frame_size} num_frames={num_frames}')
+    print(f'{"viewers":>7} | {"legacy B/frame":>14} {"us":>7} | '
+          f'{"ring bytes B/frame":>18} {"us":>7} | {"ring view B/frame":>17} {"us":>7}')
+
+    for viewers in VIEWER_COUNTS:
+        legacy_b, legacy_t = bench_legacy(jpeg, viewers, num_frames)
+        bytes_b, bytes_t = bench_ring(jpeg, viewers, num_frames, as_bytes=True)
+        view_b, view_t = bench_ring(jpeg, viewers, num_frames, as_bytes=False)
+
+        print(f'{viewers:>7} | {legacy_b:>14.0f} {legacy_t * 1e6:>7.1f} | '
+              f'{bytes_b:>18.0f} {bytes_t * 1e6:>7.1f} | {view_b:>17.0f} {view_t * 1e6:>7.1f}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
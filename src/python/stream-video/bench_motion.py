@@ -0,0 +1,106 @@
+"""
+Benchmarks :class:`MotionDetector` on recorded frames, reporting the frames
+per second it can process and the per-frame latency, including getting the
+luma out of the raw YUV buffer as :class:`MotionMonitor` does.
+
+Frames can be recorded on the Pi as raw YUV (I420), padded as the camera
+pads them, e.g.::
+
+    raspividyuv -w 128 -h 96 -fps 5 -t 60000 -o frames.yuv
+
+Without a recording, frames of noise with a moving square are generated.
+
+Usage: python bench_motion.py [frames.yuv] [--size WIDTHxHEIGHT] [--repeat N]
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from motion import MotionDetector, yuv_frame_size
+
+
+def load_frames(path: str, width: int, height: int) -> np.ndarray:
+    """Returns the recorded raw YUV frames as an array of shape ``(frames, frame_bytes)``."""
+
+    padded_width, padded_height = yuv_frame_size(width, height)
+    frame_bytes = padded_width * padded_height * 3 // 2
+
+    data = np.fromfile(path, dtype=np.uint8)
+    count = len(data) // frame_bytes
+    if not count:
+        raise ValueError(f'Recording is smaller than one frame; path={path!r} frame_bytes={frame_bytes}')
+
+    return data[:count * frame_bytes].reshape(count, frame_bytes)
+
+
+def synthesize_frames(width: int, height: int, count: int = 300) -> np.ndarray:
+    padded_width, padded_height = yuv_frame_size(width, height)
+    rng = np.random.default_rng(0)
+    side = max(16, height // 6)
+
+    frames = np.full((count, padded_width * padded_height * 3 // 2), 128, dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        luma = frame[:padded_width * padded_height].reshape(padded_height, padded_width)
+        luma[:] = rng.integers(90, 110, size=luma.shape, dtype=np.uint8)
+
+        # A square crossing the frame every 100 frames, after a quiet start
+        if i >= 50 and i % 100 < 50:
+            x = (i % 100) * (width - side) // 50
+            luma[height // 2:height // 2 + side, x:x + side] = 220
+
+    return frames
+
+
+def bench(frames: np.ndarray, width: int, height: int, repeat: int):
+    padded_width, padded_height = yuv_frame_size(width, height)
+    luma_size = padded_width * padded_height
+
+    detector = MotionDetector(width, height, cooldown=0.)
+    luma = np.empty((height, width), dtype=np.uint8)
+    latencies = []
+    events = 0
+    timestamp = 0.
+
+    t_start = time.perf_counter()
+
+    for _ in range(repeat):
+        for frame in frames:
+            t0 = time.perf_counter()
+
+            padded = np.frombuffer(frame, dtype=np.uint8, count=luma_size).reshape(padded_height, padded_width)
+            np.copyto(luma, padded[:height, :width])
+            event = detector.process(luma, timestamp)
+
+            latencies.append(time.perf_counter() - t0)
+            events += event is not None
+            timestamp += 1.
+
+    elapsed = time.perf_counter() - t_start
+    return len(latencies) / elapsed, np.array(latencies), events
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs='?', help='Raw YUV (I420) recording')
+    parser.add_argument('--size', default='128x96', help='Frame size, as WIDTHxHEIGHT')
+    parser.add_argument('--repeat', type=int, default=5, help='Times to run through the frames')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split('x'))
+    frames = load_frames(args.path, width, height) if args.path else synthesize_frames(width, height)
+
+    fps, latencies, events = bench(frames, width, height, args.repeat)
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99)) * 1e3
+
+    print(f'source={args.path or "synthetic"} size={width}x{height} frames={len(frames)} repeat={args.repeat}')
+    print(f'fps={fps:.0f} latency_ms: p50={p50:.3f} p95={p95:.3f} p99={p99:.3f} max={latencies.max() * 1e3:.3f}')
+    print(f'frames_with_motion={events}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Load test for the MJPEG stream server: runs the stream app in a subprocess
+with a synthetic camera, connects N simulated clients (some of them slow),
+and reports for each configuration:
+
+- frames delivered per second, per client
+- end-to-end latency, from capture to the client receiving the whole frame
+  (the synthetic camera stamps each JPEG with its capture time)
+- the server's CPU time per second and RSS
+
+Usage: python bench_stream_load.py [--backend asyncio flask] [--clients 1 4 16 64] [--slow 0 1 4] ...
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from typing import List, Tuple
+
+import numpy as np
+from flask import Flask, Response
+from flask_simplelogin import SimpleLogin, login_required
+
+from camera import CameraCapturer
+from synthetic import SyntheticCamera, capture_time
+
+SECRET_KEY = 'bench'
+PORT = 18081
+
+
+def build_app(camera_capturer: CameraCapturer) -> Flask:
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = SECRET_KEY
+    SimpleLogin(app, login_checker=lambda creds: True)
+
+    @app.route('/')
+    @login_required
+    def video_feed():
+        def generate_frames():
+            with camera_capturer.subscribe() as subscription:
+                for frame in subscription:
+                    yield frame.part_to_bytes()
+
+        return Response(generate_frames(), mimetype=camera_capturer.frames.framing.mimetype)
+
+    return app
+
+
+def serve(backend: str, port: int, resolution: Tuple[int, int], framerate: float, entropy: float) -> None:
+    camera = SyntheticCamera(resolution, framerate, entropy)
+    camera_capturer = CameraCapturer(camera)
+    camera_capturer.start()
+    app = build_app(camera_capturer)
+
+    if backend == 'asyncio':
+        from asyncstream import AsyncStreamServer
+        AsyncStreamServer(app, streams={'/': camera_capturer}).run('127.0.0.1', port)
+    else:
+        app.run(host='127.0.0.1', port=port, threaded=True)
+
+
+def session_cookie() -> str:
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = SECRET_KEY
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps(dict(simple_logged_in=True, simple_username='bench'))
+
+
+async def client(cookie: str, duration: float, read_rate: float = None) -> Tuple[int, List[float]]:
+    """
+    Reads the stream for ``duration`` seconds, at most ``read_rate`` bytes per
+    second if given. Returns the number of frames received and their latencies.
+    """
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT, limit=1024 * 1024)
+    writer.write(f'GET / HTTP/1.1\r\nHost: localhost\r\nCookie: session={cookie}\r\n\r\n'.encode())
+
+    head = await reader.readuntil(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 200'), head
+
+    latencies = []
+    t_end = time.monotonic() + duration
+    while time.monotonic() < t_end:
+        part_head = await reader.readuntil(b'\r\n\r\n')
+        length = int(part_head.rpartition(b'Content-Length: ')[2].split(b'\r\n')[0])
+
+        if read_rate is None:
+            jpeg = await reader.readexactly(length + 2)
+        else:
+            chunks = []
+            for start in range(0, length + 2, 4096):
+                chunks.append(await reader.readexactly(min(4096, length + 2 - start)))
+                await asyncio.sleep(len(chunks[-1]) / read_rate)
+            jpeg = b''.join(chunks)
+
+        captured_at = capture_time(jpeg)
+        if captured_at is not None:
+            latencies.append(time.time() - captured_at)
+
+    writer.close()
+    return len(latencies), latencies
+
+
+async def run_step(cookie: str, clients: int, slow_clients: int, duration: float, slow_rate: float):
+    return await asyncio.gather(
+        *(client(cookie, duration) for _ in range(clients - slow_clients)),
+        *(client(cookie, duration, slow_rate) for _ in range(slow_clients)),
+    )
+
+
+def cpu_time(pid: int) -> float:
+    with open(f'/proc/{pid}/stat') as file:
+        fields = file.read().rpartition(')')[2].split()
+
+    # utime and stime, fields 14 and 15 of the whole line
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def rss(pid: int) -> int:
+    with open(f'/proc/{pid}/status') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+
+    return 0
+
+
+def wait_for_port(port: int, timeout: float = 10.) -> None:
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+
+    raise TimeoutError(f'Server did not start on port {port}')
+
+
+def bench(backend: str, args) -> None:
+    server = multiprocessing.Process(
+        target=serve,
+        args=(backend, PORT, tuple(args.resolution), args.framerate, args.entropy),
+        daemon=True,
+    )
+    server.start()
+
+    try:
+        wait_for_port(PORT)
+        cookie = session_cookie()
+
+        # Let the camera prepare its frames before measuring
+        asyncio.run(run_step(cookie, 1, 0, 2., args.slow_rate))
+
+        for clients in args.clients:
+            for slow_clients in args.slow:
+                if slow_clients > clients:
+                    continue
+
+                cpu_start = cpu_time(server.pid)
+                results = asyncio.run(run_step(cookie, clients, slow_clients, args.duration, args.slow_rate))
+                cpu = (cpu_time(server.pid) - cpu_start) / args.duration
+
+                fast, slow = results[:clients - slow_clients], results[clients - slow_clients:]
+                print(f'{backend:>7} {clients:>7} {slow_clients:>4} | '
+                      f'{summarize(fast, args.duration)} | {summarize(slow, args.duration)} | '
+                      f'{cpu * 100:>5.0f} {rss(server.pid) / 1e6:>7.1f}')
+    finally:
+        server.terminate()
+        server.join()
+
+
+def summarize(results: List[Tuple[int, List[float]]], duration: float) -> str:
+    if not results:
+        return f'{"-":>6} {"-":>7} {"-":>7} {"-":>7}'
+
+    fps = np.mean([frames for frames, _ in results]) / duration
+    latencies = np.concatenate([latencies for _, latencies in results]) * 1e3
+    if not len(latencies):
+        return f'{fps:>6.1f} {"-":>7} {"-":>7} {"-":>7}'
+
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+    return f'{fps:>6.1f} {p50:>7.1f} {p95:>7.1f} {p99:>7.1f}'
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', nargs='+', default=['asyncio', 'flask'], choices=('asyncio', 'flask'))
+    parser.add_argument('--clients', nargs='+', type=int, default=[1, 4, 16, 64])
+    parser.add_argument('--slow', nargs='+', type=int, default=[0, 1], help='How many of the clients are slow')
+    parser.add_argument('--slow-rate', type=float, default=100e3, help='Bytes/s a slow client reads')
+    parser.add_argument('--duration', type=float, default=5., help='Seconds per configuration')
+    parser.add_argument('--resolution', nargs=2, type=int, default=[648, 486])
+    parser.add_argument('--framerate', type=float, default=30.)
+    parser.add_argument('--entropy', type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f'resolution={args.resolution} framerate={args.framerate} entropy={args.entropy} '
+          f'slow_rate={args.slow_rate:.0f}B/s duration={args.duration}s')
+    print(f'{"backend":>7} {"clients":>7} {"slow":>4} | '
+          f'{"fps":>6} {"p50 ms":>7} {"p95 ms":>7} {"p99 ms":>7} | '
+          f'{"slow":>6} {"p50 ms":>7} {"p95 ms":>7} {"p99 ms":>7} | {"CPU%":>5} {"RSS MB":>7}')
+
+    for backend in args.backend:
+        bench(backend, args)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,9 @@
-import io
 import time
-from threading import Condition, RLock, Thread
+from threading import Condition, Thread
+from typing import Callable, List, Optional
+
+from frames import Frame, FrameRing
+from metrics import CaptureMetrics, ClientMetrics
 
 
 class CameraCapturer(Thread):
@@ -8,62 +11,220 @@ class CameraCapturer(Thread):
             self,
             camera,
             resize=None,
+            splitter_port: int = 0,
+            format: str = 'jpeg',
+            quality: int = None,
             name: str = 'CameraCapturer',
             daemon: bool = True,
-            print_fps: bool = False,
+            frames: FrameRing = None,
+            idle_grace_period: float = None,
             **kwargs
     ):
+        """
+        :param resize: Resolution to resize frames to, or ``None`` for the camera's resolution.
+        :param splitter_port: The camera's video splitter port (0-3) to capture from. Capturers
+            sharing one camera must each use a different port.
+        :param format: The capture format, e.g. ``'jpeg'``, or ``'yuv'`` for raw frames.
+        :param quality: JPEG quality (1-100), or ``None`` for the camera's default.
+        :param idle_grace_period: If given, capturing stops once there have been no
+            subscribers for this many seconds, and restarts when one subscribes.
+            If ``None``, the camera captures continuously.
+        """
+
         super().__init__(name=name, daemon=daemon, **kwargs)
 
         self.camera = camera
         self.resize = resize
-        self.print_fps = print_fps
+        self.splitter_port = splitter_port
+        self.format = format
+        self.quality = quality
+        self.frames = frames if frames is not None else FrameRing()
+        self.idle_grace_period = idle_grace_period
+        self.metrics = CaptureMetrics()
 
-        self._condition = Condition()
-        self._latest = None
-        self._latest_lock = RLock()
+        self.is_capturing = False
+        self.subscribers = 0
+        self.time_to_first_frame: Optional[float] = None
+        """Seconds from the first subscriber waking the camera to its first frame, for the latest wake-up."""
 
-    def __iter__(self):
-        return self
+        self._condition = Condition()
+        self._listeners: List[Callable[[Frame], None]] = []
+        self._idle_since = time.monotonic()
+        self._woken_at: Optional[float] = None
 
-    def __next__(self):
-        return self.get_next()
+    def __iter__(self) -> 'Subscription':
+        return self.subscribe()
 
     def run(self) -> None:
-        with io.BytesIO() as buffer:
-            t0 = time.monotonic()
-
-            for frame in self.camera.capture_continuous(
-                    buffer,
-                    format='jpeg',
-                    use_video_port=True,
-                    resize=self.resize,
-            ):
-                buffer.seek(0)
-                latest = buffer.read()
+        while True:
+            self._wait_for_subscribers()
+            self._capture()
+
+    def _wait_for_subscribers(self) -> None:
+        if self.idle_grace_period is None:
+            return
 
+        with self._condition:
+            if self.subscribers == 0:
+                print('Camera idle; waiting for subscribers')
+                self._condition.wait_for(lambda: self.subscribers > 0)
+
+    def _capture(self) -> None:
+        options = {} if self.quality is None else dict(quality=self.quality)
+
+        # The camera encodes each frame straight into the next ring slot
+        frames = self.camera.capture_continuous(
+            self.frames,
+            format=self.format,
+            use_video_port=True,
+            splitter_port=self.splitter_port,
+            resize=self.resize,
+            **options
+        )
+
+        self.is_capturing = True
+        try:
+            for _ in frames:
                 with self._condition:
-                    self._set_latest(latest)
+                    frame = self.frames.publish()
                     self._condition.notify_all()
 
-                buffer.seek(0)
-                buffer.truncate()
+                self.metrics.on_publish(frame.capture_timestamp, frame.timestamp, len(frame))
+
+                for listener in self._listeners:
+                    listener(frame)
+
+                if self._woken_at is not None:
+                    self.time_to_first_frame = frame.timestamp - self._woken_at
+                    self._woken_at = None
+                    print(f'Camera woke up; time to first frame={self.time_to_first_frame:.3f}s')
+
+                if self._is_idle():
+                    break
+        finally:
+            # Closing the generator stops the camera's encoder
+            frames.close()
+            self.is_capturing = False
+
+    def _is_idle(self) -> bool:
+        return (
+                self.idle_grace_period is not None
+                and self.subscribers == 0
+                and time.monotonic() - self._idle_since >= self.idle_grace_period
+        )
+
+    def add_listener(self, listener: Callable[[Frame], None]) -> None:
+        """Calls ``listener`` from the capture thread with each new frame. It must not block."""
+        self._listeners.append(listener)
+
+    def subscribe(self, client: str = None) -> 'Subscription':
+        """:param client: Names the subscriber in the metrics, e.g. its address."""
+
+        with self._condition:
+            # While paused, the latest frame is stale; make the subscriber wait for a fresh one
+            paused = self.idle_grace_period is not None and not self.is_capturing
+            seq = self.frames.latest_seq if paused else 0
+
+            self.subscribers += 1
+            if self.subscribers == 1:
+                if paused:
+                    self._woken_at = time.monotonic()
+                self._condition.notify_all()
+
+            subscription = Subscription(self, seq, ClientMetrics(client))
+            self.metrics.add_client(subscription.metrics)
+
+        return subscription
+
+    def unsubscribe(self, metrics: ClientMetrics = None) -> None:
+        with self._condition:
+            if metrics is not None:
+                self.metrics.remove_client(metrics)
+
+            self.subscribers -= 1
+            if self.subscribers == 0:
+                self._idle_since = time.monotonic()
+
+    def wait_for_newer(self, seq: int, timeout: float = None) -> Optional[Frame]:
+        """
+        Returns the latest frame if it is newer than ``seq``; otherwise waits for
+        the next one. Returns ``None`` if ``timeout`` seconds pass first.
+        """
 
-                if self.print_fps:
-                    t1 = time.monotonic()
-                    fps = round(1. / (t1 - t0))
-                    print(f'FPS={fps}')
-                    t0 = time.monotonic()
+        frames = self.frames
+
+        if frames.latest_seq > seq:
+            return frames.latest()
 
-    def get_next(self):
         with self._condition:
-            self._condition.wait()
-            return self._get_latest()
+            if not self._condition.wait_for(lambda: frames.latest_seq > seq, timeout):
+                return None
+
+            return frames.latest()
+
+
+class Subscription:
+    """
+    A subscriber's cursor into the capturer's frames.
+
+    Each call to :meth:`next` returns the newest frame immediately if the
+    subscriber is behind, so a slow subscriber never holds up the others and
+    never falls behind by more than one frame. Frames it jumped over are
+    counted in ``skipped`` (total) and ``last_skipped`` (for the latest call).
+
+    Consumers that write frames to a client should call :meth:`mark_sent`
+    after each write, for the dequeue-to-write latency metric.
+    """
+
+    def __init__(self, capturer: CameraCapturer, seq: int = 0, metrics: ClientMetrics = None):
+        self.capturer = capturer
+        self.metrics = metrics if metrics is not None else ClientMetrics()
+
+        self.seq = seq
+        self.delivered = 0
+        self.skipped = 0
+        self.last_skipped = 0
+        self.closed = False
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __iter__(self) -> 'Subscription':
+        return self
+
+    def __next__(self) -> Frame:
+        if self.closed:
+            raise StopIteration
+
+        return self.next()
+
+    def next(self, timeout: float = None) -> Optional[Frame]:
+        """
+        Returns the newest frame not yet seen by this subscriber, waiting for one
+        if necessary. Returns ``None`` if ``timeout`` seconds pass first.
+        """
+
+        frame = self.capturer.wait_for_newer(self.seq, timeout)
+        if frame is None:
+            return None
+
+        # Frames before the first one are not "skipped"; the subscriber was not around yet
+        self.last_skipped = frame.seq - self.seq - 1 if self.delivered else 0
+        self.skipped += self.last_skipped
+        self.delivered += 1
+        self.seq = frame.seq
+        self.metrics.on_dequeue(frame.timestamp, self.last_skipped)
+
+        return frame
 
-    def _get_latest(self):
-        with self._latest_lock:
-            return bytes(self._latest)
+    def mark_sent(self) -> None:
+        """Records that the latest frame from :meth:`next` has been written to the client."""
+        self.metrics.on_write()
 
-    def _set_latest(self, latest):
-        with self._latest_lock:
-            self._latest = latest
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.capturer.unsubscribe(self.metrics)
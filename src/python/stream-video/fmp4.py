@@ -0,0 +1,188 @@
+"""
+A minimal fragmented MP4 muxer for a single H.264 video track, producing an
+init segment and one ``moof``/``mdat`` fragment per frame, as expected by
+Media Source Extensions.
+"""
+
+import re
+from struct import Struct
+from typing import Iterator, List, Sequence
+
+NAL_SLICE = 1
+NAL_IDR_SLICE = 5
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+
+TIMESCALE = 90000
+
+_START_CODE = re.compile(b'\x00\x00\x01')
+_U32 = Struct('>I')
+
+_MATRIX = b''.join(_U32.pack(v) for v in (0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000))
+
+_KEY_FRAME_FLAGS = 0x02000000
+"""sample_depends_on=2: the sample does not depend on others."""
+
+_NON_KEY_FRAME_FLAGS = 0x01010000
+"""sample_depends_on=1, sample_is_non_sync_sample=1."""
+
+
+def split_nal_units(data: bytes) -> Iterator[bytes]:
+    """Yields the NAL units (without start codes) in an Annex B byte stream."""
+
+    starts = [m.end() for m in _START_CODE.finditer(data)]
+
+    for start, next_start in zip(starts, starts[1:] + [None]):
+        # Strip the next start code, including the leading zero of a 4-byte one
+        end = len(data) if next_start is None else next_start - 3
+        nal = data[start:end].rstrip(b'\x00')
+
+        if nal:
+            yield nal
+
+
+def nal_unit_type(nal: bytes) -> int:
+    return nal[0] & 0x1F
+
+
+def codec_string(sps: bytes) -> str:
+    """Returns the RFC 6381 codec string for the SPS, e.g. ``avc1.42c01e``."""
+    return f'avc1.{sps[1]:02x}{sps[2]:02x}{sps[3]:02x}'
+
+
+def box(box_type: bytes, *payload: bytes) -> bytes:
+    payload = b''.join(payload)
+    return _U32.pack(8 + len(payload)) + box_type + payload
+
+
+def full_box(box_type: bytes, version: int, flags: int, *payload: bytes) -> bytes:
+    return box(box_type, _U32.pack((version << 24) | flags), *payload)
+
+
+class FMP4Muxer:
+    """
+    Packages H.264 access units into fragmented MP4.
+
+    :meth:`init_segment` needs the stream's SPS and PPS; each call to
+    :meth:`fragment` then wraps one frame in its own ``moof``/``mdat``.
+    """
+
+    def __init__(self, width: int, height: int, framerate: float):
+        self.width = width
+        self.height = height
+        self.sample_duration = round(TIMESCALE / framerate)
+
+        self._sequence_number = 0
+        self._decode_time = 0
+
+    def init_segment(self, sps: bytes, pps: bytes) -> bytes:
+        ftyp = box(b'ftyp', b'isom', _U32.pack(0x200), b'isom', b'iso6', b'avc1', b'mp41')
+
+        mvhd = full_box(
+            b'mvhd', 0, 0,
+            _U32.pack(0), _U32.pack(0),        # Creation, modification time
+            _U32.pack(1000), _U32.pack(0),     # Timescale, duration
+            _U32.pack(0x00010000),             # Rate
+            b'\x01\x00', bytes(10),            # Volume, reserved
+            _MATRIX,
+            bytes(24),                         # Pre-defined
+            _U32.pack(2),                      # Next track ID
+        )
+
+        tkhd = full_box(
+            b'tkhd', 0, 0x3,                   # Enabled, in movie
+            _U32.pack(0), _U32.pack(0),        # Creation, modification time
+            _U32.pack(1), bytes(4),            # Track ID, reserved
+            _U32.pack(0), bytes(8),            # Duration, reserved
+            bytes(2), bytes(2),                # Layer, alternate group
+            bytes(2), bytes(2),                # Volume, reserved
+            _MATRIX,
+            _U32.pack(self.width << 16), _U32.pack(self.height << 16),
+        )
+
+        mdhd = full_box(
+            b'mdhd', 0, 0,
+            _U32.pack(0), _U32.pack(0),
+            _U32.pack(TIMESCALE), _U32.pack(0),
+            b'\x55\xc4', bytes(2),             # Language "und", pre-defined
+        )
+        hdlr = full_box(b'hdlr', 0, 0, bytes(4), b'vide', bytes(12), b'VideoHandler\x00')
+
+        avcc = box(
+            b'avcC',
+            bytes((1, sps[1], sps[2], sps[3], 0xFF, 0xE1)),
+            len(sps).to_bytes(2, 'big'), sps,
+            b'\x01', len(pps).to_bytes(2, 'big'), pps,
+        )
+        avc1 = box(
+            b'avc1',
+            bytes(6), b'\x00\x01',             # Reserved, data reference index
+            bytes(16),                         # Pre-defined, reserved
+            self.width.to_bytes(2, 'big'), self.height.to_bytes(2, 'big'),
+            _U32.pack(0x00480000), _U32.pack(0x00480000),  # 72 dpi
+            bytes(4), b'\x00\x01',             # Reserved, frame count
+            bytes(32),                         # Compressor name
+            b'\x00\x18', b'\xff\xff',          # Depth, pre-defined
+            avcc,
+        )
+        stbl = box(
+            b'stbl',
+            full_box(b'stsd', 0, 0, _U32.pack(1), avc1),
+            full_box(b'stts', 0, 0, _U32.pack(0)),
+            full_box(b'stsc', 0, 0, _U32.pack(0)),
+            full_box(b'stsz', 0, 0, _U32.pack(0), _U32.pack(0)),
+            full_box(b'stco', 0, 0, _U32.pack(0)),
+        )
+        minf = box(
+            b'minf',
+            full_box(b'vmhd', 0, 1, bytes(8)),
+            box(b'dinf', full_box(b'dref', 0, 0, _U32.pack(1), full_box(b'url ', 0, 1))),
+            stbl,
+        )
+
+        trex = full_box(b'trex', 0, 0, _U32.pack(1), _U32.pack(1), _U32.pack(0), _U32.pack(0), _U32.pack(0))
+
+        moov = box(
+            b'moov',
+            mvhd,
+            box(b'trak', tkhd, box(b'mdia', mdhd, hdlr, minf)),
+            box(b'mvex', trex),
+        )
+
+        return ftyp + moov
+
+    def fragment(self, nal_units: Sequence[bytes], key_frame: bool) -> bytes:
+        """Returns a ``moof`` + ``mdat`` holding one frame made of the given (VCL) NAL units."""
+
+        self._sequence_number += 1
+
+        sample = b''.join(_U32.pack(len(nal)) + nal for nal in nal_units)
+
+        def build_moof(data_offset: int) -> bytes:
+            trun = full_box(
+                b'trun', 0, 0x000701,          # Data offset, sample duration, size, flags present
+                _U32.pack(1), _U32.pack(data_offset),
+                _U32.pack(self.sample_duration),
+                _U32.pack(len(sample)),
+                _U32.pack(_KEY_FRAME_FLAGS if key_frame else _NON_KEY_FRAME_FLAGS),
+            )
+            traf = box(
+                b'traf',
+                full_box(b'tfhd', 0, 0x020000, _U32.pack(1)),  # Default base is moof
+                full_box(b'tfdt', 1, 0, self._decode_time.to_bytes(8, 'big')),
+                trun,
+            )
+            return box(b'moof', full_box(b'mfhd', 0, 0, _U32.pack(self._sequence_number)), traf)
+
+        moof_len = len(build_moof(0))
+        moof = build_moof(moof_len + 8)
+
+        self._decode_time += self.sample_duration
+
+        return moof + box(b'mdat', sample)
+
+
+def vcl_units(nal_units: List[bytes]) -> List[bytes]:
+    """Returns only the NAL units that belong in an MP4 sample (parameter sets and AUDs are dropped)."""
+    return [nal for nal in nal_units if nal_unit_type(nal) not in (NAL_SPS, NAL_PPS, NAL_AUD)]
@@ -0,0 +1,248 @@
+import time
+from threading import Lock
+from typing import List, Optional
+
+
+class Frame:
+    """
+    One encoded frame stored in a :class:`FrameRing` slot.
+
+    ``data`` is a read-only view of the slot's memory, so handing a frame to any
+    number of consumers never copies it. The slot is reused ``num_slots`` frames
+    later; use :meth:`is_valid` to check that the view has not been overwritten.
+    """
+
+    __slots__ = ('seq', 'timestamp', 'capture_timestamp', 'data', 'part', '_slot', '_bytes', '_part_bytes')
+
+    def __init__(
+            self,
+            seq: int,
+            timestamp: float,
+            data: memoryview,
+            part: memoryview,
+            slot: '_Slot',
+            capture_timestamp: float = None,
+    ):
+        self.seq = seq
+        self.timestamp = timestamp
+        """When the frame was published, from ``time.monotonic()``."""
+        self.capture_timestamp = timestamp if capture_timestamp is None else capture_timestamp
+        """When the camera started writing the frame into the ring, from ``time.monotonic()``."""
+        self.data = data
+        self.part = part
+        """The frame wrapped in the ring's framing (e.g. a complete multipart part), in the same slot."""
+        self._slot = slot
+        self._bytes = None
+        self._part_bytes = None
+
+    def __len__(self) -> int:
+        return self.data.nbytes
+
+    def __repr__(self) -> str:
+        return f'Frame(seq={self.seq}, size={len(self)})'
+
+    def is_valid(self) -> bool:
+        """Returns ``False`` if the slot holding this frame has since been reused."""
+        return self._slot.seq == self.seq
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns the frame as ``bytes``, for consumers (e.g. WSGI servers) that
+        cannot write a ``memoryview``. The copy is made at most once per frame
+        and shared by every caller.
+        """
+
+        if self._bytes is None:
+            self._slot.ring._copy_to_bytes(self, part=False)
+
+        return self._bytes
+
+    def part_to_bytes(self) -> bytes:
+        """Like :meth:`to_bytes`, but for :attr:`part`."""
+
+        if self._part_bytes is None:
+            self._slot.ring._copy_to_bytes(self, part=True)
+
+        return self._part_bytes
+
+
+class MultipartFraming:
+    """
+    Wraps each frame in a ``multipart/x-mixed-replace`` part, with a
+    ``Content-Length`` header, so the whole part can be written to every
+    client as a single buffer.
+    """
+
+    MAX_HEADER_LEN = 128
+
+    def __init__(self, boundary: str = 'frame', content_type: str = 'image/jpeg'):
+        self.boundary = boundary
+        self.content_type = content_type
+        self.mimetype = f'multipart/x-mixed-replace; boundary={boundary}'
+
+        self._header_format = (
+            f'--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            'Content-Length: {}\r\n'
+            '\r\n'
+        )
+        self.trailer = b'\r\n'
+
+        if len(self.header(10 ** 12)) > self.MAX_HEADER_LEN:
+            raise ValueError(f'Multipart header too long; boundary={boundary!r} content_type={content_type!r}')
+
+    def header(self, length: int) -> bytes:
+        return self._header_format.format(length).encode()
+
+
+class _Slot:
+    __slots__ = ('ring', 'buffer', 'seq', 'frame')
+
+    def __init__(self, ring: 'FrameRing', size: int):
+        self.ring = ring
+        self.buffer = bytearray(size)
+        self.seq = 0
+        self.frame = None
+
+
+class FrameRing:
+    """
+    A fixed-size ring of preallocated frame slots.
+
+    A single producer writes an encoded frame into the next slot with
+    :meth:`write` (so the ring can be passed directly as the output of
+    ``PiCamera.capture_continuous``), then calls :meth:`publish` to make it
+    visible. Consumers get :class:`Frame` objects whose data is a read-only
+    ``memoryview`` of the slot; frames are never copied per consumer.
+
+    Each slot reserves room before and after the frame for ``framing``, which
+    is filled in on publish; :attr:`Frame.part` is then a single contiguous
+    buffer holding the framed frame.
+
+    Sequence numbers start at 1 and increase by one per published frame;
+    0 means "no frame yet".
+    """
+
+    def __init__(
+            self,
+            num_slots: int = 8,
+            slot_size: int = 256 * 1024,
+            framing: MultipartFraming = None,
+    ):
+        if num_slots < 2:
+            raise ValueError(f'num_slots must be at least 2; num_slots={num_slots}')
+
+        self.framing = framing if framing is not None else MultipartFraming()
+        self._data_start = self.framing.MAX_HEADER_LEN
+
+        self._slots: List[_Slot] = [
+            _Slot(self, self._data_start + slot_size + len(self.framing.trailer))
+            for _ in range(num_slots)
+        ]
+        self._latest_seq = 0
+        self._write_len = 0
+        self._capture_timestamp: Optional[float] = None
+        self._bytes_lock = Lock()
+
+        self.bytes_copied = 0
+        """Total number of frame bytes copied, into the ring or out of it via ``Frame.to_bytes()``."""
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def latest_seq(self) -> int:
+        return self._latest_seq
+
+    def latest(self) -> Optional[Frame]:
+        return self._slots[self._latest_seq % len(self._slots)].frame
+
+    def get(self, seq: int) -> Optional[Frame]:
+        """Returns the frame with the given sequence number, or ``None`` if it is not in the ring."""
+
+        slot = self._slots[seq % len(self._slots)]
+        return slot.frame if seq > 0 and slot.seq == seq else None
+
+    def write(self, data) -> int:
+        """Appends ``data`` (any bytes-like object) to the frame being written."""
+
+        slot = self._pending_slot()
+        size = memoryview(data).nbytes
+
+        if not self._write_len:
+            self._capture_timestamp = time.monotonic()
+
+        start = self._data_start + self._write_len
+        end = start + size
+
+        if end + len(self.framing.trailer) > len(slot.buffer):
+            self._grow(slot, end + len(self.framing.trailer))
+
+        slot.buffer[start:end] = data
+        self._write_len += size
+        self.bytes_copied += size
+
+        return size
+
+    def flush(self) -> None:
+        pass
+
+    def publish(self, timestamp: float = None) -> Frame:
+        """Publishes the frame written since the last call, and returns it."""
+
+        seq = self._latest_seq + 1
+        slot = self._pending_slot()
+
+        data_start = self._data_start
+        data_end = data_start + self._write_len
+
+        # Frame the data in place, with the header ending right where the data begins
+        header = self.framing.header(self._write_len)
+        trailer = self.framing.trailer
+        part_start = data_start - len(header)
+        part_end = data_end + len(trailer)
+        slot.buffer[part_start:data_start] = header
+        slot.buffer[data_end:part_end] = trailer
+
+        view = memoryview(slot.buffer).toreadonly()
+        frame = Frame(
+            seq,
+            time.monotonic() if timestamp is None else timestamp,
+            view[data_start:data_end],
+            view[part_start:part_end],
+            slot,
+            self._capture_timestamp,
+        )
+
+        slot.seq = seq
+        slot.frame = frame
+        self._latest_seq = seq
+        self._write_len = 0
+        self._capture_timestamp = None
+
+        return frame
+
+    def _copy_to_bytes(self, frame: Frame, part: bool) -> None:
+        with self._bytes_lock:
+            if part and frame._part_bytes is None:
+                frame._part_bytes = bytes(frame.part)
+                self.bytes_copied += len(frame.part)
+            elif not part and frame._bytes is None:
+                frame._bytes = bytes(frame.data)
+                self.bytes_copied += len(frame)
+
+    def _pending_slot(self) -> _Slot:
+        slot = self._slots[(self._latest_seq + 1) % len(self._slots)]
+
+        # Invalidate the frame being overwritten before touching its memory
+        slot.seq = 0
+
+        return slot
+
+    def _grow(self, slot: _Slot, min_size: int) -> None:
+        # The old buffer may still be exported to consumers, so it cannot be
+        # resized in place; replace it instead.
+        end = self._data_start + self._write_len
+        buffer = bytearray(max(min_size, 2 * len(slot.buffer)))
+        buffer[:end] = memoryview(slot.buffer)[:end]
+        slot.buffer = buffer
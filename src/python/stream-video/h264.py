@@ -0,0 +1,228 @@
+import time
+from collections import deque
+from threading import Condition, Thread
+from typing import Callable, List, Optional, Tuple
+
+from fmp4 import FMP4Muxer, NAL_IDR_SLICE, NAL_PPS, NAL_SPS, codec_string, nal_unit_type, split_nal_units, \
+    vcl_units
+
+Fragment = Tuple[int, bool, bytes]
+"""``(seq, is_key_frame, data)``: one frame packaged as a fragmented MP4 ``moof``/``mdat``."""
+
+
+class H264Capturer(Thread):
+    """
+    Records H.264 from the camera's video port with the hardware encoder, and
+    packages each frame as a fragmented MP4 fragment for Media Source
+    Extensions playback.
+
+    Fragments since the latest key frame are cached, so a new viewer can be
+    sent the init segment and that GOP and start playing at once.
+    """
+
+    def __init__(
+            self,
+            camera,
+            width: int,
+            height: int,
+            framerate: float,
+            splitter_port: int = 1,
+            resize=None,
+            bitrate: int = 1_000_000,
+            intra_period: int = 10,
+            name: str = 'H264Capturer',
+            daemon: bool = True,
+            idle_grace_period: float = None,
+            max_fragments: int = 64,
+            **kwargs
+    ):
+        """
+        :param width: Width of the recorded video (after ``resize``).
+        :param height: Height of the recorded video (after ``resize``).
+        :param intra_period: Frames between key frames; also bounds how far
+            behind the live edge a new viewer starts.
+        :param idle_grace_period: If given, recording stops once there have been no
+            subscribers for this many seconds, and restarts when one subscribes.
+        :param max_fragments: How many recent fragments to keep for viewers that fall behind.
+        """
+
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.camera = camera
+        self.splitter_port = splitter_port
+        self.resize = resize
+        self.bitrate = bitrate
+        self.intra_period = intra_period
+        self.idle_grace_period = idle_grace_period
+
+        self.muxer = FMP4Muxer(width, height, framerate)
+        self.codec: Optional[str] = None
+        self.init_segment: Optional[bytes] = None
+        self.latest_seq = 0
+        self.subscribers = 0
+
+        self._fragments = deque(maxlen=max_fragments)
+        self._key_frame_seq = 0
+        self._sps = None
+        self._pps = None
+        self._condition = Condition()
+        self._listeners: List[Callable[[], None]] = []
+        self._idle_since = time.monotonic()
+
+    def run(self) -> None:
+        output = _H264Output(self)
+
+        while True:
+            if self.idle_grace_period is not None:
+                with self._condition:
+                    self._condition.wait_for(lambda: self.subscribers > 0)
+
+            self.camera.start_recording(
+                output,
+                format='h264',
+                splitter_port=self.splitter_port,
+                resize=self.resize,
+                bitrate=self.bitrate,
+                intra_period=self.intra_period,
+                profile='baseline',
+                inline_headers=True,
+            )
+            try:
+                while not self._is_idle():
+                    self.camera.wait_recording(0.5, splitter_port=self.splitter_port)
+            finally:
+                self.camera.stop_recording(splitter_port=self.splitter_port)
+                output.reset()
+
+                # Cached fragments are stale once recording stops
+                with self._condition:
+                    self._fragments.clear()
+                    self._key_frame_seq = 0
+
+    def _is_idle(self) -> bool:
+        return (
+                self.idle_grace_period is not None
+                and self.subscribers == 0
+                and time.monotonic() - self._idle_since >= self.idle_grace_period
+        )
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """Calls ``listener`` from the encoder thread after each new fragment. It must not block."""
+        self._listeners.append(listener)
+
+    def subscribe(self) -> None:
+        with self._condition:
+            self.subscribers += 1
+            self._condition.notify_all()
+
+    def unsubscribe(self) -> None:
+        with self._condition:
+            self.subscribers -= 1
+            if self.subscribers == 0:
+                self._idle_since = time.monotonic()
+
+    def start_fragments(self) -> Tuple[Optional[str], Optional[bytes], List[Fragment]]:
+        """
+        Returns what a new viewer needs to start playing at once: the codec
+        string, the init segment, and the fragments since the latest key frame.
+        """
+
+        with self._condition:
+            return self.codec, self.init_segment, self._fragments_since(self._key_frame_seq)
+
+    def fragments_after(self, seq: int) -> List[Fragment]:
+        """
+        Returns the fragments after ``seq``. If the viewer has fallen so far
+        behind that it would miss frames, it is moved up to the latest key
+        frame instead, since P-frames cannot be dropped individually.
+        """
+
+        with self._condition:
+            oldest_seq = self._fragments[0][0] if self._fragments else 0
+
+            too_far_behind = seq + 1 < oldest_seq or self.latest_seq - seq > self.intra_period
+            if too_far_behind and self._key_frame_seq > seq:
+                return self._fragments_since(self._key_frame_seq)
+
+            return self._fragments_since(seq + 1)
+
+    def _fragments_since(self, seq: int) -> List[Fragment]:
+        if not seq:
+            return []
+
+        return [fragment for fragment in self._fragments if fragment[0] >= seq]
+
+    def on_frame(self, data: bytes) -> None:
+        """Called with each complete frame (Annex B), including header-only "frames"."""
+
+        nal_units = list(split_nal_units(data))
+
+        for nal in nal_units:
+            nal_type = nal_unit_type(nal)
+            if nal_type == NAL_SPS:
+                self._sps = nal
+            elif nal_type == NAL_PPS:
+                self._pps = nal
+
+        samples = vcl_units(nal_units)
+        if not samples:
+            return
+
+        key_frame = any(nal_unit_type(nal) == NAL_IDR_SLICE for nal in samples)
+
+        with self._condition:
+            if self.init_segment is None:
+                # Viewers can only start at a key frame with known parameter sets
+                if not key_frame or self._sps is None or self._pps is None:
+                    return
+
+                self.codec = codec_string(self._sps)
+                self.init_segment = self.muxer.init_segment(self._sps, self._pps)
+
+            self.latest_seq += 1
+            if key_frame:
+                self._key_frame_seq = self.latest_seq
+
+            self._fragments.append((self.latest_seq, key_frame, self.muxer.fragment(samples, key_frame)))
+
+        for listener in self._listeners:
+            listener()
+
+
+class _H264Output:
+    """
+    The file-like output given to ``PiCamera.start_recording``. Buffers writes
+    until the encoder reports the frame complete, then hands it to the capturer.
+    """
+
+    def __init__(self, capturer: H264Capturer):
+        self.capturer = capturer
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+
+        frame = self._frame()
+        if frame is None or frame.complete:
+            self.capturer.on_frame(bytes(self._buffer))
+            self._buffer.clear()
+
+        return len(data)
+
+    def _frame(self):
+        """
+        The current frame of this splitter port's own encoder, ``None`` if it is
+        not known. ``PiCamera.frame`` will not do: it is the frame of the first
+        encoder it finds, and the MJPEG streams record on other ports at the
+        same time.
+        """
+
+        encoders = getattr(self.capturer.camera, '_encoders', None)
+        encoder = encoders.get(self.capturer.splitter_port) if encoders else None
+        return getattr(encoder, 'frame', None)
+
+    def flush(self) -> None:
+        pass
+
+    def reset(self) -> None:
+        self._buffer.clear()
@@ -1,9 +1,15 @@
+import atexit
 import time
+from typing import Dict, Union
 
-from flask import Response, Flask
+from flask import Response, Flask, abort, jsonify, request
 from flask_simplelogin import SimpleLogin, login_required
 
+import snapshot
+from adaptive import AdaptiveClient, AdaptiveStreams
 from camera import CameraCapturer
+from frames import Frame
+from h264 import H264Capturer
 from sentrybot.config.main import config
 from sentrybot.users import login_checker
 
@@ -13,16 +19,9 @@ app.config['SECRET_KEY'] = config.website.secret_key.value
 if config.is_sentry:
     from picamera import PiCamera
 else:
-    print('Using dummy PiCamera')
+    print('Using synthetic PiCamera')
 
-    # Dummy PiCamera for non-Raspberry Pi platforms
-    class PiCamera:
-        framerate = 10
-
-        def capture_continuous(self, *args, **kwargs):
-            while True:
-                yield b''
-                time.sleep(1 / self.framerate)
+    from synthetic import SyntheticCamera as PiCamera
 
 
 def build_camera():
@@ -30,50 +29,316 @@ def build_camera():
     camera.resolution = config.camera.resolution
     camera.framerate = config.camera.framerate
     camera.rotation = 180
+
+    if not config.is_sentry:
+        camera.entropy = config.camera.synthetic.entropy
+        camera.distinct_frames = config.camera.synthetic.distinct_frames
+
     time.sleep(2)
     return camera
 
 
-def build_camera_capturer():
-    cc = CameraCapturer(build_camera(), print_fps=config.camera.print_fps)
-    cc.start()
-    return cc
+camera = build_camera()
+
+
+def build_camera_capturers() -> Dict[str, CameraCapturer]:
+    """Builds one capturer per configured stream, all sharing the same camera."""
+
+    capturers = {}
+
+    for name, stream in config.camera.streams.items():
+        cc = CameraCapturer(
+            camera,
+            resize=stream.resize,
+            splitter_port=stream.splitter_port,
+            quality=stream.quality,
+            name=f'CameraCapturer-{name}',
+            idle_grace_period=config.camera.idle_grace_period,
+        )
+        cc.start()
+        capturers[name] = cc
+
+    return capturers
+
+
+def build_h264_capturer() -> H264Capturer:
+    h264 = config.camera.h264
+    width, height = h264.resize or config.camera.resolution
+
+    capturer = H264Capturer(
+        camera,
+        width=width,
+        height=height,
+        framerate=config.camera.framerate,
+        splitter_port=h264.splitter_port,
+        resize=h264.resize,
+        bitrate=h264.bitrate,
+        intra_period=h264.intra_period,
+        idle_grace_period=config.camera.idle_grace_period,
+    )
+    capturer.start()
+    return capturer
+
+
+def build_motion_monitor():
+    from motion import MotionDetector, MotionMonitor
+
+    motion = config.camera.motion
+
+    used_ports = {stream.splitter_port for stream in config.camera.streams.values()}
+    if h264_capturer is not None:
+        used_ports.add(h264_capturer.splitter_port)
+    if motion.splitter_port in used_ports:
+        raise ValueError(f'Motion detection splitter port is already in use; splitter_port={motion.splitter_port}')
+
+    capturer = CameraCapturer(
+        camera,
+        resize=motion.resize,
+        splitter_port=motion.splitter_port,
+        format='yuv',
+        name='CameraCapturer-motion',
+    )
+    capturer.start()
+
+    width, height = motion.resize
+    detector = MotionDetector(
+        width,
+        height,
+        grid=motion.grid,
+        pixel_threshold=motion.pixel_threshold,
+        region_thresholds=motion.region_thresholds,
+        learning_rate=motion.learning_rate,
+        cooldown=motion.cooldown,
+    )
+
+    monitor = MotionMonitor(capturer, detector, config.notifier, frame_size=motion.resize)
+    monitor.start()
+    return monitor
+
+
+def build_event_recorder():
+    from recorder import EventRecorder, SegmentWriter, TriggerListener
+
+    recorder_config = config.camera.recorder
+
+    writer = SegmentWriter(recorder_config.directory, max_total_bytes=recorder_config.max_total_bytes)
+    writer.start()
+
+    recorder = EventRecorder(
+        camera_capturers[recorder_config.stream],
+        writer,
+        pre_event_seconds=recorder_config.pre_event_seconds,
+        post_event_seconds=recorder_config.post_event_seconds,
+        max_segment_seconds=recorder_config.max_segment_seconds,
+    )
+    recorder.start()
 
+    TriggerListener(recorder, recorder_config.trigger_address).start()
 
-camera_capturer = build_camera_capturer()
+    if motion_monitor is not None:
+        motion_monitor.add_listener(lambda event: recorder.trigger(str(event)))
+
+    return recorder
+
+
+def build_frame_bus_publisher():
+    from sentrybot.framebus import FrameBusWriter
+    from sharedframes import FrameBusPublisher
+
+    frame_bus = config.camera.frame_bus
+
+    writer = FrameBusWriter(frame_bus.name, num_slots=frame_bus.num_slots, slot_size=frame_bus.slot_size)
+    atexit.register(writer.close)
+
+    publisher = FrameBusPublisher(
+        camera_capturers[frame_bus.stream],
+        writer,
+        idle_grace_period=config.camera.idle_grace_period or 10.,
+    )
+    publisher.start()
+    return publisher
+
+
+camera_capturers = build_camera_capturers()
+h264_capturer = (
+    build_h264_capturer()
+    if config.camera.h264.enabled and config.camera.stream.backend == 'asyncio' else
+    None
+)
+motion_monitor = build_motion_monitor() if config.camera.motion.enabled else None
+event_recorder = build_event_recorder() if config.camera.recorder.enabled else None
+frame_bus_publisher = build_frame_bus_publisher() if config.camera.frame_bus.enabled else None
+camera_capturer = camera_capturers[config.camera.default_stream]
+adaptive_streams = AdaptiveStreams(
+    ladder=[(name, camera_capturers[name]) for name in config.camera.adaptive.ladder],
+    latency_budget=config.camera.adaptive.latency_budget,
+    min_framerate=config.camera.adaptive.min_framerate,
+)
 
 
 @app.route('/')
 @login_required
 def video_feed():
+    return stream_response(camera_capturer)
+
+
+@app.route('/stream/adaptive')
+@login_required
+def adaptive_video_feed():
     return Response(
-        generate_frames(),
-        mimetype='multipart/x-mixed-replace; boundary=frame'
+        generate_adaptive_frames(adaptive_streams.client(request.remote_addr)),
+        mimetype=camera_capturer.frames.framing.mimetype
     )
 
 
-def generate_frames():
-    message_prefix = (
-        b'--frame\r\n'
-        b'Content-Type: image/jpeg\r\n'
-        b'\r\n'
+@app.route('/stats/clients')
+@login_required
+def client_stats():
+    return jsonify(adaptive=adaptive_streams.stats())
+
+
+@app.route('/record', methods=['POST'])
+@login_required
+def record():
+    if event_recorder is None:
+        abort(404)
+
+    event_recorder.trigger(request.form.get('reason', 'api'))
+    return jsonify(recording=True)
+
+
+@app.route('/snapshot.jpg')
+@login_required
+def snapshot_jpg():
+    return snapshot_response(camera_capturer)
+
+
+@app.route('/snapshot/<name>.jpg')
+@login_required
+def named_snapshot_jpg(name: str):
+    capturer = camera_capturers.get(name)
+    if capturer is None:
+        abort(404)
+
+    return snapshot_response(capturer)
+
+
+@app.route('/stats/pipeline')
+@login_required
+def pipeline_stats():
+    return jsonify({name: capturer.metrics.stats() for name, capturer in camera_capturers.items()})
+
+
+@app.route('/stream/<name>')
+@login_required
+def named_video_feed(name: str):
+    capturer = camera_capturers.get(name)
+    if capturer is None:
+        abort(404)
+
+    return stream_response(capturer)
+
+
+def stream_response(capturer: CameraCapturer) -> Response:
+    return Response(
+        generate_frames(capturer, request.remote_addr),
+        mimetype=capturer.frames.framing.mimetype
     )
-    message_suffix = b'\r\n'
 
-    for frame in camera_capturer:
-        yield message_prefix + frame + message_suffix
+
+def snapshot_response(capturer: CameraCapturer) -> Response:
+    try:
+        wait_newer_than = snapshot.parse_wait_newer_than(request.args.get('wait_newer_than'))
+    except ValueError:
+        abort(400)
+
+    frame = wait_for_snapshot(capturer, wait_newer_than)
+    if frame is None:
+        return Response(status=503, headers={'Retry-After': '1'})
+
+    headers = snapshot.headers(frame)
+    if snapshot.is_not_modified(request.headers.get('If-None-Match'), frame):
+        return Response(status=304, headers=headers)
+
+    data = frame.to_bytes()
+    if not frame.is_valid():
+        abort(503)
+
+    return Response(data, mimetype='image/jpeg', headers=headers)
+
+
+def wait_for_snapshot(capturer: CameraCapturer, wait_newer_than: int = None) -> Frame:
+    # Subscribing wakes the camera if it is paused, and then waits for a fresh frame
+    with capturer.subscribe(client=request.remote_addr) as subscription:
+        subscription.seq = snapshot.start_seq(subscription.seq, wait_newer_than, capturer.frames.latest_seq)
+        frame = subscription.next(timeout=config.camera.snapshot.max_wait)
+
+    return frame if frame is not None else capturer.frames.latest()
+
+
+def generate_frames(capturer: CameraCapturer, client: str = None):
+    # Each frame is framed as a complete multipart part once, by the capturer,
+    # and the same object is written to every client in a single write.
+    with capturer.subscribe(client) as subscription:
+        for frame in subscription:
+            yield frame.part_to_bytes()
+
+            # The generator resumes once the server has written the part
+            subscription.mark_sent()
+
+
+def generate_adaptive_frames(client: AdaptiveClient):
+    with client:
+        while True:
+            frame = client.next_frame()
+
+            # The generator resumes once the server has written the part
+            t0 = time.monotonic()
+            yield frame.part_to_bytes()
+            client.on_sent(frame, time.monotonic() - t0)
+
+
+def get_stream_paths() -> Dict[str, Union[CameraCapturer, AdaptiveStreams, H264Capturer]]:
+    paths = {f'/stream/{name}': capturer for name, capturer in camera_capturers.items()}
+    paths['/'] = camera_capturer
+    paths['/stream/adaptive'] = adaptive_streams
+
+    if h264_capturer is not None:
+        paths[config.camera.h264.path] = h264_capturer
+
+    return paths
+
+
+def get_snapshot_paths() -> Dict[str, CameraCapturer]:
+    paths = {f'/snapshot/{name}.jpg': capturer for name, capturer in camera_capturers.items()}
+    paths['/snapshot.jpg'] = camera_capturer
+    return paths
 
 
 def main():
     SimpleLogin(app, login_checker=login_checker)
 
-    app.run(
-        host=config.camera.stream.host,
-        port=config.camera.stream.port,
-        debug=True,
-        threaded=True,
-        use_reloader=False,
-    )
+    if config.camera.stream.backend == 'asyncio':
+        from asyncstream import AsyncStreamServer
+
+        server = AsyncStreamServer(
+            app,
+            streams=get_stream_paths(),
+            snapshots=get_snapshot_paths(),
+            snapshot_max_wait=config.camera.snapshot.max_wait,
+        )
+        server.run(config.camera.stream.host, config.camera.stream.port)
+    else:
+        if config.camera.h264.enabled:
+            print('H.264 streaming needs the asyncio stream backend; it is not served')
+
+        app.run(
+            host=config.camera.stream.host,
+            port=config.camera.stream.port,
+            debug=True,
+            threaded=True,
+            use_reloader=False,
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,206 @@
+"""
+Low-overhead metrics for the video pipeline: fixed-bucket histograms that
+each cost a binary search and a few additions per observation, so they can
+be updated for every frame on the capture thread.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+class Histogram:
+    """
+    Counts observations in fixed buckets. ``counts[i]`` is the number of
+    observations ``<= bounds[i]`` (and greater than the previous bound); the
+    last count is for observations above every bound.
+
+    Updates are not locked; each histogram should have a single writer.
+    Readers may see a slightly inconsistent snapshot, which is fine for stats.
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    @staticmethod
+    def exponential(start: float, factor: float, num_bounds: int) -> 'Histogram':
+        return Histogram([start * factor ** i for i in range(num_bounds)])
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'Histogram') -> None:
+        """Adds ``other``'s observations (it must have the same bounds) to this histogram."""
+
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Returns an upper bound on the ``q`` quantile: the bound of the bucket it
+        falls in, or the maximum for the last bucket. ``None`` if empty.
+        """
+
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def stats(self) -> dict:
+        return dict(
+            count=self.count,
+            mean=self.sum / self.count if self.count else None,
+            p50=self.quantile(0.5),
+            p90=self.quantile(0.9),
+            p99=self.quantile(0.99),
+            max=self.max if self.count else None,
+            buckets=[[bound, count] for bound, count in zip(self.bounds, self.counts)] + [['+Inf', self.counts[-1]]],
+        )
+
+
+def latency_histogram() -> Histogram:
+    """Seconds, from 0.5 ms to about 16 s."""
+    return Histogram.exponential(0.0005, 2., 16)
+
+
+def size_histogram() -> Histogram:
+    """Bytes, from 1 KiB to 4 MiB."""
+    return Histogram.exponential(1024, 2., 13)
+
+
+def merged(histograms: Iterable[Histogram], empty: Histogram) -> Histogram:
+    result = empty
+    for histogram in histograms:
+        result.merge(histogram)
+
+    return result
+
+
+class ClientMetrics:
+    """
+    Per-client delivery metrics, updated by the client's own thread (or
+    coroutine): how long each frame waited between being published and the
+    client taking it, and between the client taking it and it being written
+    to the client's socket.
+    """
+
+    __slots__ = ('client', 'publish_to_dequeue', 'dequeue_to_write', 'delivered', 'skipped', '_dequeued_at')
+
+    def __init__(self, client: str = None):
+        self.client = client
+        self.publish_to_dequeue = latency_histogram()
+        self.dequeue_to_write = latency_histogram()
+        self.delivered = 0
+        self.skipped = 0
+        self._dequeued_at: Optional[float] = None
+
+    def on_dequeue(self, publish_timestamp: float, skipped: int) -> None:
+        now = time.monotonic()
+        self.publish_to_dequeue.observe(now - publish_timestamp)
+        self.delivered += 1
+        self.skipped += skipped
+        self._dequeued_at = now
+
+    def on_write(self) -> None:
+        if self._dequeued_at is not None:
+            self.dequeue_to_write.observe(time.monotonic() - self._dequeued_at)
+            self._dequeued_at = None
+
+    def stats(self) -> dict:
+        return dict(
+            client=self.client,
+            delivered=self.delivered,
+            skipped=self.skipped,
+            publish_to_dequeue=self.publish_to_dequeue.stats(),
+            dequeue_to_write=self.dequeue_to_write.stats(),
+        )
+
+
+class CaptureMetrics:
+    """
+    Metrics for one capturer: per-frame capture-to-publish latency and JPEG
+    size (updated on the capture thread), and the delivery metrics of its
+    clients, both current and past.
+    """
+
+    FPS_SMOOTHING = 0.1
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.fps = 0.
+        self.capture_to_publish = latency_histogram()
+        self.frame_size = size_histogram()
+
+        self._last_publish: Optional[float] = None
+        self._clients: Dict[int, ClientMetrics] = {}
+        self._past_clients = ClientMetrics()
+
+    def on_publish(self, capture_timestamp: float, publish_timestamp: float, size: int) -> None:
+        self.frames += 1
+        self.bytes += size
+        self.capture_to_publish.observe(publish_timestamp - capture_timestamp)
+        self.frame_size.observe(size)
+
+        if self._last_publish is not None:
+            interval = publish_timestamp - self._last_publish
+            if interval > 0:
+                fps = 1. / interval
+                self.fps = fps if not self.fps else self.fps + self.FPS_SMOOTHING * (fps - self.fps)
+
+        self._last_publish = publish_timestamp
+
+    def add_client(self, client: ClientMetrics) -> None:
+        self._clients[id(client)] = client
+
+    def remove_client(self, client: ClientMetrics) -> None:
+        """Stops reporting the client on its own, and folds its metrics into the totals."""
+
+        if self._clients.pop(id(client), None) is None:
+            return
+
+        past = self._past_clients
+        past.publish_to_dequeue.merge(client.publish_to_dequeue)
+        past.dequeue_to_write.merge(client.dequeue_to_write)
+        past.delivered += client.delivered
+        past.skipped += client.skipped
+
+    def stats(self) -> dict:
+        clients: List[ClientMetrics] = list(self._clients.values())
+        all_clients = [self._past_clients, *clients]
+
+        return dict(
+            frames=self.frames,
+            bytes=self.bytes,
+            fps=self.fps,
+            capture_to_publish=self.capture_to_publish.stats(),
+            frame_size=self.frame_size.stats(),
+            clients=dict(
+                delivered=sum(c.delivered for c in all_clients),
+                skipped=sum(c.skipped for c in all_clients),
+                publish_to_dequeue=merged((c.publish_to_dequeue for c in all_clients), latency_histogram()).stats(),
+                dequeue_to_write=merged((c.dequeue_to_write for c in all_clients), latency_histogram()).stats(),
+            ),
+            active_clients=[client.stats() for client in clients],
+        )
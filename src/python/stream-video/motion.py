@@ -0,0 +1,227 @@
+"""
+Motion detection on raw (YUV) frames from the camera, by differencing each
+frame's luma against a running background model.
+"""
+
+import time
+from dataclasses import dataclass
+from threading import Thread
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from camera import CameraCapturer
+
+
+def yuv_frame_size(width: int, height: int) -> Tuple[int, int]:
+    """
+    Returns the ``(width, height)`` of the buffers the camera writes for YUV
+    captures of the given size; it pads the width to a multiple of 32 and the
+    height to a multiple of 16.
+    """
+
+    return (width + 31) // 32 * 32, (height + 15) // 16 * 16
+
+
+@dataclass
+class MotionEvent:
+    timestamp: float
+    regions: List[Tuple[int, int]]
+    """``(row, col)`` of each grid region where motion was detected."""
+    fractions: np.ndarray
+    """Fraction of changed pixels in each region, for the whole grid."""
+
+    def __str__(self) -> str:
+        regions = ', '.join(f'{row},{col}' for row, col in self.regions)
+        return f'Motion detected in region(s) {regions}; max changed={self.fractions.max():.0%}'
+
+
+class MotionDetector:
+    """
+    Detects motion in a stream of grayscale frames.
+
+    Each frame is compared against a background that is the exponential moving
+    average of past frames. A pixel has changed if it differs from the
+    background by more than ``pixel_threshold``; a grid region has motion if
+    the fraction of its pixels that changed exceeds its threshold. After a
+    detection, further detections are suppressed for ``cooldown`` seconds.
+
+    All work is done with NumPy on preallocated buffers, so each frame costs a
+    few passes over its pixels and no allocations of frame size.
+    """
+
+    def __init__(
+            self,
+            width: int,
+            height: int,
+            grid: Tuple[int, int] = (3, 4),
+            pixel_threshold: float = 25.,
+            region_thresholds: Union[float, np.ndarray] = 0.02,
+            learning_rate: float = 0.05,
+            cooldown: float = 30.,
+            warmup_frames: int = 10,
+    ):
+        """
+        :param grid: ``(rows, cols)`` of regions to divide the frame into. Pixels
+            left over when the size is not divisible by the grid are ignored.
+        :param pixel_threshold: Difference from the background, in luma levels,
+            for a pixel to count as changed.
+        :param region_thresholds: Fraction of changed pixels for a region to have
+            motion; either one value for every region, or one per region with the
+            grid's shape. Use a value above 1 to ignore a region.
+        :param learning_rate: Weight of each new frame in the background, in (0, 1].
+        :param cooldown: Seconds after a detection during which no more are reported.
+        :param warmup_frames: Frames used only to build the background, before
+            any detection.
+        """
+
+        rows, cols = grid
+        if width < cols or height < rows:
+            raise ValueError(f'Frame is smaller than the grid; size={width}x{height} grid={grid}')
+
+        self.grid = grid
+        self.pixel_threshold = pixel_threshold
+        self.learning_rate = learning_rate
+        self.cooldown = cooldown
+        self.warmup_frames = warmup_frames
+
+        self.region_height = height // rows
+        self.region_width = width // cols
+        self.height = rows * self.region_height
+        self.width = cols * self.region_width
+
+        region_thresholds = np.asarray(region_thresholds, dtype=np.float32)
+        self.region_thresholds = np.broadcast_to(region_thresholds, grid).copy()
+        self._count_thresholds = self.region_thresholds * (self.region_height * self.region_width)
+
+        shape = (self.height, self.width)
+        self._background = np.empty(shape, dtype=np.float32)
+        self._diff = np.empty(shape, dtype=np.float32)
+        self._abs_diff = np.empty(shape, dtype=np.float32)
+        self._changed = np.empty(shape, dtype=bool)
+
+        self.frames = 0
+        self.last_event: Optional[MotionEvent] = None
+
+    def process(self, frame: np.ndarray, timestamp: float = None) -> Optional[MotionEvent]:
+        """
+        Updates the background with ``frame`` (a 2D ``uint8`` array at least as
+        big as the detector's size) and returns the event if it shows motion.
+        """
+
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        frame = frame[:self.height, :self.width]
+        background, diff = self._background, self._diff
+
+        self.frames += 1
+        if self.frames == 1:
+            np.copyto(background, frame)
+            return None
+
+        np.subtract(frame, background, out=diff, dtype=np.float32)
+
+        detect = self.frames > self.warmup_frames and not self._is_cooling_down(timestamp)
+        if detect:
+            np.abs(diff, out=self._abs_diff)
+            np.greater(self._abs_diff, self.pixel_threshold, out=self._changed)
+
+        # Pull the background towards this frame
+        diff *= self.learning_rate
+        background += diff
+
+        if not detect:
+            return None
+
+        rows, cols = self.grid
+        counts = self._changed.reshape(rows, self.region_height, cols, self.region_width).sum(axis=(1, 3))
+
+        motion = counts > self._count_thresholds
+        if not motion.any():
+            return None
+
+        self.last_event = MotionEvent(
+            timestamp=timestamp,
+            regions=[(int(row), int(col)) for row, col in zip(*np.nonzero(motion))],
+            fractions=counts / (self.region_height * self.region_width),
+        )
+
+        return self.last_event
+
+    def _is_cooling_down(self, timestamp: float) -> bool:
+        return self.last_event is not None and timestamp - self.last_event.timestamp < self.cooldown
+
+
+class MotionMonitor(Thread):
+    """
+    Runs a :class:`MotionDetector` on the luma of each frame from a capturer
+    of YUV frames, and sends a notification for each detection.
+
+    If detection falls behind the camera, frames are skipped rather than queued.
+    """
+
+    def __init__(
+            self,
+            capturer: CameraCapturer,
+            detector: MotionDetector,
+            notifier,
+            frame_size: Tuple[int, int],
+            name: str = 'MotionMonitor',
+            daemon: bool = True,
+            **kwargs
+    ):
+        """
+        :param frame_size: ``(width, height)`` the capturer's frames were captured at.
+        :param notifier: Called with a message for each detection; see ``sentrybot.notification``.
+        """
+
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.capturer = capturer
+        self.detector = detector
+        self.notifier = notifier
+
+        width, height = frame_size
+        padded_width, padded_height = yuv_frame_size(width, height)
+        self._luma_shape = (padded_height, padded_width)
+        self._luma = np.empty((height, width), dtype=np.uint8)
+        self._listeners: List[Callable[[MotionEvent], None]] = []
+
+        self.frames_skipped = 0
+        self.process_time = 0.
+        """Seconds taken by the detector for the latest frame."""
+
+    def add_listener(self, listener: Callable[[MotionEvent], None]) -> None:
+        """Calls ``listener`` from the monitor thread with each detection. It must not block."""
+        self._listeners.append(listener)
+
+    def run(self) -> None:
+        luma_size = self._luma_shape[0] * self._luma_shape[1]
+        height, width = self._luma.shape
+
+        with self.capturer.subscribe('motion') as subscription:
+            for frame in subscription:
+                self.frames_skipped += subscription.last_skipped
+
+                if len(frame) < luma_size:
+                    continue
+
+                luma = np.frombuffer(frame.data, dtype=np.uint8, count=luma_size).reshape(self._luma_shape)
+                np.copyto(self._luma, luma[:height, :width])
+
+                # The slot may have been reused while it was being copied
+                if not frame.is_valid():
+                    continue
+
+                t0 = time.perf_counter()
+                event = self.detector.process(self._luma, frame.timestamp)
+                self.process_time = time.perf_counter() - t0
+
+                if event is not None:
+                    self._notify(str(event))
+
+                    for listener in self._listeners:
+                        listener(event)
+
+    def _notify(self, message: str) -> None:
+        # Notifiers may make slow network requests; don't hold up detection
+        Thread(target=self.notifier.notify, args=(message,), daemon=True).start()
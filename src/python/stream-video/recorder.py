@@ -0,0 +1,303 @@
+"""
+Records footage around events: the last few seconds of frames are kept in
+memory, and on a trigger they are written to a segment file on disk along
+with the frames that follow.
+"""
+
+import os
+import socket
+import time
+from collections import deque
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from typing import Deque, List, Optional, Tuple
+
+from camera import CameraCapturer
+
+
+class EventRecorder(Thread):
+    """
+    Keeps the last ``pre_event_seconds`` of a capturer's frames in memory, and
+    when :meth:`trigger` is called, records them and the next
+    ``post_event_seconds`` of frames to a new segment file. Triggers during a
+    recording extend it, up to ``max_segment_seconds``.
+
+    Frames are read through a subscription, so the capture thread never waits
+    on the recorder; disk writes are done by a :class:`SegmentWriter`, so the
+    recorder never waits on the disk either.
+    """
+
+    def __init__(
+            self,
+            capturer: CameraCapturer,
+            writer: 'SegmentWriter',
+            pre_event_seconds: float = 10.,
+            post_event_seconds: float = 20.,
+            max_segment_seconds: float = 120.,
+            max_buffer_bytes: int = 64 * 1024 * 1024,
+            name: str = 'EventRecorder',
+            daemon: bool = True,
+            **kwargs
+    ):
+        """
+        :param max_buffer_bytes: Upper bound on the memory used for the frames
+            kept before an event; the oldest are dropped first.
+        """
+
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.capturer = capturer
+        self.writer = writer
+        self.pre_event_seconds = pre_event_seconds
+        self.post_event_seconds = post_event_seconds
+        self.max_segment_seconds = max_segment_seconds
+        self.max_buffer_bytes = max_buffer_bytes
+
+        self.is_recording = False
+        self.segments = 0
+
+        self._buffer: Deque[Tuple[float, bytes]] = deque()
+        self._buffer_bytes = 0
+        self._trigger_lock = Lock()
+        self._trigger_reason: Optional[str] = None
+        self._segment_start = 0.
+        self._segment_end = 0.
+
+    def run(self) -> None:
+        with self.capturer.subscribe('recorder') as subscription:
+            for frame in subscription:
+                data = frame.to_bytes()
+
+                # The slot may have been reused while it was being copied
+                if frame.is_valid():
+                    self.on_frame(data, frame.timestamp)
+
+    def trigger(self, reason: str = '') -> None:
+        """Starts (or extends) a recording at the next frame. Safe to call from any thread."""
+
+        with self._trigger_lock:
+            self._trigger_reason = reason
+
+    def on_frame(self, data: bytes, timestamp: float) -> None:
+        with self._trigger_lock:
+            reason, self._trigger_reason = self._trigger_reason, None
+
+        if reason is not None:
+            self._on_trigger(reason, timestamp)
+
+        if self.is_recording:
+            self.writer.write(data)
+
+            if timestamp >= self._segment_end:
+                self.writer.close_segment()
+                self.is_recording = False
+        else:
+            self._buffer_frame(data, timestamp)
+
+    def _on_trigger(self, reason: str, timestamp: float) -> None:
+        if not self.is_recording:
+            print(f'Recording event: {reason}')
+
+            self.is_recording = True
+            self.segments += 1
+            self._segment_start = timestamp
+
+            self.writer.open_segment(reason)
+            for _, data in self._buffer:
+                self.writer.write(data)
+
+            self._buffer.clear()
+            self._buffer_bytes = 0
+
+        self._segment_end = min(
+            timestamp + self.post_event_seconds,
+            self._segment_start + self.max_segment_seconds,
+        )
+
+    def _buffer_frame(self, data: bytes, timestamp: float) -> None:
+        buffer = self._buffer
+        buffer.append((timestamp, data))
+        self._buffer_bytes += len(data)
+
+        while buffer and (
+                timestamp - buffer[0][0] > self.pre_event_seconds
+                or self._buffer_bytes > self.max_buffer_bytes
+        ):
+            self._buffer_bytes -= len(buffer.popleft()[1])
+
+
+class SegmentWriter(Thread):
+    """
+    Writes segments to files in ``directory``, from its own thread.
+
+    Frames are queued, then written in batches every ``flush_interval`` seconds
+    with one sequential write each, so the SD card sees few, large, appending
+    writes. If the disk cannot keep up and ``max_queued`` frames are waiting,
+    new frames are dropped (and counted) rather than blocking the caller.
+
+    After each segment is closed, the oldest segments are deleted until those
+    left total at most ``max_total_bytes``.
+    """
+
+    _OPEN = 'open'
+    _WRITE = 'write'
+    _CLOSE = 'close'
+    _STOP = 'stop'
+
+    def __init__(
+            self,
+            directory: str,
+            max_total_bytes: int,
+            extension: str = 'mjpeg',
+            flush_interval: float = 1.,
+            max_queued: int = 1000,
+            name: str = 'SegmentWriter',
+            daemon: bool = True,
+            **kwargs
+    ):
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.directory = os.path.expanduser(directory)
+        self.max_total_bytes = max_total_bytes
+        self.extension = extension
+        self.flush_interval = flush_interval
+
+        self.frames_dropped = 0
+
+        self._queue = Queue(maxsize=max_queued)
+        self._file = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def open_segment(self, reason: str = '') -> None:
+        self._put(self._OPEN, reason)
+
+    def write(self, data: bytes) -> None:
+        try:
+            self._queue.put_nowait((self._WRITE, data))
+        except Full:
+            self.frames_dropped += 1
+
+    def close_segment(self) -> None:
+        self._put(self._CLOSE)
+
+    def stop(self) -> None:
+        """Writes everything queued, closes the current segment, and stops the thread."""
+        self._put(self._STOP)
+        self.join()
+
+    def _put(self, op: str, arg=None) -> None:
+        # Segment boundaries must not be dropped; they are rare, so waiting for room is fine
+        self._queue.put((op, arg))
+
+    def run(self) -> None:
+        while True:
+            ops = self._next_batch()
+            pending: List[bytes] = []
+
+            for op, arg in ops:
+                if op == self._WRITE:
+                    pending.append(arg)
+                    continue
+
+                self._write(pending)
+                pending = []
+
+                if op == self._OPEN:
+                    self._open(arg)
+                else:
+                    self._close()
+                    if op == self._STOP:
+                        return
+
+            self._write(pending)
+
+    def _next_batch(self) -> List[Tuple[str, object]]:
+        """Waits for an operation, then collects those that follow until the flush interval is up."""
+
+        ops = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+
+        while ops[-1][0] == self._WRITE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+
+            try:
+                ops.append(self._queue.get(timeout=timeout))
+            except Empty:
+                break
+
+        return ops
+
+    def _open(self, reason: str) -> None:
+        self._close()
+
+        name = time.strftime('event-%Y%m%d-%H%M%S')
+        path = os.path.join(self.directory, f'{name}.{self.extension}')
+        for i in range(1, 100):
+            if not os.path.exists(path):
+                break
+            path = os.path.join(self.directory, f'{name}-{i}.{self.extension}')
+
+        print(f'Writing segment {path!r}; reason={reason!r}')
+        self._file = open(path, 'wb')
+
+    def _write(self, chunks: List[bytes]) -> None:
+        if self._file is not None and chunks:
+            self._file.write(b''.join(chunks))
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self.apply_retention()
+
+    def apply_retention(self) -> None:
+        """Deletes the oldest segments, but never the newest, until the rest fit in ``max_total_bytes``."""
+
+        suffix = f'.{self.extension}'
+        segments = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.startswith('event-') and entry.name.endswith(suffix):
+                stat = entry.stat()
+                segments.append((stat.st_mtime, entry.path, stat.st_size))
+
+        segments.sort()
+        total = sum(size for _, _, size in segments)
+
+        for _, path, size in segments[:-1]:
+            if total <= self.max_total_bytes:
+                break
+
+            print(f'Deleting old segment {path!r}')
+            os.remove(path)
+            total -= size
+
+
+class TriggerListener(Thread):
+    """
+    Triggers a recording for each UDP datagram received on ``address``; the
+    datagram's text is the reason. Bind to localhost, so only processes on the
+    robot (e.g. the website) can trigger.
+    """
+
+    def __init__(
+            self,
+            recorder: EventRecorder,
+            address: Tuple[str, int],
+            name: str = 'TriggerListener',
+            daemon: bool = True,
+            **kwargs
+    ):
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.recorder = recorder
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(address)
+
+    def run(self) -> None:
+        while True:
+            data, _ = self._socket.recvfrom(1024)
+            self.recorder.trigger(data.decode(errors='replace') or 'socket')
@@ -0,0 +1,56 @@
+import time
+from threading import Thread
+
+from camera import CameraCapturer
+from sentrybot.framebus import FrameBusWriter
+
+
+class FrameBusPublisher(Thread):
+    """
+    Publishes a capturer's frames to a shared memory frame bus, for readers in
+    other processes (see ``sentrybot.framebus``).
+
+    Readers cannot subscribe to the capturer across processes, so instead they
+    leave a heartbeat on the bus: while there has been one in the last
+    ``idle_grace_period`` seconds, this holds a subscription, keeping the
+    camera capturing, and copies each frame to the bus.
+    """
+
+    def __init__(
+            self,
+            capturer: CameraCapturer,
+            writer: FrameBusWriter,
+            idle_grace_period: float = 10.,
+            poll_interval: float = 0.2,
+            name: str = 'FrameBusPublisher',
+            daemon: bool = True,
+            **kwargs
+    ):
+        """:param poll_interval: Seconds between checks for readers while there are none."""
+
+        super().__init__(name=name, daemon=daemon, **kwargs)
+
+        self.capturer = capturer
+        self.writer = writer
+        self.idle_grace_period = idle_grace_period
+        self.poll_interval = poll_interval
+
+    def run(self) -> None:
+        while True:
+            while not self._readers_active():
+                time.sleep(self.poll_interval)
+
+            with self.capturer.subscribe('frame-bus') as subscription:
+                while self._readers_active():
+                    frame = subscription.next(timeout=1.)
+                    if frame is None:
+                        continue
+
+                    seq = self.writer.publish(frame.data, frame.timestamp)
+
+                    # The slot may have been reused while it was being copied
+                    if seq and not frame.is_valid():
+                        self.writer.retract(seq)
+
+    def _readers_active(self) -> bool:
+        return self.writer.readers_active(self.idle_grace_period)
@@ -0,0 +1,65 @@
+"""
+Helpers for serving single frames as ``/snapshot.jpg``, with conditional GET
+(``ETag`` / ``If-None-Match``) and ``?wait_newer_than=<seq>`` long-polling,
+shared by the Flask app and the asyncio server.
+"""
+
+import time
+from typing import List, Optional, Tuple
+
+from frames import Frame
+
+_INSTANCE = f'{time.time_ns():x}'
+"""Sequence numbers restart with the service; this keeps ETags from different runs apart."""
+
+
+def etag(frame: Frame) -> str:
+    return f'"{_INSTANCE}-{frame.seq}"'
+
+
+def is_not_modified(if_none_match: Optional[str], frame: Frame) -> bool:
+    """Returns ``True`` if the client's ``If-None-Match`` header matches the frame."""
+
+    if not if_none_match:
+        return False
+
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+    return '*' in tags or etag(frame) in tags
+
+
+def parse_wait_newer_than(value: Optional[str]) -> Optional[int]:
+    """:raises ValueError: If ``value`` is given but is not a sequence number."""
+
+    if value is None or value == '':
+        return None
+
+    seq = int(value)
+    if seq < 0:
+        raise ValueError(f'wait_newer_than must not be negative; wait_newer_than={value!r}')
+
+    return seq
+
+
+def start_seq(subscription_seq: int, wait_newer_than: Optional[int], latest_seq: int) -> int:
+    """
+    Returns the sequence number a snapshot subscription should wait to pass.
+
+    A ``wait_newer_than`` beyond the latest frame comes from before a restart
+    of the service, so it is ignored rather than waited for.
+    """
+
+    if wait_newer_than is None or wait_newer_than > latest_seq:
+        return subscription_seq
+
+    return max(subscription_seq, wait_newer_than)
+
+
+def headers(frame: Frame) -> List[Tuple[str, str]]:
+    return [
+        ('ETag', etag(frame)),
+        ('X-Frame-Seq', str(frame.seq)),
+        # Clients may keep the image, but must revalidate before showing it again
+        ('Cache-Control', 'no-cache, private'),
+    ]
@@ -0,0 +1,677 @@
+"""
+Synthetic camera output, for running and measuring the stream service
+off-device.
+"""
+
+import itertools
+import re
+import time
+from threading import Event, Lock, Thread
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_EMULATION_PREVENTION = re.compile(b'\x00\x00(?=[\x00-\x03])')
+
+
+class BitWriter:
+    def __init__(self):
+        self._bytes = bytearray()
+        self._bits = 0
+        self._bit_count = 0
+
+    def u(self, bit_count: int, value: int) -> None:
+        for i in range(bit_count - 1, -1, -1):
+            self._bits = (self._bits << 1) | ((value >> i) & 1)
+            self._bit_count += 1
+
+            if self._bit_count == 8:
+                self._bytes.append(self._bits)
+                self._bits = 0
+                self._bit_count = 0
+
+    def ue(self, value: int) -> None:
+        value += 1
+        self.u(2 * value.bit_length() - 1, value)
+
+    def se(self, value: int) -> None:
+        self.ue(2 * value - 1 if value > 0 else -2 * value)
+
+    def align_zero(self) -> None:
+        if self._bit_count:
+            self.u(8 - self._bit_count, 0)
+
+    def raw(self, data: bytes) -> None:
+        """Appends whole bytes; the writer must be byte-aligned."""
+        assert self._bit_count == 0
+        self._bytes += data
+
+    def trailing_bits(self) -> None:
+        self.u(1, 1)
+        self.align_zero()
+
+    def getvalue(self) -> bytes:
+        return bytes(self._bytes)
+
+
+class SyntheticH264Encoder:
+    """
+    Produces a valid H.264 (Constrained Baseline) Annex B stream without a real
+    encoder: key frames are IDR pictures made of uncompressed ``I_PCM``
+    macroblocks showing a moving gradient, and the frames in between are P
+    pictures with every macroblock skipped.
+
+    The output is large for its quality, but it decodes in any browser or
+    decoder, so the H.264 streaming path can be tested off-device.
+    """
+
+    LOG2_MAX_FRAME_NUM = 4
+
+    def __init__(self, width: int, height: int, intra_period: int = 10):
+        self.width = width
+        self.height = height
+        self.intra_period = intra_period
+
+        self.mb_width = (width + 15) // 16
+        self.mb_height = (height + 15) // 16
+
+        self._frame_index = 0
+        self._idr_pic_id = 0
+
+    @property
+    def mb_count(self) -> int:
+        return self.mb_width * self.mb_height
+
+    def sps(self) -> bytes:
+        w = BitWriter()
+        w.u(8, 66)                             # profile_idc: Baseline
+        w.u(8, 0xC0)                           # constraint_set0/1: Constrained Baseline
+        w.u(8, 30)                             # level_idc: 3.0
+        w.ue(0)                                # seq_parameter_set_id
+        w.ue(self.LOG2_MAX_FRAME_NUM - 4)
+        w.ue(2)                                # pic_order_cnt_type
+        w.ue(1)                                # max_num_ref_frames
+        w.u(1, 0)                              # gaps_in_frame_num_value_allowed_flag
+        w.ue(self.mb_width - 1)
+        w.ue(self.mb_height - 1)
+        w.u(1, 1)                              # frame_mbs_only_flag
+        w.u(1, 1)                              # direct_8x8_inference_flag
+
+        crop_right = (16 * self.mb_width - self.width) // 2
+        crop_bottom = (16 * self.mb_height - self.height) // 2
+        if crop_right or crop_bottom:
+            w.u(1, 1)
+            w.ue(0)
+            w.ue(crop_right)
+            w.ue(0)
+            w.ue(crop_bottom)
+        else:
+            w.u(1, 0)
+
+        w.u(1, 0)                              # vui_parameters_present_flag
+        w.trailing_bits()
+
+        return self._nal(3, 7, w.getvalue())
+
+    def pps(self) -> bytes:
+        w = BitWriter()
+        w.ue(0)                                # pic_parameter_set_id
+        w.ue(0)                                # seq_parameter_set_id
+        w.u(1, 0)                              # entropy_coding_mode_flag: CAVLC
+        w.u(1, 0)                              # bottom_field_pic_order_in_frame_present_flag
+        w.ue(0)                                # num_slice_groups_minus1
+        w.ue(0)                                # num_ref_idx_l0_default_active_minus1
+        w.ue(0)                                # num_ref_idx_l1_default_active_minus1
+        w.u(1, 0)                              # weighted_pred_flag
+        w.u(2, 0)                              # weighted_bipred_idc
+        w.se(0)                                # pic_init_qp_minus26
+        w.se(0)                                # pic_init_qs_minus26
+        w.se(0)                                # chroma_qp_index_offset
+        w.u(1, 1)                              # deblocking_filter_control_present_flag
+        w.u(1, 0)                              # constrained_intra_pred_flag
+        w.u(1, 0)                              # redundant_pic_cnt_present_flag
+        w.trailing_bits()
+
+        return self._nal(3, 8, w.getvalue())
+
+    def next_frame(self) -> bytes:
+        """Returns the next frame as Annex B data; key frames are preceded by the SPS and PPS."""
+
+        index = self._frame_index
+        self._frame_index += 1
+        gop_index = index % self.intra_period
+
+        if gop_index == 0:
+            data = self._start_code(self.sps()) + self._start_code(self.pps()) + self._start_code(self._idr(index))
+            self._idr_pic_id ^= 1
+            return data
+        else:
+            return self._start_code(self._p_skip(gop_index))
+
+    def _idr(self, index: int) -> bytes:
+        w = BitWriter()
+        self._slice_header(w, slice_type=7, frame_num=0, idr=True)
+
+        for mb_y in range(self.mb_height):
+            for mb_x in range(self.mb_width):
+                w.ue(25)                       # mb_type: I_PCM
+                w.align_zero()
+                w.raw(self._pcm_macroblock(mb_x, mb_y, index))
+
+        w.trailing_bits()
+        return self._nal(3, 5, w.getvalue())
+
+    def _p_skip(self, frame_num: int) -> bytes:
+        w = BitWriter()
+        self._slice_header(w, slice_type=5, frame_num=frame_num % (1 << self.LOG2_MAX_FRAME_NUM), idr=False)
+        w.ue(self.mb_count)                    # mb_skip_run: every macroblock
+        w.trailing_bits()
+        return self._nal(2, 1, w.getvalue())
+
+    def _slice_header(self, w: BitWriter, slice_type: int, frame_num: int, idr: bool) -> None:
+        w.ue(0)                                # first_mb_in_slice
+        w.ue(slice_type)
+        w.ue(0)                                # pic_parameter_set_id
+        w.u(self.LOG2_MAX_FRAME_NUM, frame_num)
+
+        if idr:
+            w.ue(self._idr_pic_id)
+        else:
+            w.u(1, 0)                          # num_ref_idx_active_override_flag
+            w.u(1, 0)                          # ref_pic_list_modification_flag_l0
+
+        if idr:
+            w.u(1, 0)                          # no_output_of_prior_pics_flag
+            w.u(1, 0)                          # long_term_reference_flag
+        else:
+            w.u(1, 0)                          # adaptive_ref_pic_marking_mode_flag
+
+        w.se(0)                                # slice_qp_delta
+        w.ue(1)                                # disable_deblocking_filter_idc
+
+    def _pcm_macroblock(self, mb_x: int, mb_y: int, index: int) -> bytes:
+        # A diagonal gradient that moves with each key frame; values are kept
+        # in the video range, which also avoids runs of zero bytes.
+        base = (16 * (mb_x + mb_y) + 8 * index) % 192
+        luma = bytes(16 + (base + x + y) % 220 for y in range(16) for x in range(16))
+        chroma = bytes((128,)) * 128
+        return luma + chroma
+
+    @staticmethod
+    def _nal(nal_ref_idc: int, nal_unit_type: int, rbsp: bytes) -> bytes:
+        header = bytes(((nal_ref_idc << 5) | nal_unit_type,))
+        return header + _EMULATION_PREVENTION.sub(b'\x00\x00\x03', rbsp)
+
+    @staticmethod
+    def _start_code(nal: bytes) -> bytes:
+        return b'\x00\x00\x00\x01' + nal
+
+
+def _zigzag() -> np.ndarray:
+    """Returns the natural (row-major) index of each coefficient, in zigzag order."""
+
+    order = []
+    for s in range(15):
+        cells = [(row, s - row) for row in range(8) if 0 <= s - row < 8]
+        order.extend(row * 8 + col for row, col in (cells if s % 2 else reversed(cells)))
+
+    return np.array(order)
+
+
+_ZIGZAG = _zigzag()
+
+_LUMA_QUANTIZATION = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+])
+
+_CHROMA_QUANTIZATION = np.full(64, 99)
+_CHROMA_QUANTIZATION.reshape(8, 8)[:4, :4] = [
+    [17, 18, 24, 47],
+    [18, 21, 26, 66],
+    [24, 26, 56, 99],
+    [47, 66, 99, 99],
+]
+
+# Huffman tables from Annex K of the JPEG standard: the number of codes of each
+# length (1-16 bits), then the symbols in order of increasing code length.
+_DC_LUMA_HUFFMAN = ((0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0), tuple(range(12)))
+_DC_CHROMA_HUFFMAN = ((0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0), tuple(range(12)))
+_AC_LUMA_HUFFMAN = (
+    (0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7D),
+    bytes.fromhex(
+        '01020300041105122131410613516107227114328191a1082342b1c11552d1f0'
+        '2433627282090a161718191a25262728292a3435363738393a43444546474849'
+        '4a535455565758595a636465666768696a737475767778797a83848586878889'
+        '8a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5'
+        'c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8'
+        'f9fa'
+    ),
+)
+_AC_CHROMA_HUFFMAN = (
+    (0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77),
+    bytes.fromhex(
+        '000102031104052131061241510761711322328108144291a1b1c109233352f0'
+        '156272d10a162434e125f11718191a262728292a35363738393a434445464748'
+        '494a535455565758595a636465666768696a737475767778797a828384858687'
+        '88898a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3'
+        'c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae2e3e4e5e6e7e8e9eaf2f3f4f5f6f7f8'
+        'f9fa'
+    ),
+)
+
+
+def _dct_matrix() -> np.ndarray:
+    k = np.arange(8)
+    matrix = np.cos((2 * k[None, :] + 1) * k[:, None] * np.pi / 16) / 2
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix()
+
+
+class _HuffmanTable:
+    def __init__(self, bits: Sequence[int], symbols: Sequence[int]):
+        self.bits = bits
+        self.symbols = symbols
+
+        # Canonical codes: consecutive within a length, doubling at each longer length
+        self.codes = np.zeros(256, dtype=np.int64)
+        self.lengths = np.zeros(256, dtype=np.int64)
+
+        code = 0
+        symbol_iter = iter(symbols)
+        for length, count in enumerate(bits, start=1):
+            for _ in range(count):
+                symbol = next(symbol_iter)
+                self.codes[symbol] = code
+                self.lengths[symbol] = length
+                code += 1
+            code <<= 1
+
+    def segment(self, table_class: int, table_id: int) -> bytes:
+        payload = bytes(((table_class << 4) | table_id,)) + bytes(self.bits) + bytes(self.symbols)
+        return b'\xff\xc4' + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+
+_TABLES = (
+    _HuffmanTable(*_DC_LUMA_HUFFMAN),
+    _HuffmanTable(*_AC_LUMA_HUFFMAN),
+    _HuffmanTable(*_DC_CHROMA_HUFFMAN),
+    _HuffmanTable(*_AC_CHROMA_HUFFMAN),
+)
+
+
+def _magnitude_category(values: np.ndarray) -> np.ndarray:
+    """The JPEG "size" of each value: the number of bits in its magnitude."""
+
+    magnitudes = np.abs(values)
+    categories = np.zeros(values.shape, dtype=np.int64)
+    nonzero = magnitudes > 0
+    categories[nonzero] = np.floor(np.log2(magnitudes[nonzero])).astype(np.int64) + 1
+    return categories
+
+
+def _amplitude_bits(values: np.ndarray, categories: np.ndarray) -> np.ndarray:
+    """The bits JPEG appends after a symbol for each value: negatives are one's complement."""
+    return np.where(values >= 0, values, values + (1 << categories) - 1)
+
+
+class JPEGEncoder:
+    """
+    A baseline JPEG (YCbCr 4:2:0, standard tables) encoder written with NumPy.
+
+    It is not fast enough to encode every frame of a video, but it is fast
+    enough to prepare a set of frames to play back, and its output decodes
+    in any browser or decoder.
+    """
+
+    def __init__(self, quality: int = 85):
+        self.quality = quality
+
+        scale = 5000 / quality if quality < 50 else 200 - 2 * quality
+        self.quantization = [
+            np.clip((table * scale + 50) // 100, 1, 255).astype(np.int64)
+            for table in (_LUMA_QUANTIZATION, _CHROMA_QUANTIZATION)
+        ]
+
+    def encode(self, rgb: np.ndarray) -> bytes:
+        """Encodes an ``(height, width, 3)`` ``uint8`` RGB image."""
+
+        height, width, _ = rgb.shape
+
+        # Pad to whole 16x16 macroblocks by repeating the edge
+        padded_height, padded_width = (height + 15) // 16 * 16, (width + 15) // 16 * 16
+        rgb = np.pad(rgb, ((0, padded_height - height), (0, padded_width - width), (0, 0)), mode='edge')
+        rgb = rgb.astype(np.float64)
+
+        r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        y = 0.299 * r + 0.587 * g + 0.114 * b
+        cb = -0.168736 * r - 0.331264 * g + 0.5 * b + 128
+        cr = 0.5 * r - 0.418688 * g - 0.081312 * b + 128
+
+        def subsample(plane: np.ndarray) -> np.ndarray:
+            return plane.reshape(padded_height // 2, 2, padded_width // 2, 2).mean(axis=(1, 3))
+
+        mb_rows, mb_cols = padded_height // 16, padded_width // 16
+
+        # Coefficients of each component's blocks, in the order they appear in the scan:
+        # per macroblock, 4 luma blocks (left to right, top to bottom), then Cb, then Cr.
+        y_blocks = self._blocks(y, 0).reshape(mb_rows, 2, mb_cols, 2, 64).transpose(0, 2, 1, 3, 4)
+        y_blocks = y_blocks.reshape(mb_rows * mb_cols, 4, 64)
+        cb_blocks = self._blocks(subsample(cb), 1).reshape(mb_rows * mb_cols, 1, 64)
+        cr_blocks = self._blocks(subsample(cr), 1).reshape(mb_rows * mb_cols, 1, 64)
+
+        blocks = np.concatenate((y_blocks, cb_blocks, cr_blocks), axis=1).reshape(-1, 64)
+        components = np.tile([0, 0, 0, 0, 1, 2], mb_rows * mb_cols)
+
+        scan = self._entropy_code(blocks, components)
+
+        return b''.join((
+            b'\xff\xd8',
+            self._app0(),
+            self._dqt(),
+            self._sof0(width, height),
+            *(table.segment(i % 2, i // 2) for i, table in enumerate(_TABLES)),
+            self._sos(),
+            scan.replace(b'\xff', b'\xff\x00'),
+            b'\xff\xd9',
+        ))
+
+    def _blocks(self, plane: np.ndarray, table: int) -> np.ndarray:
+        """Returns the quantized DCT coefficients of each 8x8 block, row by row, in zigzag order."""
+
+        rows, cols = plane.shape[0] // 8, plane.shape[1] // 8
+        blocks = (plane - 128).reshape(rows, 8, cols, 8).transpose(0, 2, 1, 3)
+        coefficients = _DCT @ blocks @ _DCT.T
+        coefficients = coefficients.reshape(rows, cols, 64)[..., _ZIGZAG]
+        return np.round(coefficients / self.quantization[table][_ZIGZAG]).astype(np.int64)
+
+    @staticmethod
+    def _entropy_code(blocks: np.ndarray, components: np.ndarray) -> bytes:
+        num_blocks = len(blocks)
+        tables = np.where(components == 0, 0, 2)
+
+        # DC: the difference from the previous block of the same component
+        dc = blocks[:, 0]
+        dc_diff = np.empty_like(dc)
+        for component in range(3):
+            index = np.nonzero(components == component)[0]
+            dc_diff[index] = np.diff(dc[index], prepend=0)
+
+        dc_size = _magnitude_category(dc_diff)
+
+        # AC: each nonzero coefficient is coded with the run of zeros before it, split
+        # into runs of 16 zeros (ZRL) and a remainder; trailing zeros become an EOB
+        ac = blocks[:, 1:]
+        block_index, position = np.nonzero(ac)
+        values = ac[block_index, position]
+
+        previous = np.full(len(position), -1)
+        same_block = np.r_[False, block_index[1:] == block_index[:-1]]
+        previous[same_block] = position[np.nonzero(same_block)[0] - 1]
+        runs = position - previous - 1
+        zrl_counts, runs = runs // 16, runs % 16
+        ac_size = _magnitude_category(values)
+
+        last_position = np.full(num_blocks, -1)
+        last_position[block_index] = position
+        eob_blocks = np.nonzero(last_position < 62)[0]
+
+        # Every symbol, as (sort key, code, code length, extra bits, extra length)
+        def symbols(keys, table, symbol, extra=None, extra_length=None):
+            huffman_codes = np.stack([t.codes for t in _TABLES])
+            huffman_lengths = np.stack([t.lengths for t in _TABLES])
+            zeros = np.zeros(len(keys), dtype=np.int64)
+            return (
+                keys,
+                huffman_codes[table, symbol],
+                huffman_lengths[table, symbol],
+                zeros if extra is None else extra,
+                zeros if extra_length is None else extra_length,
+            )
+
+        # Within a block: DC, then each coefficient's ZRLs and symbol, then EOB
+        block_key = np.arange(num_blocks) * 512
+        zrl_block = np.repeat(block_index, zrl_counts)
+        zrl_position = np.repeat(position, zrl_counts)
+        zrl_offset = np.arange(len(zrl_block)) - np.repeat(np.cumsum(zrl_counts) - zrl_counts, zrl_counts)
+
+        parts = [
+            symbols(block_key, tables, dc_size, _amplitude_bits(dc_diff, dc_size), dc_size),
+            symbols(block_key[zrl_block] + 1 + zrl_position * 8 + zrl_offset, tables[zrl_block] + 1,
+                    np.full(len(zrl_block), 0xF0)),
+            symbols(block_key[block_index] + 1 + position * 8 + 4, tables[block_index] + 1,
+                    runs * 16 + ac_size, _amplitude_bits(values, ac_size), ac_size),
+            symbols(block_key[eob_blocks] + 511, tables[eob_blocks] + 1, np.zeros(len(eob_blocks), dtype=np.int64)),
+        ]
+
+        keys, codes, code_lengths, extras, extra_lengths = (np.concatenate(column) for column in zip(*parts))
+        order = np.argsort(keys, kind='stable')
+
+        # Interleave each symbol's code with its extra bits, then pack all the bits
+        values = np.stack((codes[order], extras[order]), axis=1).reshape(-1)
+        lengths = np.stack((code_lengths[order], extra_lengths[order]), axis=1).reshape(-1)
+
+        total = int(lengths.sum())
+        starts = np.cumsum(lengths) - lengths
+        bit_index = np.arange(total) - np.repeat(starts, lengths)
+        shifts = np.repeat(lengths, lengths) - 1 - bit_index
+        bits = (np.repeat(values, lengths) >> shifts) & 1
+
+        # Pad the last byte with ones
+        bits = np.concatenate((bits, np.ones(-total % 8, dtype=np.int64)))
+        return np.packbits(bits.astype(np.uint8)).tobytes()
+
+    @staticmethod
+    def _app0() -> bytes:
+        payload = b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+        return b'\xff\xe0' + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+    def _dqt(self) -> bytes:
+        payload = b''.join(bytes((i,)) + bytes(table[_ZIGZAG].tolist()) for i, table in enumerate(self.quantization))
+        return b'\xff\xdb' + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+    @staticmethod
+    def _sof0(width: int, height: int) -> bytes:
+        payload = (
+                b'\x08' + height.to_bytes(2, 'big') + width.to_bytes(2, 'big') + b'\x03'
+                + b'\x01\x22\x00'              # Y: 2x2 sampling, quantization table 0
+                + b'\x02\x11\x01'              # Cb
+                + b'\x03\x11\x01'              # Cr
+        )
+        return b'\xff\xc0' + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+    @staticmethod
+    def _sos() -> bytes:
+        payload = b'\x03' + b'\x01\x00' + b'\x02\x11' + b'\x03\x11' + b'\x00\x3f\x00'
+        return b'\xff\xda' + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+
+def com_segment(text: str) -> bytes:
+    payload = text.encode()
+    return b'\xff\xfe' + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+
+def capture_time(jpeg: bytes) -> Optional[float]:
+    """Returns the wall-clock capture time that :class:`SyntheticCamera` put in the JPEG, if any."""
+
+    if jpeg[2:4] != b'\xff\xfe':
+        return None
+
+    length = int.from_bytes(jpeg[4:6], 'big')
+    name, _, value = jpeg[6:4 + length].decode(errors='replace').partition('=')
+    return float(value) if name == 'captured_at' else None
+
+
+class SyntheticCamera:
+    """
+    Stands in for ``picamera.PiCamera`` off the Pi, so the stream service can
+    be run and measured anywhere.
+
+    Captures show a colour gradient with shapes moving across it, plus noise;
+    ``entropy`` (0-1) sets the amount of noise, and so how large the JPEGs
+    are. Encoding a JPEG takes far longer than a frame, so
+    ``distinct_frames`` frames are encoded on the first capture at each size,
+    and played in a loop. Each JPEG is written with a comment segment holding
+    the wall-clock time it was captured (see :func:`capture_time`).
+
+    Recordings are H.264 from :class:`SyntheticH264Encoder`. As with the real
+    camera, each frame is written in several buffers, and each splitter port's
+    encoder has its own ``frame.complete``; ``frame`` is that of whichever
+    encoder is found first.
+    """
+
+    def __init__(
+            self,
+            resolution: Tuple[int, int] = (648, 486),
+            framerate: float = 10,
+            entropy: float = 0.2,
+            distinct_frames: int = 10,
+    ):
+        self.resolution = resolution
+        self.framerate = framerate
+        self.rotation = 0
+        self.entropy = entropy
+        self.distinct_frames = distinct_frames
+        self._encoders: Dict[int, SimpleNamespace] = {}
+
+        self._frames: Dict[tuple, List[bytes]] = {}
+        self._frames_lock = Lock()
+        self._recordings: Dict[int, Tuple[Event, Thread]] = {}
+
+    @property
+    def frame(self) -> Optional[SimpleNamespace]:
+        for encoder in list(self._encoders.values()):
+            return encoder.frame
+
+        return None
+
+    def render(self, width: int, height: int, index: int) -> np.ndarray:
+        """Returns frame ``index`` of the scene as an ``(height, width, 3)`` ``uint8`` RGB image."""
+
+        y, x = np.mgrid[:height, :width]
+        image = np.stack((
+            x * 200 // max(width, 1) + 30,
+            y * 200 // max(height, 1) + 30,
+            np.full((height, width), 110),
+        ), axis=-1).astype(np.float32)
+
+        # Shapes that cross the frame once per loop of the distinct frames
+        phase = index / self.distinct_frames
+        size = max(4, min(width, height) // 6)
+        for i, colour in enumerate(((230, 60, 60), (60, 230, 60), (60, 60, 230))):
+            cx = int((phase + i / 3) % 1. * width)
+            cy = int((0.25 + 0.25 * i) * height)
+            image[max(cy - size, 0):cy + size, max(cx - size, 0):cx + size] = colour
+
+        rng = np.random.default_rng(index)
+        image += rng.normal(0., 64. * self.entropy, image.shape).astype(np.float32)
+
+        return np.clip(image, 0, 255).astype(np.uint8)
+
+    def capture_continuous(
+            self,
+            output,
+            format: str = 'jpeg',
+            use_video_port: bool = False,
+            resize: Tuple[int, int] = None,
+            splitter_port: int = 0,
+            quality: int = None,
+            **kwargs
+    ):
+        """Like ``PiCamera.capture_continuous`` with a file-like ``output``: writes each frame to it, then yields it."""
+
+        width, height = resize or self.resolution
+        frames = self._get_frames(format, width, height, quality or 85)
+
+        next_time = time.monotonic()
+        for index in itertools.count():
+            next_time += 1 / self.framerate
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind; carry on from now rather than catching up in a burst
+                next_time = time.monotonic()
+
+            frame = frames[index % len(frames)]
+            if format == 'jpeg':
+                output.write(frame[:2] + com_segment(f'captured_at={time.time():.6f}'))
+                output.write(memoryview(frame)[2:])
+            else:
+                output.write(frame)
+
+            yield output
+
+    def _get_frames(self, format: str, width: int, height: int, quality: int) -> List[bytes]:
+        if format not in ('jpeg', 'yuv'):
+            raise ValueError(f'Unsupported format; format={format!r}')
+
+        key = (format, width, height, quality, self.entropy)
+        with self._frames_lock:
+            if key not in self._frames:
+                t0 = time.monotonic()
+                self._frames[key] = [
+                    self._encode(format, self.render(width, height, index), quality)
+                    for index in range(self.distinct_frames)
+                ]
+                print(f'Synthetic camera: prepared {len(self._frames[key])} {width}x{height} {format} frames '
+                      f'in {time.monotonic() - t0:.1f}s')
+
+            return self._frames[key]
+
+    @staticmethod
+    def _encode(format: str, image: np.ndarray, quality: int) -> bytes:
+        if format == 'jpeg':
+            return JPEGEncoder(quality).encode(image)
+
+        # I420, padded as the camera pads YUV captures
+        height, width, _ = image.shape
+        padded_width, padded_height = (width + 31) // 32 * 32, (height + 15) // 16 * 16
+
+        luma = np.zeros((padded_height, padded_width), dtype=np.uint8)
+        luma[:height, :width] = image.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        chroma = np.full(padded_width * padded_height // 2, 128, dtype=np.uint8)
+
+        return luma.tobytes() + chroma.tobytes()
+
+    def start_recording(self, output, splitter_port: int = 1, resize=None, intra_period: int = 10, **kwargs) -> None:
+        width, height = resize or self.resolution
+        encoder = SyntheticH264Encoder(width, height, intra_period)
+        port = SimpleNamespace(frame=SimpleNamespace(complete=False))
+        stopped = Event()
+
+        def record():
+            while not stopped.wait(1 / self.framerate):
+                data = encoder.next_frame()
+                middle = len(data) // 2
+
+                # Two buffers, a little apart, like the encoder's output buffers
+                port.frame = SimpleNamespace(complete=False)
+                output.write(data[:middle])
+                time.sleep(0.001)
+                port.frame = SimpleNamespace(complete=True)
+                output.write(data[middle:])
+
+        self._encoders[splitter_port] = port
+        thread = Thread(target=record, daemon=True)
+        thread.start()
+        self._recordings[splitter_port] = (stopped, thread)
+
+    def wait_recording(self, timeout: float = 0, splitter_port: int = 1) -> None:
+        time.sleep(timeout)
+
+    def stop_recording(self, splitter_port: int = 1) -> None:
+        stopped, thread = self._recordings.pop(splitter_port)
+        stopped.set()
+        thread.join()
+        self._encoders.pop(splitter_port)
@@ -0,0 +1,46 @@
+import time
+import unittest
+from unittest import TestCase
+
+from adaptive import AdaptiveStreams
+from camera import CameraCapturer
+
+
+class AdaptiveClientTest(TestCase):
+    def setUp(self):
+        self.capturers = [CameraCapturer(camera=None) for _ in range(2)]
+        self.streams = AdaptiveStreams(
+            ladder=[('full', self.capturers[0]), ('thumbnail', self.capturers[1])],
+            latency_budget=0.1,
+            min_framerate=1.,
+        )
+
+    def send(self, client, latency: float, count: int) -> None:
+        frames = client.capturer.frames
+        for _ in range(count):
+            frames.write(b'jpeg')
+            frame = frames.publish(timestamp=time.monotonic() - latency)
+            client.on_sent(frame, send_time=0.001)
+
+    def test_steps_down_ladder_then_frame_rate_and_recovers(self):
+        with self.streams.client('test') as client:
+            self.assertEqual([client.stats()], self.streams.stats())
+
+            self.send(client, latency=1., count=1)
+            self.assertEqual('thumbnail', client.stream_name)
+            self.assertEqual(1, self.capturers[1].subscribers)
+            self.assertEqual(0, self.capturers[0].subscribers)
+
+            self.send(client, latency=1., count=1 + client.HOLD_FRAMES)
+            self.assertGreater(client.frame_interval, 0)
+
+            self.send(client, latency=0., count=50)
+            self.assertEqual(0, client.frame_interval)
+            self.assertEqual('full', client.stream_name)
+
+        self.assertEqual([], self.streams.stats())
+        self.assertEqual(0, self.capturers[0].subscribers)
+
+
+if __name__ == '__main__':
+    unittest.main()
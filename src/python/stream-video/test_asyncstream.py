@@ -0,0 +1,153 @@
+import asyncio
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from flask import Flask
+
+from asyncstream import MAX_REQUEST_BODY_LEN, WEBSOCKET_CLOSE, WEBSOCKET_PING, AsyncStreamServer, \
+    _read_websocket_until_close
+
+
+class FakeWriter:
+    def __init__(self):
+        self.written = b''
+
+    def write(self, data: bytes) -> None:
+        self.written += data
+
+
+class FakeH264Capturer:
+    init_segment = None
+    latest_seq = 0
+
+    def subscribe(self) -> None:
+        pass
+
+    def unsubscribe(self) -> None:
+        pass
+
+    def start_fragments(self):
+        return None, None, []
+
+
+def websocket_frame(opcode: int, payload: bytes, mask: bytes = b'\x01\x02\x03\x04') -> bytes:
+    masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return bytes((0x80 | opcode, 0x80 | len(payload))) + mask + masked
+
+
+class AsyncStreamServerTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        app = Flask(__name__)
+
+        @app.route('/login', methods=['POST'])
+        def login():
+            return 'ok'
+
+        self.server = await asyncio.start_server(AsyncStreamServer(app, streams={})._handle_connection, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def request(self, head: bytes) -> bytes:
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(head)
+        await writer.drain()
+
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def test_rejects_bad_content_length(self):
+        response = await self.request(b'POST /login HTTP/1.1\r\nContent-Length: abc\r\n\r\n')
+        self.assertTrue(response.startswith(b'HTTP/1.1 400 '))
+
+    async def test_rejects_oversized_body_unread(self):
+        response = await self.request(
+            f'POST /login HTTP/1.1\r\nContent-Length: {MAX_REQUEST_BODY_LEN + 1}\r\n\r\n'.encode())
+        self.assertTrue(response.startswith(b'HTTP/1.1 413 '))
+
+    async def test_serves_small_body(self):
+        response = await self.request(b'POST /login HTTP/1.1\r\nContent-Length: 3\r\n\r\na=1')
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 '))
+
+
+
+class WebSocketReadTest(IsolatedAsyncioTestCase):
+    async def read(self, data: bytes) -> bytes:
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+
+        writer = FakeWriter()
+        await _read_websocket_until_close(reader, writer)
+        return writer.written
+
+    async def test_answers_ping_and_close(self):
+        written = await self.read(
+            websocket_frame(WEBSOCKET_PING, b'hello') + websocket_frame(WEBSOCKET_CLOSE, b'\x03\xe8'))
+        self.assertEqual(b'\x8a\x05hello\x88\x02\x03\xe8', written)
+
+    async def test_rejects_long_frame(self):
+        # A 16-bit length; the payload is never read
+        written = await self.read(bytes((0x80 | WEBSOCKET_PING, 0x80 | 126)) + (1 << 15).to_bytes(2, 'big'))
+        self.assertEqual(b'\x88\x02' + (1009).to_bytes(2, 'big'), written)
+
+
+class FrameNotifyTest(IsolatedAsyncioTestCase):
+    async def test_wakes_only_viewers_of_the_publishing_capturer(self):
+        class Frames:
+            checks = 0
+            seq = 0
+
+            @property
+            def latest_seq(self):
+                self.checks += 1
+                return self.seq
+
+        class Capturer:
+            def __init__(self):
+                self.frames = Frames()
+
+        watched, other = Capturer(), Capturer()
+        server = AsyncStreamServer(Flask(__name__), streams={})
+        server._new_frame = {watched: asyncio.Condition(), other: asyncio.Condition()}
+
+        waiting = asyncio.ensure_future(server._wait_for_newer(watched, 0))
+        await asyncio.sleep(0.01)
+        checks = watched.frames.checks
+
+        for _ in range(10):
+            server._notify_new_frame(other)
+            await asyncio.sleep(0)
+
+        self.assertEqual(checks, watched.frames.checks)
+
+        watched.frames.seq = 1
+        server._notify_new_frame(watched)
+        await asyncio.wait_for(waiting, 1.)
+
+
+class H264WebSocketTest(IsolatedAsyncioTestCase):
+    async def test_client_closes_before_first_key_frame(self):
+        capturer = FakeH264Capturer()
+        server = AsyncStreamServer(Flask(__name__), streams={})
+        server._new_frame[capturer] = asyncio.Condition()
+
+        reader = asyncio.StreamReader()
+        reader.feed_data(websocket_frame(WEBSOCKET_CLOSE, b'\x03\xe8'))
+        reader.feed_eof()
+        writer = FakeWriter()
+        headers = [('Upgrade', 'websocket'), ('Sec-WebSocket-Key', 'dGhlIHNhbXBsZSBub25jZQ==')]
+
+        await asyncio.wait_for(server._stream_h264_websocket(capturer, reader, writer, headers), 1.)
+
+        # The handshake and the close reply, and nothing else
+        self.assertTrue(writer.written.startswith(b'HTTP/1.1 101 '))
+        self.assertTrue(writer.written.endswith(b'\r\n\r\n\x88\x02\x03\xe8'))
+        self.assertEqual(0, server.clients)
+
+
+if __name__ == '__main__':
+    unittest.main()
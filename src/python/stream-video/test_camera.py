@@ -0,0 +1,89 @@
+import time
+import unittest
+from unittest import TestCase
+
+from camera import CameraCapturer
+
+
+class SubscriptionTest(TestCase):
+    def setUp(self):
+        self.capturer = CameraCapturer(camera=None)
+
+    def publish(self, count: int = 1):
+        for _ in range(count):
+            self.capturer.frames.write(b'jpeg')
+            self.capturer.frames.publish()
+
+    def test_first_frame_is_returned_immediately(self):
+        self.publish(3)
+
+        with self.capturer.subscribe() as subscription:
+            frame = subscription.next(timeout=0)
+
+        self.assertEqual(3, frame.seq)
+        self.assertEqual(0, subscription.skipped)
+        self.assertTrue(subscription.closed)
+
+    def test_behind_subscriber_gets_newest_frame_and_skip_count(self):
+        subscription = self.capturer.subscribe()
+        self.publish()
+        subscription.next(timeout=0)
+
+        self.publish(4)
+        frame = subscription.next(timeout=0)
+
+        self.assertEqual(5, frame.seq)
+        self.assertEqual(3, subscription.last_skipped)
+        self.assertEqual(3, subscription.skipped)
+        self.assertEqual(2, subscription.delivered)
+
+    def test_caught_up_subscriber_times_out(self):
+        subscription = self.capturer.subscribe()
+        self.publish()
+        subscription.next(timeout=0)
+
+        self.assertIsNone(subscription.next(timeout=0.01))
+
+
+class FakeCamera:
+    def capture_continuous(self, output, **kwargs):
+        while True:
+            output.write(b'jpeg')
+            yield output
+            time.sleep(0.005)
+
+
+class CaptureOnDemandTest(TestCase):
+    def setUp(self):
+        self.capturer = CameraCapturer(FakeCamera(), idle_grace_period=0.05)
+        self.capturer.start()
+
+    def wait_until(self, predicate, timeout: float = 2.) -> bool:
+        t_end = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > t_end:
+                return False
+            time.sleep(0.005)
+
+        return True
+
+    def test_pauses_without_subscribers_and_wakes_on_subscribe(self):
+        time.sleep(0.1)
+        self.assertEqual(0, self.capturer.frames.latest_seq)
+
+        with self.capturer.subscribe() as subscription:
+            subscription.next(timeout=2.)
+
+        self.assertTrue(self.wait_until(lambda: not self.capturer.is_capturing))
+        stale_seq = self.capturer.frames.latest_seq
+
+        with self.capturer.subscribe() as subscription:
+            frame = subscription.next(timeout=2.)
+
+        self.assertGreater(frame.seq, stale_seq)
+        self.assertIsNotNone(self.capturer.time_to_first_frame)
+        self.assertEqual(0, self.capturer.subscribers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from unittest import TestCase
+
+from frames import FrameRing
+
+
+class FrameRingTest(TestCase):
+    def setUp(self):
+        self.ring = FrameRing(num_slots=3, slot_size=4)
+
+    def publish(self, data: bytes):
+        self.ring.write(data)
+        return self.ring.publish()
+
+    def test_empty(self):
+        self.assertEqual(0, self.ring.latest_seq)
+        self.assertIsNone(self.ring.latest())
+        self.assertIsNone(self.ring.get(0))
+
+    def test_publish(self):
+        frame = self.publish(b'ab')
+
+        self.assertEqual(1, frame.seq)
+        self.assertEqual(b'ab', frame.data)
+        self.assertTrue(frame.data.readonly)
+        self.assertIs(frame, self.ring.latest())
+        self.assertIs(frame, self.ring.get(1))
+
+    def test_write_grows_slot(self):
+        frame = self.publish(b'abc')
+        self.ring.write(b'def')
+        self.ring.write(b'ghi')
+        big = self.ring.publish()
+
+        self.assertEqual(b'abc', frame.data)
+        self.assertEqual(b'defghi', big.data)
+
+    def test_slot_reuse_invalidates_old_frame(self):
+        first = self.publish(b'1')
+        self.publish(b'2')
+        self.publish(b'3')
+        self.assertTrue(first.is_valid())
+
+        self.ring.write(b'4')
+        self.assertFalse(first.is_valid())
+        self.assertIsNone(self.ring.get(first.seq))
+
+        fourth = self.ring.publish()
+        self.assertIs(fourth, self.ring.get(4))
+
+    def test_to_bytes_copies_once(self):
+        frame = self.publish(b'abcd')
+        copied = self.ring.bytes_copied
+
+        self.assertEqual(b'abcd', frame.to_bytes())
+        self.assertIs(frame.to_bytes(), frame.to_bytes())
+        self.assertEqual(copied + 4, self.ring.bytes_copied)
+
+    def test_part_to_bytes_counts_framing(self):
+        frame = self.publish(b'abcd')
+        copied = self.ring.bytes_copied
+
+        self.assertEqual(bytes(frame.part), frame.part_to_bytes())
+        frame.part_to_bytes()
+        self.assertEqual(copied + len(frame.part), self.ring.bytes_copied)
+
+    def test_part_is_framed_in_place(self):
+        frame = self.publish(b'jpeg')
+
+        self.assertEqual(
+            b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: 4\r\n'
+            b'\r\n'
+            b'jpeg\r\n',
+            frame.part
+        )
+        self.assertIs(frame.part.obj, frame.data.obj)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import time
+import unittest
+from struct import unpack_from
+from unittest import TestCase
+
+from fmp4 import NAL_IDR_SLICE, NAL_PPS, NAL_SPS, nal_unit_type, split_nal_units
+from h264 import H264Capturer, _H264Output
+from synthetic import SyntheticCamera, SyntheticH264Encoder
+
+
+def box_types(data: bytes):
+    types, offset = [], 0
+    while offset < len(data):
+        size, = unpack_from('>I', data, offset)
+        types.append(data[offset + 4:offset + 8])
+        offset += size
+
+    assert offset == len(data)
+    return types
+
+
+class H264CapturerTest(TestCase):
+    def setUp(self):
+        self.encoder = SyntheticH264Encoder(48, 40, intra_period=4)
+        self.capturer = H264Capturer(camera=None, width=48, height=40, framerate=10, intra_period=4)
+
+    def feed(self, count: int):
+        for _ in range(count):
+            self.capturer.on_frame(self.encoder.next_frame())
+
+    def test_synthetic_key_frame_has_parameter_sets(self):
+        types = [nal_unit_type(nal) for nal in split_nal_units(self.encoder.next_frame())]
+        self.assertEqual([NAL_SPS, NAL_PPS, NAL_IDR_SLICE], types)
+
+    def test_new_viewer_starts_at_latest_key_frame(self):
+        self.feed(6)
+
+        codec, init_segment, fragments = self.capturer.start_fragments()
+
+        self.assertEqual('avc1.42c01e', codec)
+        self.assertEqual([b'ftyp', b'moov'], box_types(init_segment))
+        self.assertEqual([5, 6], [seq for seq, _, _ in fragments])
+        self.assertTrue(fragments[0][1])
+        self.assertEqual([b'moof', b'mdat'], box_types(fragments[0][2]))
+
+    def test_viewer_that_falls_behind_skips_to_key_frame(self):
+        self.feed(3)
+        self.assertEqual([2, 3], [seq for seq, _, _ in self.capturer.fragments_after(1)])
+
+        self.feed(6)
+        self.assertEqual([9], [seq for seq, _, _ in self.capturer.fragments_after(1)])
+
+
+class H264OutputTest(TestCase):
+    def test_frames_are_whole_with_two_recordings(self):
+        camera = SyntheticCamera(resolution=(48, 40), framerate=100)
+        capturers = [
+            H264Capturer(camera, width=48, height=40, framerate=100, splitter_port=port, intra_period=4)
+            for port in (0, 1)
+        ]
+
+        frames = {0: [], 1: []}
+        for port, capturer in enumerate(capturers):
+            capturer.on_frame = frames[port].append
+            camera.start_recording(_H264Output(capturer), splitter_port=port, intra_period=4)
+
+        time.sleep(0.5)
+        for port in (0, 1):
+            camera.stop_recording(splitter_port=port)
+
+        for port in (0, 1):
+            encoder = SyntheticH264Encoder(48, 40, intra_period=4)
+            self.assertGreater(len(frames[port]), 10)
+            self.assertEqual([encoder.next_frame() for _ in frames[port]], frames[port])
+
+
+if __name__ == '__main__':
+    unittest.main()
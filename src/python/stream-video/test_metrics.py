@@ -0,0 +1,72 @@
+import unittest
+from unittest import TestCase
+
+from camera import CameraCapturer
+from metrics import Histogram
+
+
+class HistogramTest(TestCase):
+    def setUp(self):
+        self.histogram = Histogram([1., 2., 4.])
+
+    def test_observations_are_counted_in_their_bucket(self):
+        for value in (0.5, 1., 1.5, 3., 10.):
+            self.histogram.observe(value)
+
+        self.assertEqual([2, 1, 1, 1], self.histogram.counts)
+        self.assertEqual(5, self.histogram.count)
+        self.assertEqual(10., self.histogram.max)
+
+    def test_quantile_is_bucket_upper_bound(self):
+        for value in (0.5, 0.5, 1.5, 3.):
+            self.histogram.observe(value)
+
+        self.assertEqual(1., self.histogram.quantile(0.5))
+        self.assertEqual(3., self.histogram.quantile(0.99))
+        self.assertIsNone(Histogram([1.]).quantile(0.5))
+
+    def test_merge(self):
+        other = Histogram([1., 2., 4.])
+        other.observe(5.)
+        self.histogram.observe(0.5)
+
+        self.histogram.merge(other)
+
+        self.assertEqual([1, 0, 0, 1], self.histogram.counts)
+        self.assertEqual(5., self.histogram.max)
+
+
+class CaptureMetricsTest(TestCase):
+    def setUp(self):
+        self.capturer = CameraCapturer(camera=None)
+
+    def publish(self, count: int = 1):
+        for _ in range(count):
+            self.capturer.frames.write(b'jpeg')
+            frame = self.capturer.frames.publish()
+            self.capturer.metrics.on_publish(frame.capture_timestamp, frame.timestamp, len(frame))
+
+    def test_client_metrics_are_kept_after_client_leaves(self):
+        with self.capturer.subscribe('viewer') as subscription:
+            self.publish()
+            subscription.next(timeout=0)
+            subscription.mark_sent()
+
+            self.publish(3)
+            subscription.next(timeout=0)
+
+            stats = self.capturer.metrics.stats()
+            self.assertEqual('viewer', stats['active_clients'][0]['client'])
+            self.assertEqual(1, stats['active_clients'][0]['dequeue_to_write']['count'])
+
+        stats = self.capturer.metrics.stats()
+        self.assertEqual([], stats['active_clients'])
+        self.assertEqual(4, stats['frames'])
+        self.assertEqual(16, stats['bytes'])
+        self.assertEqual(2, stats['clients']['delivered'])
+        self.assertEqual(2, stats['clients']['skipped'])
+        self.assertEqual(2, stats['clients']['publish_to_dequeue']['count'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from motion import MotionDetector, yuv_frame_size
+
+
+class MotionDetectorTest(TestCase):
+    def setUp(self):
+        self.detector = MotionDetector(64, 48, grid=(2, 2), region_thresholds=0.05, cooldown=10., warmup_frames=3)
+        self.background = np.full((48, 64), 100, dtype=np.uint8)
+        self.time = 0.
+
+    def process(self, frame: np.ndarray):
+        self.time += 0.1
+        return self.detector.process(frame, self.time)
+
+    def warm_up(self):
+        for _ in range(self.detector.warmup_frames):
+            self.assertIsNone(self.process(self.background))
+
+    def with_object(self, row: int, col: int) -> np.ndarray:
+        frame = self.background.copy()
+        frame[row:row + 10, col:col + 10] = 200
+        return frame
+
+    def test_static_scene_has_no_motion(self):
+        self.warm_up()
+
+        for _ in range(20):
+            self.assertIsNone(self.process(self.background))
+
+    def test_object_is_detected_in_its_region(self):
+        self.warm_up()
+
+        event = self.process(self.with_object(30, 40))
+
+        self.assertEqual([(1, 1)], event.regions)
+        self.assertAlmostEqual(100 / (24 * 32), event.fractions[1, 1])
+
+    def test_no_motion_during_warm_up(self):
+        self.process(self.background)
+        self.assertIsNone(self.process(self.with_object(30, 40)))
+
+    def test_detections_are_suppressed_during_cooldown(self):
+        self.warm_up()
+        self.assertIsNotNone(self.process(self.with_object(0, 0)))
+
+        self.assertIsNone(self.process(self.with_object(30, 40)))
+
+        self.time += self.detector.cooldown
+        self.assertIsNotNone(self.process(self.with_object(30, 40)))
+
+    def test_region_with_high_threshold_is_ignored(self):
+        self.detector = MotionDetector(
+            64, 48, grid=(2, 2), region_thresholds=[[0.05, 0.05], [0.05, 2.]], warmup_frames=3)
+        self.warm_up()
+
+        self.assertIsNone(self.process(self.with_object(30, 40)))
+        self.assertEqual([(0, 0)], self.process(self.with_object(0, 0)).regions)
+
+    def test_yuv_frame_size_is_padded(self):
+        self.assertEqual((128, 96), yuv_frame_size(128, 96))
+        self.assertEqual((160, 128), yuv_frame_size(150, 120))
+
+
+if __name__ == '__main__':
+    unittest.main()
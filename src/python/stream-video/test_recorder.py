@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from recorder import EventRecorder, SegmentWriter
+
+
+class EventRecorderTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.writer = SegmentWriter(self.directory.name, max_total_bytes=10 ** 6, flush_interval=0.01)
+        self.writer.start()
+        self.recorder = EventRecorder(
+            capturer=None,
+            writer=self.writer,
+            pre_event_seconds=1.,
+            post_event_seconds=1.,
+            max_segment_seconds=1.5,
+        )
+        self.time = 0.
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def feed(self, count: int, data: bytes = b'f') -> None:
+        for _ in range(count):
+            self.recorder.on_frame(data, self.time)
+            self.time += 0.25
+
+    def segments(self):
+        self.writer.stop()
+        return [
+            open(os.path.join(self.directory.name, name), 'rb').read()
+            for name in sorted(os.listdir(self.directory.name))
+        ]
+
+    def test_segment_has_frames_before_and_after_trigger(self):
+        self.feed(10, b'a')
+
+        self.recorder.trigger('test')
+        self.feed(5, b'b')
+        self.assertFalse(self.recorder.is_recording)
+        self.feed(2, b'c')
+
+        # 1 s before the trigger (5 frames, inclusive), and 1 s after it
+        self.assertEqual([b'aaaaabbbbb'], self.segments())
+
+    def test_triggers_extend_recording_up_to_max_segment_length(self):
+        self.feed(1, b'a')
+        self.recorder.trigger()
+        self.feed(3, b'b')
+        self.recorder.trigger()
+        self.feed(10, b'c')
+
+        self.assertEqual([b'abbbcccc'], self.segments())
+        self.assertEqual(1, self.recorder.segments)
+
+
+class RetentionTest(TestCase):
+    def test_oldest_segments_are_deleted_over_limit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for i in range(4):
+                path = os.path.join(directory, f'event-{i}.mjpeg')
+                with open(path, 'wb') as file:
+                    file.write(bytes(100))
+                os.utime(path, (i, i))
+
+            SegmentWriter(directory, max_total_bytes=250).apply_retention()
+
+            self.assertEqual(['event-2.mjpeg', 'event-3.mjpeg'], sorted(os.listdir(directory)))
+
+
+if __name__ == '__main__':
+    unittest.main()
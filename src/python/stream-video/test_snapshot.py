@@ -0,0 +1,42 @@
+import unittest
+from unittest import TestCase
+
+import snapshot
+from frames import FrameRing
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.ring = FrameRing()
+
+    def publish(self):
+        self.ring.write(b'jpeg')
+        return self.ring.publish()
+
+    def test_etag_matches_only_its_frame(self):
+        first = self.publish()
+        second = self.publish()
+
+        self.assertTrue(snapshot.is_not_modified(snapshot.etag(first), first))
+        self.assertTrue(snapshot.is_not_modified(f'"other", W/{snapshot.etag(first)}', first))
+        self.assertTrue(snapshot.is_not_modified('*', first))
+        self.assertFalse(snapshot.is_not_modified(snapshot.etag(first), second))
+        self.assertFalse(snapshot.is_not_modified(None, first))
+
+    def test_wait_newer_than_is_parsed(self):
+        self.assertIsNone(snapshot.parse_wait_newer_than(None))
+        self.assertEqual(5, snapshot.parse_wait_newer_than('5'))
+        self.assertRaises(ValueError, snapshot.parse_wait_newer_than, 'abc')
+        self.assertRaises(ValueError, snapshot.parse_wait_newer_than, '-1')
+
+    def test_start_seq(self):
+        self.assertEqual(3, snapshot.start_seq(0, 3, latest_seq=5))
+        self.assertEqual(4, snapshot.start_seq(4, 3, latest_seq=5))
+        self.assertEqual(0, snapshot.start_seq(0, None, latest_seq=5))
+
+        # From before a restart of the service
+        self.assertEqual(0, snapshot.start_seq(0, 9, latest_seq=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
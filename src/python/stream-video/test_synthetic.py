@@ -0,0 +1,46 @@
+import io
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from synthetic import JPEGEncoder, SyntheticCamera, capture_time, com_segment
+
+
+class JPEGEncoderTest(TestCase):
+    def test_encodes_baseline_jpeg(self):
+        rgb = np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8)
+        jpeg = JPEGEncoder(quality=75).encode(rgb)
+
+        self.assertEqual(b'\xff\xd8', jpeg[:2])
+        self.assertEqual(b'\xff\xd9', jpeg[-2:])
+
+        # SOF0 with the image's height and width
+        sof = jpeg.index(b'\xff\xc0')
+        self.assertEqual((30, 40), (int.from_bytes(jpeg[sof + 5:sof + 7], 'big'), int.from_bytes(jpeg[sof + 7:sof + 9], 'big')))
+
+        # Every 0xff in the entropy-coded data is stuffed
+        scan = jpeg[jpeg.index(b'\xff\xda'):-2]
+        scan = scan[2 + int.from_bytes(scan[2:4], 'big'):]
+        self.assertNotIn(b'\xff', scan.replace(b'\xff\x00', b''))
+
+
+class SyntheticCameraTest(TestCase):
+    def test_frames_carry_capture_time(self):
+        camera = SyntheticCamera((32, 16), framerate=1000, distinct_frames=2)
+        output = io.BytesIO()
+
+        frames = camera.capture_continuous(output)
+        next(frames)
+
+        jpeg = output.getvalue()
+        self.assertEqual(b'\xff\xd8', jpeg[:2])
+        self.assertIsNotNone(capture_time(jpeg))
+
+    def test_capture_time_ignores_other_comments(self):
+        self.assertIsNone(capture_time(b'\xff\xd8' + com_segment('hello') + b'\xff\xd9'))
+        self.assertEqual(12.5, capture_time(b'\xff\xd8' + com_segment('captured_at=12.5') + b'\xff\xd9'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,19 @@
 import os
+import socket
 import time
 
-from flask import Flask, render_template
+from flask import Flask, abort, jsonify, render_template, request
 from flask_simplelogin import SimpleLogin, login_required
 from flask_socketio import SocketIO
 from serial import SerialException
 
 from sentrybot.config.main import config
+from sentrybot.drivescheduler import DriveScheduler
 from sentrybot.motorcontrol import DriveMotorController, DriveMotorControllerStatus
+from sentrybot.serialtransport import PendingRequest, completed
+from sentrybot.telemetrylog import TelemetryLogWriter, TelemetryRecorder
 from sentrybot.users import login_checker
-from status import StatusEmitter
+from status import StatusEmitter, StatusSupplier
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = config.website.secret_key.value
@@ -27,35 +31,79 @@ socketio = SocketIO(
 if config.is_sentry:
     while True:
         try:
-            motor_controller = DriveMotorController.connect(config.motor_control.serial.path)
+            motor_controller = DriveMotorController.connect(
+                config.motor_control.serial.path,
+                telemetry_rate=config.motor_control.telemetry_rate,
+            )
             break
         except SerialException:
             time.sleep(1)
 else:
     class DummyMotorController:
-        def stop(self):
-            pass
+        @property
+        def status(self) -> DriveMotorControllerStatus:
+            return DriveMotorControllerStatus(
+                left_motor=...,
+                right_motor=...,
+                body=...,
+                battery_percent=100,
+                timestamp=time.monotonic(),
+            )
 
-        def set_linear_velocity(self, *args, **kwargs):
-            pass
+        def stop(self) -> PendingRequest:
+            return completed()
 
-        def set_angular_velocity(self, *args, **kwargs):
-            pass
+        def set_linear_velocity(self, *args, **kwargs) -> PendingRequest:
+            return completed()
 
-        def get_status(self) -> DriveMotorControllerStatus:
-            return DriveMotorControllerStatus(
+        def set_angular_velocity(self, *args, **kwargs) -> PendingRequest:
+            return completed()
+
+        def set_body_velocity(self, *args, **kwargs) -> PendingRequest:
+            return completed()
+
+        def send_heartbeat(self) -> PendingRequest:
+            return completed()
+
+        def get_status(self) -> PendingRequest:
+            return completed(DriveMotorControllerStatus(
                 left_motor=...,
                 right_motor=...,
                 body=...,
                 battery_percent=100,
-            )
+            ))
 
 
     try:
-        motor_controller = DriveMotorController.connect(config.motor_control.serial.path)
+        motor_controller = DriveMotorController.connect(
+            config.motor_control.serial.path,
+            telemetry_rate=config.motor_control.telemetry_rate,
+        )
     except SerialException:
         motor_controller = DummyMotorController()
 
+drive_scheduler = DriveScheduler(
+    motor_controller,
+    max_rate=config.motor_control.scheduler.max_rate,
+    deadman_timeout=config.motor_control.scheduler.deadman_timeout,
+    heartbeat_interval=config.motor_control.scheduler.heartbeat_interval,
+)
+drive_scheduler.start()
+
+if config.motor_control.telemetry_log.enabled and isinstance(motor_controller, DriveMotorController):
+    TelemetryRecorder(
+        motor_controller,
+        TelemetryLogWriter(
+            config.motor_control.telemetry_log.directory,
+            max_file_bytes=config.motor_control.telemetry_log.max_file_bytes,
+            max_total_bytes=config.motor_control.telemetry_log.max_total_bytes,
+        ),
+        rate=config.motor_control.telemetry_log.rate,
+    ).start()
+
+status_supplier = StatusSupplier(motor_controller)
+status_supplier.metrics.start()
+
 notifier = config.notifier
 
 
@@ -72,31 +120,80 @@ def index():
 def main_js():
     return render_template(
         'main.js',
+        # Drive commands are repeated while driving, well within the deadman timeout;
+        # not at all if there is no deadman
+        drive_repeat_period=(
+            config.motor_control.scheduler.deadman_timeout / 3
+            if config.motor_control.scheduler.deadman_timeout is not None else
+            None
+        ),
         video_stream_port=config.camera.stream.port,
+        video_streams=[*config.camera.streams, 'adaptive'],
+        default_video_stream=config.camera.default_stream,
+        h264_path=(
+            config.camera.h264.path
+            if config.camera.h264.enabled and config.camera.stream.backend == 'asyncio' else
+            None
+        ),
     )
 
 
+@app.route('/stats/drive')
+@login_required
+def drive_stats():
+    return jsonify(drive_scheduler.stats())
+
+
+@app.route('/stats/metrics')
+@login_required
+def metrics_stats():
+    return jsonify(status_supplier.metrics.stats())
+
+
+# e.g. /metrics/history/1h?names=battery_percent,throttled; tiers are 1m, 1h and 24h
+@app.route('/metrics/history/<tier>')
+@login_required
+def metrics_history(tier: str):
+    names = request.args.get('names')
+
+    try:
+        return jsonify(status_supplier.metrics.history(tier, names.split(',') if names else None))
+    except ValueError as e:
+        abort(404, str(e))
+
+
 @socketio.on('connect')
 def handle_connect(auth):
     print('Client connected')
-    motor_controller.stop()
+    drive_scheduler.stop()
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     print('Client disconnected')
-    motor_controller.stop()
+    drive_scheduler.stop()
 
 
+# Drive commands go through the scheduler, which sends only the newest to the
+# controller, so handlers never block on serial I/O.
 @socketio.on('motorController.drive')
 def handle_motor_controller_drive(linear: float, angular: float):
-    motor_controller.set_linear_velocity(linear)
-    motor_controller.set_angular_velocity(rad=angular)
+    drive_scheduler.drive(linear, angular)
 
 
 @socketio.on('motorController.stop')
 def handle_motor_controller_stop():
-    motor_controller.stop()
+    drive_scheduler.stop()
+
+
+@socketio.on('camera.record')
+def handle_camera_record():
+    print('Recording!')
+
+    # The recorder runs in the stream service; it listens for triggers on a local UDP socket
+    if config.camera.recorder.enabled:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b'website', config.camera.recorder.trigger_address)
 
 
 @socketio.on('shutdown')
@@ -132,7 +229,7 @@ def main():
 
     SimpleLogin(app, login_checker=login_checker)
 
-    StatusEmitter.build(socketio, motor_controller)
+    StatusEmitter.build(socketio, status_supplier)
 
     try:
         socketio.run(
@@ -1,14 +1,15 @@
-import re
-import subprocess
+import time
 from dataclasses import dataclass
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional
 
 import psutil
 from flask_socketio import SocketIO
 
 from sentrybot.config.main import config
+from sentrybot.metrics import Metric, MetricsCollector
 from sentrybot.motorcontrol import DriveMotorController
-from sentrybot.vcgencmd import get_throttled, ThrottlingResult
+from sentrybot.probes import ThrottlingProbe, WifiProbe
+from sentrybot.vcgencmd import IS_THROTTLED, IS_UNDER_VOLTAGE, ThrottlingResult
 
 
 class StatusEmitter:
@@ -23,8 +24,7 @@ class StatusEmitter:
         self.emit_period = emit_period
 
     @staticmethod
-    def build(socketio: SocketIO, motor_controller: DriveMotorController) -> 'StatusEmitter':
-        supplier = StatusSupplier(motor_controller)
+    def build(socketio: SocketIO, supplier: 'StatusSupplier') -> 'StatusEmitter':
         emitter = StatusEmitter(supplier, socketio)
         socketio.start_background_task(emitter.run)
         return emitter
@@ -48,31 +48,79 @@ class StatusEmitter:
 
 
 class StatusSupplier:
-    WIFI_BIT_RATE_PATTERN = re.compile(r'.*Bit Rate=(\d+)', flags=re.DOTALL)
+    """
+    Builds the status from the latest samples of :attr:`metrics`, which samples
+    each metric on its own period in the background (start it), so building the
+    status never waits on a probe.
+    """
+
+    MAX_MOTOR_CONTROLLER_STATUS_AGE = 5.
 
     def __init__(self, motor_controller: DriveMotorController):
         self.motor_controller = motor_controller
+        self.wifi_probe = WifiProbe(config.status_report.wifi.interface, ttl=config.status_report.wifi.ttl)
+        self.throttling_probe = ThrottlingProbe(ttl=config.status_report.throttling.ttl)
+        self.metrics = MetricsCollector(self.build_metrics())
 
-    def get_status(self) -> 'Status':
-        cpu_usage_avg, cpu_usage_max = self.get_cpu_usage()
+    def build_metrics(self) -> List[Metric]:
+        periods = config.status_report.metrics
 
-        try:
-            throttling = get_throttled()
-        except FileNotFoundError:
-            throttling = None
+        return [
+            Metric(['cpu_usage_avg', 'cpu_usage_max'], periods.cpu_period, self.get_cpu_usage),
+            Metric(['mem_usage'], periods.memory_period, lambda: [psutil.virtual_memory().percent]),
+            Metric(['wifi_bit_rate_Mbps', 'wifi_signal_dBm'], periods.wifi_period, self.get_wifi),
+            Metric(['throttled', 'under_voltage', 'throttling_flags'], periods.throttling_period, self.get_throttling),
+            Metric(['battery_percent'], periods.battery_period, lambda: [self.get_battery_percent()]),
+        ]
 
-        motor_controller_status = self.motor_controller.get_status()
+    def get_status(self) -> 'Status':
+        # Samples more than two periods old are stale (e.g. the probe has started failing)
+        periods = config.status_report.metrics
+        cpu_max_age = 2 * periods.cpu_period
+        wifi_max_age = 2 * periods.wifi_period
+        throttling = self.metrics.latest('throttling_flags', 2 * periods.throttling_period)
 
         return Status(
             loadavg=self.get_loadavg(),
-            cpu_usage_avg=cpu_usage_avg,
-            cpu_usage_max=cpu_usage_max,
-            mem_usage=psutil.virtual_memory().percent,
-            wifi_bit_rate_Mbps=self.get_wifi_bit_rate(),
-            throttling=throttling,
-            battery_percent=motor_controller_status.battery_percent,
+            cpu_usage_avg=self.metrics.latest('cpu_usage_avg', cpu_max_age),
+            cpu_usage_max=self.metrics.latest('cpu_usage_max', cpu_max_age),
+            mem_usage=self.metrics.latest('mem_usage', 2 * periods.memory_period),
+            wifi_bit_rate_Mbps=self.metrics.latest('wifi_bit_rate_Mbps', wifi_max_age),
+            wifi_signal_dBm=self.metrics.latest('wifi_signal_dBm', wifi_max_age),
+            throttling=ThrottlingResult.from_flags(int(throttling)) if throttling is not None else None,
+            # Pushed by the controller, so read directly: it is fresher than the metric
+            battery_percent=self.get_battery_percent(),
         )
 
+    def get_battery_percent(self) -> Optional[int]:
+        # Pushed by the controller; reading it does not touch the serial port
+        motor_controller_status = self.motor_controller.status
+        if motor_controller_status is None or (
+                time.monotonic() - motor_controller_status.timestamp > self.MAX_MOTOR_CONTROLLER_STATUS_AGE
+        ):
+            return None
+
+        return motor_controller_status.battery_percent
+
+    def get_wifi(self) -> Tuple[Optional[float], Optional[float]]:
+        wifi = self.wifi_probe.get()
+        if wifi is None:
+            return None, None
+
+        return wifi.bit_rate_Mbps, wifi.signal_dBm
+
+    def get_throttling(self) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        """
+        Whether the CPU is throttled and whether it is under-voltage now, as 0 or
+        1 (averaged, the fraction of time), and the raw flags for the status.
+        """
+
+        throttling = self.throttling_probe.get()
+        if throttling is None:
+            return None, None, None
+
+        return float(bool(throttling & IS_THROTTLED)), float(bool(throttling & IS_UNDER_VOLTAGE)), float(throttling)
+
     def get_loadavg(self) -> str:
         loadavg = psutil.getloadavg()
         loadavg = (f'{it:.3}' for it in loadavg)
@@ -88,42 +136,17 @@ class StatusSupplier:
 
         return avg_usage, max_usage
 
-    def get_wifi_bit_rate(self) -> Optional[float]:
-        iface = config.status_report.wifi.interface
-
-        result = subprocess.run(
-            ['iwconfig', iface],
-            capture_output=True,
-            text=True
-        )
-
-        if result.returncode != 0:
-            print(f'ERROR: Failed to get WiFi bit rate: returncode={result.returncode}')
-            print('--- stderr ---')
-            print(result.stderr)
-            print('------')
-            return None
-
-        match = self.WIFI_BIT_RATE_PATTERN.match(result.stdout)
-        if not match:
-            print('ERROR: Failed to find bit rate in output:')
-            print('--- stdout ---')
-            print(result.stdout)
-            print('------')
-            return None
-
-        return float(match.group(1))
-
 
 @dataclass
 class Status:
     loadavg: str
-    cpu_usage_avg: float
-    cpu_usage_max: float
-    mem_usage: float
+    cpu_usage_avg: Optional[float]
+    cpu_usage_max: Optional[float]
+    mem_usage: Optional[float]
     wifi_bit_rate_Mbps: Optional[float]
+    wifi_signal_dBm: Optional[float]
     throttling: Optional[ThrottlingResult]
-    battery_percent: int
+    battery_percent: Optional[int]
 
     def to_html(self) -> str:
         wifi_speed = (
@@ -131,15 +154,20 @@ class Status:
             if self.wifi_bit_rate_Mbps is not None else
             f'Unknown'
         )
+        if self.wifi_signal_dBm is not None:
+            wifi_speed += f' ({round(self.wifi_signal_dBm)} dBm)'
 
-        battery = f'{self.battery_percent}%'
-        if self.battery_percent < 10:
-            battery = f'<strong style="color: red;">{battery}</strong>'
+        if self.battery_percent is None:
+            battery = 'Unknown'
+        else:
+            battery = f'{self.battery_percent}%'
+            if self.battery_percent < 10:
+                battery = f'<strong style="color: red;">{battery}</strong>'
 
         result = rf'''
             <strong>loadavg:</strong> {self.loadavg}<br>
-            <strong>CPU (avg/max):</strong> {round(self.cpu_usage_avg)}/{round(self.cpu_usage_max)}%<br>
-            <strong>Memory:</strong> {round(self.mem_usage)}%<br>
+            <strong>CPU (avg/max):</strong> {_percent(self.cpu_usage_avg)}/{_percent(self.cpu_usage_max)}<br>
+            <strong>Memory:</strong> {_percent(self.mem_usage)}<br>
             <strong>WiFi Speed:</strong> {wifi_speed}<br>
             <strong>Battery:</strong> {battery}
         '''
@@ -156,3 +184,7 @@ class Status:
             result += '</strong>'
 
         return result.strip()
+
+
+def _percent(value: Optional[float]) -> str:
+    return f'{round(value)}%' if value is not None else 'Unknown'
@@ -3,10 +3,18 @@ class MotorController {
     this.socket = socket
 
     this.t_last_drive_command = new Date()
+
+    // While driving, the latest command is repeated; the server stops the robot
+    // if commands stop arriving
+    this.driving = null
+    {% if drive_repeat_period is not none %}
+    setInterval(() => this.repeatDrive(), {{ drive_repeat_period * 1000 }})
+    {% endif %}
   }
 
   drive(linear, angular, force=false) {
     const dt_last_drive_command = (new Date() - this.t_last_drive_command) / 1000
+    this.driving = [linear, angular]
 
     if (force || dt_last_drive_command > 0.1) {
       console.log('drive', linear, angular)
@@ -15,13 +23,92 @@ class MotorController {
     }
   }
 
+  repeatDrive() {
+    const dt_last_drive_command = (new Date() - this.t_last_drive_command) / 1000
+
+    if (this.driving !== null && dt_last_drive_command > {{ drive_repeat_period or 0 }} / 2) {
+      this.socket.emit('motorController.drive', ...this.driving)
+      this.t_last_drive_command = new Date()
+    }
+  }
+
   stop() {
     console.log('stop')
+    this.driving = null
     this.socket.emit('motorController.stop')
   }
 }
 
+class H264Player {
+  constructor(video, url) {
+    this.video = video
+    this.url = url
+    this.queue = []
+    this.sourceBuffer = null
+    this.socket = null
+  }
+
+  start() {
+    const mediaSource = new MediaSource()
+    this.video.src = URL.createObjectURL(mediaSource)
+
+    mediaSource.addEventListener('sourceopen', () => {
+      this.socket = new WebSocket(this.url)
+      this.socket.binaryType = 'arraybuffer'
+
+      this.socket.onmessage = event => {
+        if (typeof event.data === 'string') {
+          // The first message names the codec; the rest are init segment and fragments
+          const codec = JSON.parse(event.data).codec
+          this.sourceBuffer = mediaSource.addSourceBuffer(`video/mp4; codecs="${codec}"`)
+          this.sourceBuffer.mode = 'sequence'
+          this.sourceBuffer.onupdateend = () => this.appendNext()
+        } else {
+          this.queue.push(event.data)
+          this.appendNext()
+        }
+      }
+    })
+  }
+
+  appendNext() {
+    if (!this.sourceBuffer || this.sourceBuffer.updating) {
+      return
+    }
+
+    const buffered = this.sourceBuffer.buffered
+    if (buffered.length > 0) {
+      const end = buffered.end(buffered.length - 1)
+
+      // Stay at the live edge, and drop what has already been played
+      if (end - this.video.currentTime > 1) {
+        this.video.currentTime = end - 0.1
+      }
+
+      if (this.video.currentTime - buffered.start(0) > 30) {
+        this.sourceBuffer.remove(buffered.start(0), this.video.currentTime - 10)
+        return
+      }
+    }
+
+    if (this.queue.length > 0) {
+      this.sourceBuffer.appendBuffer(this.queue.shift())
+    }
+  }
+
+  stop() {
+    if (this.socket) {
+      this.socket.close()
+    }
+
+    this.video.removeAttribute('src')
+    this.video.load()
+  }
+}
+
 const videoCanvas = document.getElementById('video_canvas')
+const h264Path = {{ h264_path | tojson }}
+var h264Player = null
 const driveKeys = new Set(['W', 'A', 'S', 'D'])
 const pressedKeys = new Set()
 var motorController = null
@@ -38,8 +125,15 @@ function main() {
 }
 
 function setupButtons(socket) {
+  // Record button
+  var button = document.getElementById('record_button')
+  button.onclick = () => {
+    console.log('Record')
+    socket.emit('camera.record')
+  }
+
   // Shutdown button
-  var button = document.getElementById('shutdown_button')
+  button = document.getElementById('shutdown_button')
   button.onclick = () => {
     const shutdown = confirm('Shutdown Sentry?')
 
@@ -73,13 +167,63 @@ function setupButtons(socket) {
 }
 
 function setupVideoFeed() {
+  const streams = {{ video_streams | tojson }}
+  if (h264Path && 'MediaSource' in window) {
+    streams.push('h264')
+  }
+
+  const select = document.getElementById('video_stream_select')
+
+  for (const stream of streams) {
+    const option = document.createElement('option')
+    option.value = stream
+    option.text = stream
+    select.add(option)
+  }
+
+  var stream = localStorage.getItem('videoStream')
+  if (!streams.includes(stream)) {
+    stream = {{ default_video_stream | tojson }}
+  }
+  select.value = stream
+
+  select.onchange = () => {
+    localStorage.setItem('videoStream', select.value)
+    setVideoStream(select.value)
+  }
+
+  setVideoStream(stream)
+  setupVideoCanvas()
+}
+
+function setVideoStream(stream) {
   const videoFeed = document.getElementById('video_feed')
+  const h264VideoFeed = document.getElementById('video_feed_h264')
   const videoFeedUrl = new URL(window.location.href)
   videoFeedUrl.port = {{ video_stream_port }}
-  videoFeedUrl.pathname = '/'
-  videoFeed.src = videoFeedUrl.href
 
-  setupVideoCanvas()
+  if (h264Player) {
+    h264Player.stop()
+    h264Player = null
+  }
+
+  if (stream === 'h264') {
+    // Stop the MJPEG stream before starting the H.264 one
+    videoFeed.removeAttribute('src')
+    videoFeed.hidden = true
+    h264VideoFeed.hidden = false
+
+    videoFeedUrl.protocol = videoFeedUrl.protocol === 'https:' ? 'wss:' : 'ws:'
+    videoFeedUrl.pathname = h264Path
+    h264Player = new H264Player(h264VideoFeed, videoFeedUrl.href)
+    h264Player.start()
+  } else {
+    h264VideoFeed.hidden = true
+    videoFeed.hidden = false
+
+    videoFeedUrl.pathname = '/stream/' + stream
+    videoFeed.src = videoFeedUrl.href
+  }
 }
 
 function setupVideoCanvas() {
@@ -218,6 +362,31 @@ function setupStatusDisplay(socket) {
   socket.on('status', status => {
     statusDiv.innerHTML = status
   })
+
+  drawTrends()
+  setInterval(drawTrends, 30000)
+}
+
+// Battery (green, 0-100%) and the fraction of time throttled (red) over the last hour
+async function drawTrends() {
+  const response = await fetch('/metrics/history/1h?names=battery_percent,throttled')
+  if (!response.ok) {
+    return
+  }
+
+  const history = await response.json()
+  const svg = document.getElementById('trends')
+  const end = Date.now() / 1000
+  const start = end - 3600
+
+  const points = (series, scale) => series.time
+    .map((t, i) => `${(t - start) / 3600 * 200},${40 - series.mean[i] * scale * 40}`)
+    .join(' ')
+
+  svg.innerHTML = `
+    <polyline fill="none" stroke="green" points="${points(history.series.battery_percent, 1 / 100)}"/>
+    <polyline fill="none" stroke="red" points="${points(history.series.throttled, 1)}"/>
+  `
 }
 
 main()